@@ -1,6 +1,6 @@
 import os
 import pathlib
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from contextlib import contextmanager
 
@@ -8,7 +8,7 @@ from src import config
 from server.models import Base
 from server.models.user_model import User
 from server.models.thread_model import Thread
-from server.models.kb_models import KnowledgeDatabase, KnowledgeFile, KnowledgeNode
+from server.models.kb_models import KnowledgeDatabase, KnowledgeFile, KnowledgeNode, IndexingJob
 from src.utils import logger
 
 class DBManager:
@@ -25,6 +25,7 @@ class DBManager:
         self.Session = sessionmaker(bind=self.engine)
 
         # 确保表存在
+        self.fts_enabled = False
         self.create_tables()
 
     def ensure_db_dir(self):
@@ -36,8 +37,40 @@ class DBManager:
         """创建数据库表"""
         # 确保所有表都会被创建
         Base.metadata.create_all(self.engine)
+        self.create_fts_index()
         logger.info("Database tables created/checked")
 
+    def create_fts_index(self):
+        """为 knowledge_nodes 创建 FTS5 全文索引（trigram 分词，支持中文子串匹配），并通过触发器保持同步"""
+        try:
+            with self.engine.begin() as conn:
+                exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type='table' AND name='knowledge_nodes_fts'")).first()
+                conn.execute(text(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS knowledge_nodes_fts "
+                    "USING fts5(text, content='knowledge_nodes', content_rowid='id', tokenize='trigram')"
+                ))
+                conn.execute(text(
+                    "CREATE TRIGGER IF NOT EXISTS knowledge_nodes_fts_ai AFTER INSERT ON knowledge_nodes BEGIN "
+                    "INSERT INTO knowledge_nodes_fts(rowid, text) VALUES (new.id, new.text); END"
+                ))
+                conn.execute(text(
+                    "CREATE TRIGGER IF NOT EXISTS knowledge_nodes_fts_ad AFTER DELETE ON knowledge_nodes BEGIN "
+                    "INSERT INTO knowledge_nodes_fts(knowledge_nodes_fts, rowid, text) VALUES ('delete', old.id, old.text); END"
+                ))
+                conn.execute(text(
+                    "CREATE TRIGGER IF NOT EXISTS knowledge_nodes_fts_au AFTER UPDATE OF text ON knowledge_nodes BEGIN "
+                    "INSERT INTO knowledge_nodes_fts(knowledge_nodes_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+                    "INSERT INTO knowledge_nodes_fts(rowid, text) VALUES (new.id, new.text); END"
+                ))
+                if not exists:
+                    # 首次创建时为已有的知识块构建索引
+                    conn.execute(text("INSERT INTO knowledge_nodes_fts(knowledge_nodes_fts) VALUES ('rebuild')"))
+                    logger.info("FTS5 index for knowledge_nodes created")
+            self.fts_enabled = True
+        except Exception as e:
+            logger.warning(f"创建 FTS5 全文索引失败，关键词检索将不可用（需要 SQLite >= 3.34）: {e}")
+            self.fts_enabled = False
+
     def get_session(self):
         """获取数据库会话"""
         return self.Session()
@@ -13,6 +13,21 @@ from src.utils.logging_config import logger
 app = FastAPI()
 app.include_router(router, prefix="/api")
 
+
+@app.on_event("startup")
+async def resume_indexing_jobs():
+    """服务启动后恢复未完成的索引任务"""
+    from src import knowledge_base
+    await knowledge_base.resume_indexing_jobs()
+
+
+@app.on_event("shutdown")
+async def release_resources():
+    """服务关闭时释放重排序模型持有的线程池与 HTTP 连接，以及检索线程池"""
+    from src import knowledge_base, retriever
+    knowledge_base.shutdown()
+    retriever.shutdown()
+
 # CORS 设置
 app.add_middleware(
     CORSMiddleware,
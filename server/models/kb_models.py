@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey, Text
+from sqlalchemy import Column, Integer, Float, String, DateTime, JSON, ForeignKey, Text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import time
@@ -103,3 +103,38 @@ class KnowledgeNode(Base):
             "end_char_idx": self.end_char_idx,
             "metadata": self.meta_info or {}  # 确保映射正确
         }
+
+class IndexingJob(Base):
+    """文件索引任务，持久化保存以便服务重启后继续处理"""
+    __tablename__ = 'indexing_jobs'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    file_id = Column(String, nullable=False, unique=True, index=True)  # 文件ID，每个文件最多一个任务
+    database_id = Column(String, nullable=False, index=True)  # 所属数据库ID
+    status = Column(String, nullable=False, default="queued")  # queued / running / done / failed / cancelled
+    attempts = Column(Integer, nullable=False, default=0)  # 已尝试次数
+    next_run_at = Column(Float, nullable=False, default=0.0)  # 下次可执行的时间（失败重试的退避）
+    lease_owner = Column(String, nullable=True)  # 持有租约的工作协程
+    lease_expires_at = Column(Float, nullable=True)  # 租约过期时间，过期后任务可被重新领取
+    checkpoint_node_id = Column(Integer, nullable=False, default=0)  # 已完成向量化并写入向量库的最大节点ID
+    indexed_count = Column(Integer, nullable=False, default=0)  # 已写入向量库的节点数
+    last_error = Column(Text, nullable=True)  # 最近一次失败的错误信息
+    created_at = Column(DateTime, default=func.now())  # 创建时间
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())  # 更新时间
+
+    def to_dict(self):
+        """转换为字典格式"""
+        return {
+            "file_id": self.file_id,
+            "db_id": self.database_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "next_run_at": self.next_run_at,
+            "lease_owner": self.lease_owner,
+            "lease_expires_at": self.lease_expires_at,
+            "checkpoint_node_id": self.checkpoint_node_id,
+            "indexed_count": self.indexed_count,
+            "last_error": self.last_error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
@@ -5,6 +5,7 @@ from fastapi import Request, Body, Depends, HTTPException
 from fastapi import APIRouter
 
 from src import config, retriever, knowledge_base, graph_base
+from src.models import clear_model_cache
 from server.utils.auth_middleware import get_admin_user, get_superadmin_user
 from server.models.user_model import User
 from src.utils.logging_config import logger
@@ -79,6 +80,7 @@ async def update_config(
 ) -> dict:
     config[key] = value
     config.save()
+    clear_model_cache()
     return config.dump_config()
 
 @base.post("/config/update")
@@ -88,10 +90,12 @@ async def update_config_item(
 ) -> dict:
     config.update(items)
     config.save()
+    clear_model_cache()
     return config.dump_config()
 
 @base.post("/restart")
 async def restart(current_user: User = Depends(get_superadmin_user)):
+    clear_model_cache()
     knowledge_base.restart()
     graph_base.start()
     retriever.restart()
@@ -10,7 +10,7 @@ from langchain_core.messages import AIMessageChunk, HumanMessage
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
-from src import executor, config, retriever
+from src import config, retriever
 from src.core import HistoryManager
 from src.agents import agent_manager
 from src.models import select_model
@@ -18,6 +18,7 @@ from src.utils.logging_config import logger
 from src.agents.tools_factory import get_all_tools
 from server.routers.auth_router import get_admin_user
 from server.utils.auth_middleware import get_required_user, get_db
+from server.utils.streaming import CompactStream, DEFAULT_BATCH_WINDOW, batched, get_stream_protocol
 from server.models.user_model import User
 from server.models.thread_model import Thread
 
@@ -81,7 +82,16 @@ async def chat_post(
     history_manager = HistoryManager(history, system_prompt=meta.get("system_prompt"))
     logger.debug(f"Received query: {query} with meta: {meta}")
 
+    try:
+        protocol = get_stream_protocol(meta)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    compact = CompactStream(protocol, meta) if protocol != "json" else None
+    batch_window = meta.get("stream_batch_ms", DEFAULT_BATCH_WINDOW * 1000) / 1000 if compact else 0
+
     def make_chunk(content=None, **kwargs):
+        if compact:
+            return compact.frame(response=content, **kwargs)
         return json.dumps({
             "response": content,
             "meta": meta,
@@ -89,9 +99,9 @@ async def chat_post(
         }, ensure_ascii=False).encode('utf-8') + b"\n"
 
     def need_retrieve(meta):
-        return meta.get("use_web") or meta.get("use_graph") or meta.get("db_id")
+        return meta.get("use_web") or meta.get("use_graph") or meta.get("db_id") or meta.get("db_ids")
 
-    def generate_response():
+    async def generate_response():
         modified_query = query
         refs = None
 
@@ -101,7 +111,7 @@ async def chat_post(
             yield chunk
 
             try:
-                modified_query, refs = retriever(modified_query, history_manager.messages, meta)
+                modified_query, refs = await retriever.acall(modified_query, history_manager.messages, meta)
             except Exception as e:
                 logger.error(f"Retriever error: {e}, {traceback.format_exc()}")
                 yield make_chunk(message=f"Retriever error: {e}", status="error")
@@ -115,44 +125,48 @@ async def chat_post(
         content = ""
         reasoning_content = ""
         try:
-            for delta in model.predict(messages, stream=True):
-                if not delta.content and hasattr(delta, 'reasoning_content'):
-                    reasoning_content += delta.reasoning_content or ""
-                    chunk = make_chunk(reasoning_content=reasoning_content, status="reasoning")
-                    yield chunk
-                    continue
-
-                # 文心一言
-                if hasattr(delta, 'is_full') and delta.is_full:
-                    content = delta.content
-                else:
-                    content += delta.content or ""
-
-                chunk = make_chunk(content=delta.content, status="loading")
-                yield chunk
+            # 紧凑协议下，时间窗口内到达的 token 合并为一个 chunk，且只发送增量
+            async for deltas in batched(await model.apredict(messages, stream=True), batch_window):
+                reasoning_delta, content_delta = None, None
+                for delta in deltas:
+                    if not delta.content and hasattr(delta, 'reasoning_content'):
+                        reasoning_delta = (reasoning_delta or "") + (delta.reasoning_content or "")
+                        continue
+
+                    # 文心一言
+                    if hasattr(delta, 'is_full') and delta.is_full:
+                        content = delta.content
+                    else:
+                        content += delta.content or ""
+                    content_delta = delta.content if content_delta is None else content_delta + (delta.content or "")
+
+                if reasoning_delta is not None:
+                    reasoning_content += reasoning_delta
+                    yield make_chunk(reasoning_content=reasoning_delta if compact else reasoning_content, status="reasoning")
+
+                if content_delta is not None:
+                    yield make_chunk(content=content_delta, status="loading")
 
             logger.debug(f"Final response: {content}")
             logger.debug(f"Final reasoning response: {reasoning_content}")
+            history = history_manager.update_ai(content)
+            # 紧凑协议下客户端自行拼接历史记录，不再回传完整的 history，refs 中也去掉 history 与 meta
             yield make_chunk(status="finished",
-                            history=history_manager.update_ai(content),
-                            refs=refs)
+                            history=None if compact else history,
+                            refs=compact.refs(refs) if compact else refs)
         except Exception as e:
             logger.error(f"Model error: {e}, {traceback.format_exc()}")
             yield make_chunk(message=f"Model error: {e}", status="error")
             return
 
-    return StreamingResponse(generate_response(), media_type='application/json')
+    return StreamingResponse(generate_response(), media_type=compact.media_type if compact else 'application/json')
 
 @chat.post("/call")
 async def call(query: str = Body(...), meta: dict = Body(None), current_user: User = Depends(get_required_user)):
     """调用模型进行简单问答（需要登录）"""
     meta = meta or {}
     model = select_model(model_provider=meta.get("model_provider"), model_name=meta.get("model_name"))
-    async def predict_async(query):
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(executor, model.predict, query)
-
-    response = await predict_async(query)
+    response = await model.apredict(query)
     logger.debug({"query": query, "response": response.content})
 
     return {"response": response.content}
@@ -180,8 +194,17 @@ async def chat_agent(agent_name: str,
         "user_id": current_user.id
     })
 
+    try:
+        protocol = get_stream_protocol(meta)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    compact = CompactStream(protocol, meta) if protocol != "json" else None
+    batch_window = meta.get("stream_batch_ms", DEFAULT_BATCH_WINDOW * 1000) / 1000 if compact else 0
+
     # 将meta和thread_id整合到config中
     def make_chunk(content=None, **kwargs):
+        if compact:
+            return compact.frame(request_id=meta.get("request_id"), response=content, **kwargs)
 
         return json.dumps({
             "request_id": meta.get("request_id"),
@@ -189,10 +212,31 @@ async def chat_agent(agent_name: str,
             **kwargs
         }, ensure_ascii=False).encode('utf-8') + b"\n"
 
+    def compact_agent_chunks(items):
+        """紧凑协议：同一条消息的纯文本 token 合并后只发送增量与消息 id，其余消息（工具调用等）发送完整内容"""
+        text_id, text = None, None
+        for msg, metadata in items:
+            is_text = isinstance(msg, AIMessageChunk) and not msg.tool_call_chunks and isinstance(msg.content, str)
+            if text is not None and (not is_text or msg.id != text_id):
+                yield make_chunk(content=text, id=text_id, status="loading")
+                text_id, text = None, None
+
+            if is_text:
+                text_id, text = msg.id, (text or "") + msg.content
+            else:
+                yield make_chunk(content=msg.content if isinstance(msg, AIMessageChunk) else None,
+                                msg=msg.model_dump(),
+                                node=metadata.get("langgraph_node"),
+                                status="loading")
+
+        if text is not None:
+            yield make_chunk(content=text, id=text_id, status="loading")
+
     async def stream_messages():
 
         # 代表服务端已经收到了请求
-        yield make_chunk(status="init", meta=meta, msg=HumanMessage(content=query).model_dump())
+        # 紧凑协议下 meta 由 CompactStream 随第一个 chunk 发送，与 /chat/ 保持一致
+        yield make_chunk(status="init", meta=None if compact else meta, msg=HumanMessage(content=query).model_dump())
 
         try:
             agent = agent_manager.get_agent(agent_name)
@@ -212,24 +256,30 @@ async def chat_agent(agent_name: str,
         runnable_config = {"configurable": {**config}}
 
         try:
-            async for msg, metadata in agent.stream_messages(messages, config_schema=runnable_config):
-                # logger.debug(f"msg: {msg.model_dump()}, metadata: {metadata}")
-                if isinstance(msg, AIMessageChunk):
-                    yield make_chunk(content=msg.content,
-                                    msg=msg.model_dump(),
-                                    metadata=metadata,
-                                    status="loading")
-                else:
-                    yield make_chunk(msg=msg.model_dump(),
-                                    metadata=metadata,
-                                    status="loading")
-
-            yield make_chunk(status="finished", meta=meta)
+            async for items in batched(agent.stream_messages(messages, config_schema=runnable_config), batch_window):
+                if compact:
+                    for chunk in compact_agent_chunks(items):
+                        yield chunk
+                    continue
+
+                for msg, metadata in items:
+                    # logger.debug(f"msg: {msg.model_dump()}, metadata: {metadata}")
+                    if isinstance(msg, AIMessageChunk):
+                        yield make_chunk(content=msg.content,
+                                        msg=msg.model_dump(),
+                                        metadata=metadata,
+                                        status="loading")
+                    else:
+                        yield make_chunk(msg=msg.model_dump(),
+                                        metadata=metadata,
+                                        status="loading")
+
+            yield make_chunk(status="finished", meta=None if compact else meta)
         except Exception as e:
             logger.error(f"Error streaming messages: {e}, {traceback.format_exc()}")
             yield make_chunk(message=f"Error streaming messages: {e}", status="error")
 
-    return StreamingResponse(stream_messages(), media_type='application/json')
+    return StreamingResponse(stream_messages(), media_type=compact.media_type if compact else 'application/json')
 
 @chat.get("/models")
 async def get_chat_models(model_provider: str, current_user: User = Depends(get_admin_user)):
@@ -48,9 +48,31 @@ async def delete_database(db_id, current_user: User = Depends(get_admin_user)):
 @data.post("/query-test")
 async def query_test(query: str = Body(...), meta: dict = Body(...), current_user: User = Depends(get_admin_user)):
     logger.debug(f"Query test in {meta}: {query}")
-    result = retriever.query_knowledgebase(query, history=None, refs={"meta": meta})
+    result = await retriever.aquery_knowledgebase(query, history=None, refs={"meta": meta})
     return result
 
+@data.get("/cache/stats")
+async def get_cache_stats(current_user: User = Depends(get_admin_user)):
+    return {**knowledge_base.get_cache_stats(), "speculation": retriever.get_speculation_stats(),
+            "retrieval": retriever.get_retrieval_stats()}
+
+@data.post("/cache/clear")
+async def clear_cache(current_user: User = Depends(get_admin_user)):
+    knowledge_base.clear_caches()
+    return {"message": "缓存已清空", "status": "success"}
+
+@data.delete("/cache/parse")
+async def purge_parse_cache(current_user: User = Depends(get_admin_user)):
+    """清空文档解析缓存"""
+    result = await asyncio.to_thread(knowledge_base.purge_parse_cache)
+    return {"message": f"已删除 {result['items']} 个解析缓存", "details": result, "status": "success"}
+
+@data.delete("/cache/embedding")
+async def purge_embedding_cache(current_user: User = Depends(get_admin_user)):
+    """清空文本块向量缓存"""
+    result = await asyncio.to_thread(knowledge_base.purge_embedding_cache)
+    return {"message": f"已删除 {result['items']} 个向量缓存", "details": result, "status": "success"}
+
 @data.post("/file-to-chunk")
 async def file_to_chunk(db_id: str = Body(...), files: list[str] = Body(...), params: dict = Body(...), current_user: User = Depends(get_admin_user)):
     logger.debug(f"File to chunk for db_id {db_id}: {files} {params=}")
@@ -91,6 +113,17 @@ async def index_file(db_id: str = Body(...), file_id: str = Body(...), current_u
         logger.error(f"Failed to index file {file_id}: {e}, {traceback.format_exc()}")
         return {"message": f"Failed to index file {file_id}: {e}", "status": "failed"}
 
+@data.post("/update-file")
+async def update_file(db_id: str = Body(...), file_id: str = Body(...), file_path: str = Body(...), params: dict = Body({}), current_user: User = Depends(get_admin_user)):
+    """使用新上传的文件（/upload 返回的 file_path）增量更新已有文件，只对变化的块重新向量化"""
+    logger.debug(f"Update file_id {file_id} in db_id {db_id} with {file_path} {params=}")
+    try:
+        result = await knowledge_base.update_file(db_id, file_id, file_path, params)
+        return {"message": f"File {file_id} updated", "details": result, "status": "success"}
+    except Exception as e:
+        logger.error(f"Failed to update file {file_id}: {e}, {traceback.format_exc()}")
+        return {"message": f"Failed to update file {file_id}: {e}", "status": "failed"}
+
 @data.get("/info")
 async def get_database_info(db_id: str, current_user: User = Depends(get_admin_user)):
     # logger.debug(f"Get database {db_id} info")
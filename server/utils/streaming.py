@@ -0,0 +1,116 @@
+"""
+流式响应的输出协议
+
+- json（默认）: 原有格式，每个 chunk 都是完整的 JSON 对象，包含 meta 等全部字段
+- ndjson-delta: 每行一个 JSON 对象，meta 只在第一个 chunk 中发送，token 只发送增量，
+  短时间窗口内到达的 token 会合并为一个 chunk
+- sse: 与 ndjson-delta 内容相同，按 Server-Sent Events 格式输出
+
+客户端通过 meta.stream_protocol 选择协议。
+"""
+
+import json
+import asyncio
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+STREAM_PROTOCOLS = ("json", "ndjson-delta", "sse")
+DEFAULT_BATCH_WINDOW = 0.02  # token 合并的时间窗口（秒）
+
+_END = object()
+
+
+def dumps(obj) -> bytes:
+    """序列化为 UTF-8 编码的 JSON，安装了 orjson 时优先使用 orjson"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+
+
+def get_stream_protocol(meta):
+    protocol = (meta or {}).get("stream_protocol") or "json"
+    if protocol not in STREAM_PROTOCOLS:
+        raise ValueError(f"Unsupported stream protocol: {protocol}, only support {STREAM_PROTOCOLS}")
+    return protocol
+
+
+class CompactStream:
+    """ndjson-delta / sse 协议的编码器，meta 只随第一个 chunk 发送一次，值为 None 的字段不发送"""
+
+    def __init__(self, protocol, meta=None):
+        self.protocol = protocol
+        self.meta = meta
+        self._meta_sent = meta is None
+
+    @property
+    def media_type(self):
+        return "text/event-stream" if self.protocol == "sse" else "application/x-ndjson"
+
+    def frame(self, **kwargs) -> bytes:
+        payload = {k: v for k, v in kwargs.items() if v is not None}
+        if not self._meta_sent:
+            payload["meta"] = self.meta
+            self._meta_sent = True
+
+        if self.protocol == "sse":
+            return b"data: " + dumps(payload) + b"\n\n"
+        return dumps(payload) + b"\n"
+
+    @staticmethod
+    def refs(refs):
+        """检索结果中的 history 与 meta 客户端已经持有，紧凑协议下不再回传"""
+        if not refs:
+            return refs
+        return {k: v for k, v in refs.items() if k not in ("history", "meta")}
+
+
+async def batched(source, window=DEFAULT_BATCH_WINDOW):
+    """把异步迭代器中在 window 秒内连续到达的元素合并为一个列表输出
+
+    源迭代器在单独的任务中完整地迭代，第一个元素到达后最多等待 window 秒即输出，
+    因此不会因为后续 token 迟迟未到而延迟已经到达的内容。window 为 0 时逐个输出。
+    """
+    if not window:
+        async for item in source:
+            yield [item]
+        return
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for item in source:
+                await queue.put((item, None))
+            await queue.put((_END, None))
+        except Exception as e:
+            await queue.put((_END, e))
+
+    pump_task = asyncio.create_task(pump())
+    buffer, deadline = [], None
+    try:
+        while True:
+            timeout = max(0, deadline - loop.time()) if buffer else None
+            try:
+                item, error = await asyncio.wait_for(queue.get(), timeout)
+            except TimeoutError:
+                yield buffer
+                buffer = []
+                continue
+
+            if item is _END:
+                if buffer:
+                    yield buffer
+                if error is not None:
+                    raise error
+                return
+
+            if not buffer:
+                deadline = loop.time() + window
+            buffer.append(item)
+    finally:
+        pump_task.cancel()
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import os
+import copy
 import yaml
 import uuid
 from pathlib import Path
@@ -15,6 +16,10 @@ from langgraph.graph.message import add_messages
 
 from src.utils import logger
 
+# 智能体文件配置缓存：agent_name -> (文件修改时间, 配置)，文件修改后自动重新读取
+_file_config_cache: dict[str, tuple[float, dict]] = {}
+
+
 class State(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
 
@@ -75,19 +80,29 @@ class Configuration(dict):
         return cls(**merged_config)
 
     @classmethod
-    def from_file(cls, agent_name: str) -> Configuration:
+    def from_file(cls, agent_name: str) -> dict:
         """从文件加载配置"""
         config_file_path = Path(f"src/agents/{agent_name}/config.private.yaml")
+        try:
+            mtime = os.path.getmtime(config_file_path)
+        except OSError:
+            _file_config_cache.pop(agent_name, None)
+            return {}
+
+        cached = _file_config_cache.get(agent_name)
+        if cached and cached[0] == mtime:
+            return copy.deepcopy(cached[1])
+
         file_config = {}
-        if os.path.exists(config_file_path):
-            try:
-                with open(config_file_path, encoding='utf-8') as f:
-                    file_config = yaml.safe_load(f) or {}
-                    # logger.info(f"从文件加载智能体 {agent_name} 配置: {file_config}")
-            except Exception as e:
-                logger.error(f"加载智能体配置文件出错: {e}")
+        try:
+            with open(config_file_path, encoding='utf-8') as f:
+                file_config = yaml.safe_load(f) or {}
+                # logger.info(f"从文件加载智能体 {agent_name} 配置: {file_config}")
+            _file_config_cache[agent_name] = (mtime, file_config)
+        except Exception as e:
+            logger.error(f"加载智能体配置文件出错: {e}")
 
-        return file_config
+        return copy.deepcopy(file_config)
 
     @classmethod
     def save_to_file(cls, config: dict, agent_name: str) -> bool:
@@ -106,6 +121,7 @@ class Configuration(dict):
             os.makedirs(os.path.dirname(config_file_path), exist_ok=True)
             with open(config_file_path, 'w', encoding='utf-8') as f:
                 yaml.dump(config, f, indent=2, allow_unicode=True)
+            _file_config_cache.pop(agent_name, None)
 
             # logger.info(f"智能体 {agent_name} 配置已保存到 {config_file_path}")
             return True
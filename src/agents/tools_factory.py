@@ -74,13 +74,27 @@ class KnowledgeRetrieverModel(BaseModel):
     )
 
 
+class FederatedRetrieverModel(KnowledgeRetrieverModel):
+    db_ids: list[str] = Field(
+        description="需要同时检索的知识库 ID 列表，即对应检索工具名称中 retrieve_ 之后的部分。"
+    )
+
+
+# 工具列表缓存，知识库列表发生变化（knowledge_base.databases_version 递增）时重新构建
+_all_tools_cache = {"version": None, "tools": None}
+
 
 def get_all_tools():
     """获取所有工具"""
+    if _all_tools_cache["version"] == knowledge_base.databases_version:
+        return _all_tools_cache["tools"].copy()
+
+    version = knowledge_base.databases_version
     tools = _TOOLS_REGISTRY.copy()
 
     # 获取所有知识库
-    for db_Id, retrieve_info in knowledge_base.get_retrievers().items():
+    retrievers = knowledge_base.get_retrievers()
+    for db_Id, retrieve_info in retrievers.items():
         name = f"retrieve_{db_Id}" # Deepseek does not support non-alphanumeric characters in tool names
         description = (
             f"使用 {retrieve_info['name']} 知识库进行检索。\n"
@@ -88,11 +102,27 @@ def get_all_tools():
         )
         tools[name] = StructuredTool.from_function(
             retrieve_info["retriever"],
+            coroutine=retrieve_info["retriever"].coroutine,
             name=name,
             description=description,
             args_schema=KnowledgeRetrieverModel)
 
-    return tools
+    # 存在多个知识库时，提供一个可以一次性检索多个知识库的工具
+    if len(retrievers) > 1:
+        kb_list = "\n".join(f"- {db_Id}: {info['name']}" for db_Id, info in retrievers.items())
+        federated_retriever = knowledge_base.get_federated_retriever()
+        tools["retrieve_federated"] = StructuredTool.from_function(
+            federated_retriever,
+            coroutine=federated_retriever.coroutine,
+            name="retrieve_federated",
+            description=(
+                "同时在多个知识库中检索，并返回合并排序后的结果。需要查询多个知识库时优先使用该工具。\n"
+                f"可用的知识库：\n{kb_list}"
+            ),
+            args_schema=FederatedRetrieverModel)
+
+    _all_tools_cache.update(version=version, tools=tools)
+    return tools.copy()
 
 class BaseToolOutput:
     """
@@ -50,6 +50,14 @@ class Config(SimpleConfig):
         self.add_item("enable_reranker", default=False, des="是否开启重排序")
         self.add_item("enable_knowledge_base", default=False, des="是否开启知识库")
         self.add_item("enable_knowledge_graph", default=False, des="是否开启知识图谱")
+        self.add_item("enable_query_cache", default=True, des="是否开启知识库检索结果缓存")
+        self.add_item("query_embedding_cache_size", default=64, des="查询向量缓存的最大占用空间（MB）（需重启生效）")
+        self.add_item("query_embedding_cache_ttl", default=3600, des="查询向量缓存的过期时间（秒）（需重启生效）")
+        self.add_item("rerank_score_cache_size", default=20000, des="重排序分数缓存的最大条目数，0 表示关闭缓存（需重启生效）")
+        self.add_item("rerank_score_cache_ttl", default=3600, des="重排序分数缓存的过期时间（秒）（需重启生效）")
+        self.add_item("kb_search_mode", default="vector", des="知识库检索模式（vector: 向量检索，hybrid: 向量与关键词混合检索）", choices=["vector", "hybrid"])
+        self.add_item("retrieval_max_workers", default=16, des="检索线程池的线程数，超时后仍在运行的检索会继续占用线程直到完成（需重启生效）")
+        self.add_item("retrieval_timeout", default=30, des="检索超时时间（秒），超时后只返回已完成的检索结果，0 表示不限制")
         self.add_item("enable_web_search", default=False, des="是否开启网页搜索（注：现阶段会根据 TAVILY_API_KEY 自动开启，无法手动配置，将会在下个版本移除此配置项）")  # noqa: E501
         # 默认智能体配置
         self.add_item("default_agent_id", default="", des="默认智能体ID")
@@ -62,7 +70,19 @@ class Config(SimpleConfig):
         self.add_item("embed_model", default="siliconflow/BAAI/bge-m3", des="Embedding 模型", choices=list(self.embed_model_names.keys()))
         self.add_item("reranker", default="siliconflow/BAAI/bge-reranker-v2-m3", des="Re-Ranker 模型", choices=list(self.reranker_names.keys()))  # noqa: E501
         self.add_item("model_local_paths", default={}, des="本地模型路径")
+        self.add_item("vector_store", default="milvus", des="向量数据库（milvus: Milvus 服务，local: 进程内本地向量库）", choices=["milvus", "local"])
+        self.add_item("indexing_concurrency", default=4, des="文件索引的全局并发数（需重启生效）")
+        self.add_item("indexing_concurrency_per_kb", default=2, des="单个知识库的文件索引并发数")
+        self.add_item("indexing_batch_size", default=256, des="文件索引时每批向量化的块数，每批完成后保存检查点")
+        self.add_item("indexing_pipeline_depth", default=2, des="文件索引流水线各阶段之间最多缓冲的批次数")
+        self.add_item("enable_embedding_cache", default=True, des="是否开启文本块向量的持久化缓存（相同内容只向量化一次）")
+        self.add_item("embedding_cache_max_items", default=1000000, des="文本块向量缓存的最大条目数，超出后淘汰最久未使用的条目（0 表示不限制）")
+        self.add_item("embedding_cache_max_age", default=0, des="文本块向量缓存条目未被使用的最长天数，超过后淘汰（0 表示不限制）")
+        self.add_item("enable_parse_cache", default=True, des="是否缓存文档解析结果（相同文件与解析参数只解析一次）")
+        self.add_item("parse_cache_max_size", default=2048, des="文档解析缓存的最大占用空间（MB），超出后淘汰最久未使用的条目")
+        self.add_item("indexing_small_files_first", default=False, des="索引队列中优先处理小文件")
         self.add_item("use_rewrite_query", default="on", des="重写查询", choices=["off", "on", "hyde"])
+        self.add_item("speculative_retrieval", default=False, des="推测检索（重写查询的同时使用原始查询检索知识库）")
         self.add_item("device", default="cuda", des="运行本地模型的设备", choices=["cpu", "cuda"])
         ### <<< 默认配置结束
 
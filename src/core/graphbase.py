@@ -419,7 +419,7 @@ class GraphDatabase:
             outputs = await knowledge_base.embed_model.abatch_encode(text, batch_size=40)
             return outputs
         else:
-            outputs = await knowledge_base.embed_model.aencode(text)
+            outputs = await knowledge_base.embed_model.aencode_query(text)
             return outputs
 
     def get_embedding(self, text):
@@ -429,7 +429,7 @@ class GraphDatabase:
             outputs = knowledge_base.embed_model.batch_encode(text, batch_size=40)
             return outputs
         else:
-            outputs = knowledge_base.embed_model.encode([text])[0]
+            outputs = knowledge_base.embed_model.encode_query(text)
             return outputs
 
     def set_embedding(self, tx, entity_name, embedding):
@@ -24,10 +24,10 @@ def chunk_with_parser(file_path, params=None):
         file_path: 文件路径
         params: 参数
     """
-    params = params or {}
-    chunk_size = int(params.get("chunk_size", 500))
-    chunk_overlap = int(params.get("chunk_overlap", 100))
+    return chunk_documents(load_documents(file_path), params=params)
 
+def load_documents(file_path):
+    """使用与文件类型对应的 LangChain 加载器加载文档"""
     file_type = Path(file_path).suffix.lower()
 
     # 选择合适的加载器
@@ -53,7 +53,15 @@ def chunk_with_parser(file_path, params=None):
         raise ValueError(f"不支持的文件类型: {file_type}")
 
     # 加载文档
-    docs = loader.load()
+    return loader.load()
+
+def chunk_documents(docs, params=None):
+    """
+    将加载的文档切分成固定大小的块
+    """
+    params = params or {}
+    chunk_size = int(params.get("chunk_size", 500))
+    chunk_overlap = int(params.get("chunk_overlap", 100))
 
     # 创建文本分割器
     text_splitter = RecursiveCharacterTextSplitter(
@@ -95,6 +103,105 @@ def chunk_text(text, params=None):
     nodes = [{"text": node, "metadata": {"chunk_idx": i}} for i, node in enumerate(nodes)]
     return nodes
 
+def chunk_text_stream(texts, params=None, buffer_factor=8):
+    """
+    将逐段到达的文本（例如逐页读取的 PDF）流式切分成块，与 chunk_text 的输出格式相同
+
+    缓冲区累积到 buffer_factor 倍 chunk_size 后切分一次，最后一个块不输出，
+    从它的起始位置开始的文本留在缓冲区中与后续文本拼接，避免在段落（页）边界处产生残缺的块。
+    """
+    params = params or {}
+    chunk_size = int(params.get("chunk_size", 500))
+    chunk_overlap = int(params.get("chunk_overlap", 100))
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", ".", " ", ""]
+    )
+
+    buffer, chunk_idx = "", 0
+    for text in texts:
+        buffer = f"{buffer}\n\n{text}" if buffer else text
+        if len(buffer) < chunk_size * buffer_factor:
+            continue
+
+        nodes = text_splitter.split_text(buffer)
+        if len(nodes) < 2:
+            continue
+
+        for node in nodes[:-1]:
+            yield {"text": node, "metadata": {"chunk_idx": chunk_idx}}
+            chunk_idx += 1
+
+        carry_start = buffer.rfind(nodes[-1])
+        buffer = buffer[carry_start:] if carry_start >= 0 else nodes[-1]
+
+    if buffer:
+        for node in text_splitter.split_text(buffer):
+            yield {"text": node, "metadata": {"chunk_idx": chunk_idx}}
+            chunk_idx += 1
+
+# 加载器写入的与文件路径相关的元数据
+_PATH_METADATA_KEYS = ("source", "file_path", "file_directory", "filename")
+
+def iter_pdf_texts(file_path, params=None):
+    """按 params 中的解析方式逐页（整体解析的 OCR 方式为一次）输出 PDF 的文本"""
+    params = params or {}
+    opt_ocr = params.get("enable_ocr", "disable")
+    if opt_ocr == "disable":
+        yield from iter_pdf_pages(file_path)
+
+    elif params.get("hybrid_ocr"):
+        from src.plugins import ocr
+        yield from ocr.iter_pdf_pages_hybrid(file_path, backend=opt_ocr, backend_options=_ocr_backend_options(params))
+
+    elif opt_ocr == "onnx_rapid_ocr":
+        from src.plugins import ocr
+        yield from ocr.iter_pdf_pages(file_path)
+
+    else:
+        yield parse_pdf(file_path, params=params)
+
+def get_parser_options(file_path, params=None):
+    """返回影响解析结果（不含切分参数）的解析器名称与参数，用作解析缓存的 key"""
+    params = params or {}
+    file_type = Path(file_path).suffix.lower()
+    if file_type != ".pdf":
+        return f"loader{file_type}", {}
+
+    opt_ocr = params.get("enable_ocr", "disable")
+    return "pdf", {"enable_ocr": opt_ocr, "hybrid_ocr": bool(params.get("hybrid_ocr")) and opt_ocr != "disable"}
+
+def iter_file_chunks(file_path, params=None, parse_cache=None):
+    """
+    解析文件并逐块输出，PDF 文件逐页读取并流式切分，内存占用与文档大小无关
+
+    传入 parse_cache（ParseCache）时，解析结果按文件内容与解析参数缓存，
+    相同文件再次上传或以不同的切分参数重新切分时不再重复解析。
+    """
+    params = params or {}
+    file_path = Path(file_path)
+    is_pdf = file_path.suffix.lower() == ".pdf"
+
+    if is_pdf:
+        records = ({"text": text} for text in iter_pdf_texts(file_path, params=params))
+    else:
+        # 缓存按文件内容共享，不能保存文件路径相关的元数据，读取时再使用当前的文件路径
+        records = ({"text": doc.page_content, "metadata": {k: v for k, v in (doc.metadata or {}).items() if k not in _PATH_METADATA_KEYS}}
+                   for doc in load_documents(file_path))
+
+    if parse_cache is not None:
+        parser, options = get_parser_options(file_path, params)
+        records = parse_cache.cached(parse_cache.make_key(file_path, parser, options), records)
+
+    if is_pdf:
+        yield from chunk_text_stream((record["text"] for record in records), params=params)
+    else:
+        docs = [Document(page_content=record["text"], metadata={**(record.get("metadata") or {}), "source": str(file_path)})
+                for record in records]
+        yield from chunk_documents(docs, params=params)
+
 def chunk(text_or_path, params=None):
     raise NotImplementedError("chunk is deprecated, use chunk_with_parser or chunk_text instead")
 
@@ -111,6 +218,15 @@ def pdfreader(file_path, params=None):
     text = "\n\n".join([d.page_content for d in docs])
     return text
 
+def iter_pdf_pages(file_path):
+    """逐页读取PDF文件的文本"""
+    assert file_path.exists(), "File not found"
+    assert file_path.suffix.lower() == ".pdf", "File format not supported"
+
+    loader = PyPDFLoader(str(file_path))
+    for doc in loader.lazy_load():
+        yield doc.page_content
+
 def plainreader(file_path):
     """读取普通文本文件并返回text文本"""
     assert os.path.exists(file_path), "File not found"
@@ -121,17 +237,28 @@ def plainreader(file_path):
     text = "\n\n".join([d.page_content for d in docs])
     return text
 
+def _ocr_backend_options(params):
+    """OCR 后端的额外参数，目前只有 mineru_ocr 支持通过 mineru_dump_artifacts 保留调试文件"""
+    if params.get("enable_ocr") == "mineru_ocr":
+        return {"dump_artifacts": bool(params.get("mineru_dump_artifacts", False))}
+    return {}
+
 def parse_pdf(file, params=None):
     params = params or {}
     opt_ocr = params.get("enable_ocr", "disable")
 
-    if opt_ocr == "onnx_rapid_ocr":
+    if opt_ocr != "disable" and params.get("hybrid_ocr"):
+        # 混合模式：有文本层的页面直接提取文本，只对扫描页执行 OCR
+        from src.plugins import ocr
+        return "\n\n".join(ocr.iter_pdf_pages_hybrid(file, backend=opt_ocr, backend_options=_ocr_backend_options(params)))
+
+    elif opt_ocr == "onnx_rapid_ocr":
         from src.plugins import ocr
         return ocr.process_pdf(file)
 
     elif opt_ocr == "mineru_ocr":
         from src.plugins import ocr
-        return ocr.process_pdf_mineru(file)
+        return ocr.process_pdf_mineru(file, **_ocr_backend_options(params))
 
     elif opt_ocr == "paddlex_ocr":
         from src.plugins import ocr
@@ -0,0 +1,216 @@
+"""
+文件索引任务队列与工作协程池
+
+- FairTaskQueue: 每个知识库一个子队列，取任务时在知识库之间轮询，并限制单个知识库同时处理的任务数，
+  避免某个知识库中的大文件或大批量文件阻塞其他知识库；开启 small_files_first 时子队列按文件大小排序
+- IndexingWorkerPool: 固定数量的工作协程从 FairTaskQueue 中取任务并调用 handler 处理
+"""
+
+import time
+import heapq
+import asyncio
+import itertools
+from collections import deque
+
+from src.utils import logger
+
+
+class FairTaskQueue:
+    """按知识库轮询的任务队列，任务为包含 db_id / file_id 的字典，可选 size 字段用于小文件优先"""
+
+    def __init__(self, per_db_concurrency=2, small_files_first=False):
+        self.per_db_concurrency = per_db_concurrency
+        self.small_files_first = small_files_first
+
+        self._queues: dict[str, list] = {}  # db_id -> [(priority, seq, task_data)]
+        self._rotation: deque[str] = deque()  # 轮询顺序
+        self._active: dict[str, int] = {}  # db_id -> 正在处理的任务数
+        self._stop_signals = 0
+        self._seq = itertools.count()
+        self._cond = asyncio.Condition()
+
+    def qsize(self):
+        return sum(len(q) for q in self._queues.values())
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def pending_by_db(self):
+        return {db_id: len(q) for db_id, q in self._queues.items() if q}
+
+    def active_by_db(self):
+        return {db_id: n for db_id, n in self._active.items() if n}
+
+    async def put(self, task_data):
+        db_id = task_data["db_id"]
+        priority = task_data.get("size", 0) if self.small_files_first else 0
+        async with self._cond:
+            if db_id not in self._queues:
+                self._queues[db_id] = []
+                self._rotation.append(db_id)
+            heapq.heappush(self._queues[db_id], (priority, next(self._seq), task_data))
+            self._cond.notify()
+
+    async def get(self):
+        """取出下一个可以处理的任务，返回 None 表示收到停止信号"""
+        async with self._cond:
+            while True:
+                if self._stop_signals > 0:
+                    self._stop_signals -= 1
+                    return None
+
+                if (task_data := self._pop_next()) is not None:
+                    return task_data
+
+                await self._cond.wait()
+
+    async def task_done(self, task_data):
+        """任务处理完成，释放所属知识库的并发名额"""
+        async with self._cond:
+            db_id = task_data["db_id"]
+            self._active[db_id] = max(0, self._active.get(db_id, 0) - 1)
+            self._cond.notify_all()
+
+    async def stop(self, n):
+        """发送 n 个停止信号，每个工作协程收到一个后退出"""
+        async with self._cond:
+            self._stop_signals += n
+            self._cond.notify_all()
+
+    async def clear(self):
+        """清空等待中的任务，返回被清除的任务列表；尚未被取走的停止信号保留"""
+        async with self._cond:
+            cleared = [item[2] for q in self._queues.values() for item in q]
+            self._queues.clear()
+            self._rotation.clear()
+            return cleared
+
+    def drain_stop_signals(self):
+        """丢弃没有被工作协程取走的停止信号，只应在没有工作协程运行时调用"""
+        self._stop_signals = 0
+
+    def _pop_next(self):
+        for _ in range(len(self._rotation)):
+            db_id = self._rotation[0]
+            self._rotation.rotate(-1)
+            queue = self._queues.get(db_id)
+            if queue and self._active.get(db_id, 0) < self.per_db_concurrency:
+                self._active[db_id] = self._active.get(db_id, 0) + 1
+                return heapq.heappop(queue)[2]
+        return None
+
+
+class IndexingWorkerPool:
+    """索引工作协程池
+
+    Args:
+        handler: 处理单个任务的协程函数，参数为 task_data
+        concurrency: 工作协程数量，即全局最大并发数
+        per_db_concurrency: 单个知识库的最大并发数
+        small_files_first: 是否优先处理小文件
+    """
+
+    def __init__(self, handler, concurrency=4, per_db_concurrency=2, small_files_first=False):
+        self.handler = handler
+        self.concurrency = concurrency
+        self.queue = FairTaskQueue(per_db_concurrency, small_files_first)
+        self.tasks: dict[str, dict] = {}  # file_id -> task_data，包含排队中与处理中的任务
+        self.workers: list[asyncio.Task] = []
+        self.worker_status: dict[int, dict] = {}
+
+    @property
+    def is_running(self):
+        return any(not worker.done() for worker in self.workers)
+
+    def configure(self, concurrency=None, per_db_concurrency=None, small_files_first=None):
+        """更新并发配置，concurrency 在下次 start 时生效，其余配置对之后入队/出队的任务生效"""
+        if concurrency is not None:
+            self.concurrency = concurrency
+        if per_db_concurrency is not None:
+            self.queue.per_db_concurrency = per_db_concurrency
+        if small_files_first is not None:
+            self.queue.small_files_first = small_files_first
+
+    def start(self):
+        """启动工作协程，需要在事件循环中调用；已在运行时不重复启动"""
+        if self.is_running:
+            return
+
+        # 上次停止时强制取消的工作协程没有取走停止信号，残留的信号会让新的工作协程立即退出
+        self.queue.drain_stop_signals()
+        loop = asyncio.get_running_loop()
+        self.workers = [loop.create_task(self._worker(i)) for i in range(self.concurrency)]
+        self.worker_status = {i: {"state": "idle"} for i in range(self.concurrency)}
+        logger.info(f"索引工作协程池已启动，并发数: {self.concurrency}，单个知识库并发数: {self.queue.per_db_concurrency}")
+
+    async def stop(self, timeout=30.0):
+        if not self.is_running:
+            return
+
+        # 只为仍在运行的工作协程发送停止信号，已退出的工作协程不会再取走信号
+        await self.queue.stop(sum(not worker.done() for worker in self.workers))
+        done, pending = await asyncio.wait(self.workers, timeout=timeout)
+        if pending:
+            logger.warning(f"{len(pending)} 个索引工作协程停止超时，强制取消")
+            for worker in pending:
+                worker.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        logger.info("索引工作协程池已停止")
+
+    async def submit(self, task_data):
+        self.tasks[task_data["file_id"]] = task_data
+        await self.queue.put(task_data)
+
+    async def clear(self):
+        """清空排队中的任务，正在处理的任务不受影响"""
+        cleared = await self.queue.clear()
+        for task_data in cleared:
+            self.tasks.pop(task_data["file_id"], None)
+        return len(cleared)
+
+    def status(self):
+        return {
+            "queue_size": self.queue.qsize(),
+            "processing_count": len(self.tasks),
+            "processor_running": self.is_running,
+            "processing_files": list(self.tasks.keys()),
+            "concurrency": self.concurrency,
+            "per_db_concurrency": self.queue.per_db_concurrency,
+            "small_files_first": self.queue.small_files_first,
+            "pending_by_db": self.queue.pending_by_db(),
+            "active_by_db": self.queue.active_by_db(),
+            "workers": [
+                {"worker_id": worker_id, **status,
+                 "elapsed": round(time.time() - status["started_at"], 1) if "started_at" in status else None}
+                for worker_id, status in self.worker_status.items()
+            ],
+        }
+
+    async def _worker(self, worker_id):
+        while True:
+            try:
+                task_data = await self.queue.get()
+            except asyncio.CancelledError:
+                break
+
+            if task_data is None:  # 停止信号
+                break
+
+            self.worker_status[worker_id] = {
+                "state": "processing",
+                "db_id": task_data["db_id"],
+                "file_id": task_data["file_id"],
+                "started_at": time.time(),
+            }
+            try:
+                await self.handler(task_data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"索引工作协程 {worker_id} 处理任务 {task_data['file_id']} 时发生未预期的错误: {e}")
+            finally:
+                self.tasks.pop(task_data["file_id"], None)
+                self.worker_status[worker_id] = {"state": "idle"}
+                await self.queue.task_done(task_data)
+
+        self.worker_status[worker_id] = {"state": "stopped"}
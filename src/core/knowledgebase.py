@@ -1,20 +1,26 @@
 import os
+import re
+import copy
 import json
 import time
+import socket
 import traceback
 import shutil
+import itertools
+from sqlalchemy import func, insert, or_, and_, text as sql_text
 from sqlalchemy.orm import joinedload
 from pathlib import Path
 import asyncio
-from asyncio import Queue, Task
-
-from pymilvus import MilvusClient
+from concurrent.futures import ThreadPoolExecutor
 
 from src import config
 from src.utils import logger, hashstr
-from src.core.indexing import chunk_with_parser, chunk_text, parse_pdf_async
+from src.utils.cache import LRUCache, PersistentEmbeddingCache, ParseCache
+from src.core.indexing import chunk_text, iter_file_chunks
+from src.core.vector_store import MilvusVectorStore, LocalVectorStore
+from src.core.indexing_queue import IndexingWorkerPool
 from server.db_manager import db_manager
-from server.models.kb_models import KnowledgeDatabase, KnowledgeFile, KnowledgeNode
+from server.models.kb_models import KnowledgeDatabase, KnowledgeFile, KnowledgeNode, IndexingJob
 from src.utils.db_migration import migrate_knowledge_db
 
 class KnowledgeBase:
@@ -28,19 +34,54 @@ class KnowledgeBase:
         self.default_rerank_threshold = 0.1
         self.default_max_query_count = 20
 
-        # 初始化索引队列系统
-        self.indexing_queue: Queue = Queue()
-        self.processing_tasks: dict[str, Task] = {}  # 跟踪处理中的任务
-        self.queue_processor_task: Task | None = None
-        self.is_processing = False
+        # 初始化索引队列系统：多个工作协程并发处理，按知识库轮询
+        self.indexing_pool = IndexingWorkerPool(
+            self._process_indexing_task,
+            concurrency=config.indexing_concurrency,
+            per_db_concurrency=config.indexing_concurrency_per_kb,
+            small_files_first=config.indexing_small_files_first,
+        )
+        self.processing_tasks = self.indexing_pool.tasks  # 跟踪排队中与处理中的任务
+
+        # 索引任务持久化在 indexing_jobs 表中：租约超时（秒）、最大尝试次数、失败重试退避的基数（秒）
+        self.indexing_lease_timeout = 600
+        self.indexing_max_attempts = 3
+        self.indexing_retry_backoff = 30
+        self._lease_owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._job_recovery_task: asyncio.Task | None = None
+
+        # 文件元信息缓存（file_id -> {file_id, filename, type}），用于检索结果补全文件信息
+        self._file_meta_cache: dict[str, dict] = {}
+
+        # 联合检索时并发查询多个集合所用的线程池
+        self._search_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="kb-search")
+
+        # 检索结果缓存，key 中包含知识库版本号，写入/删除操作会递增版本号使旧缓存失效
+        self._db_versions: dict[str, int] = {}
+        self.query_result_cache = LRUCache(
+            max_items=1024,
+            max_bytes=64 * 1024 * 1024,
+            sizeof=lambda value: len(json.dumps(value, ensure_ascii=False, default=str)),
+        )
+
+        # 持久化的文本块向量缓存，key 为 (向量模型, 文本内容哈希)，相同内容的块只需要向量化一次
+        # 未开启时不创建缓存文件，通过 _get_embedding_cache 按需创建
+        self._embedding_cache: PersistentEmbeddingCache | None = None
+        # 文档解析结果缓存，key 为 (文件内容哈希, 解析器, 解析参数)，重新上传或以不同参数重新切分时无需再次解析
+        # 未开启时不创建缓存目录，通过 _get_parse_cache 按需创建
+        self._parse_cache: ParseCache | None = None
+
+        # 检索器缓存，知识库新建、删除、更新或重启时失效；databases_version 供工具列表等外部缓存判断是否失效
+        self.databases_version = 0
+        self._retrievers_cache: dict | None = None
 
         # 检查是否需要从JSON文件迁移到SQLite
         self._check_migration()
 
         self._load_models()
 
-                # 检查所有 waiting 状态的文件并标记为 failed
-        self._mark_waiting_files_as_failed()
+        # 恢复上次未完成的索引任务
+        self._recover_indexing_jobs()
 
     def _to_dict_safely(self, obj):
         """安全地将对象转换为字典，避免延迟加载问题"""
@@ -95,12 +136,12 @@ class KnowledgeBase:
         from src.models.embedding import get_embedding_model
         self.embed_model = get_embedding_model()
 
-        if config.enable_reranker:
-            from src.models.rerank_model import get_reranker
-            self.reranker = get_reranker()
+        from src.models.rerank_model import get_reranker, close_reranker
+        close_reranker(getattr(self, "reranker", None))
+        self.reranker = get_reranker() if config.enable_reranker else None
 
-        connected = self.connect_to_milvus()
-        assert connected, ConnectionError("Failed to connect to Milvus")
+        connected = self.connect_to_vector_store()
+        assert connected, ConnectionError(f"Failed to connect to vector store: {config.vector_store}")
 
     # 知识库数据库操作方法
     def get_all_databases(self):
@@ -192,7 +233,9 @@ class KnowledgeBase:
             session.add(db)
             session.flush()
             db_dict = db.to_dict() # Use the model's to_dict
-            return db_dict
+        # 提交后再使检索器缓存失效，避免并发的 get_retrievers 读到提交前的数据并重新写入缓存
+        self._invalidate_retrievers()
+        return db_dict
 
     def delete_database_record(self, db_id):
         """从数据库中删除知识库记录"""
@@ -204,9 +247,13 @@ class KnowledgeBase:
                 for file_obj in files:
                     session.query(KnowledgeNode).filter_by(file_id=file_obj.file_id).delete()
                     session.delete(file_obj)
+                    self._file_meta_cache.pop(file_obj.file_id, None)
+                session.query(IndexingJob).filter_by(database_id=db_id).delete()
                 session.delete(db)
-                return True
-            return False
+            else:
+                return False
+        self._invalidate_retrievers()
+        return True
 
     def update_database_record(self, db_id, name, description):
         """更新数据库中的知识库记录"""
@@ -217,7 +264,9 @@ class KnowledgeBase:
             db.name = name
             db.description = description
             session.commit()
-            return db.to_dict()
+            db_dict = db.to_dict()
+        self._invalidate_retrievers()
+        return db_dict
 
     def add_file_record(self, db_id, file_id, filename, path, file_type, status="waiting"):
         """在数据库中添加文件记录"""
@@ -232,6 +281,7 @@ class KnowledgeBase:
             )
             session.add(file_obj)
             session.flush()
+            self._file_meta_cache.pop(file_id, None)
             return file_obj.to_dict()
 
     def update_file_status(self, file_id, status):
@@ -246,9 +296,11 @@ class KnowledgeBase:
 
     def delete_file_record(self, file_id):
         """从数据库中删除文件记录及其关联的节点"""
+        self._file_meta_cache.pop(file_id, None)
         with db_manager.get_session_context() as session:
-            # First, delete associated nodes
+            # First, delete associated nodes and indexing job
             session.query(KnowledgeNode).filter_by(file_id=file_id).delete()
+            session.query(IndexingJob).filter_by(file_id=file_id).delete()
             # Then, delete the file
             file_obj = session.query(KnowledgeFile).filter_by(file_id=file_id).first()
             if file_obj:
@@ -272,13 +324,40 @@ class KnowledgeBase:
             ).filter_by(file_id=file_id).first()
             return file_obj.to_dict() if file_obj else None
 
+    def get_files_meta_by_ids(self, file_ids):
+        """批量获取文件的基本信息（不加载节点），优先从缓存中读取
+
+        Returns:
+            dict: file_id -> {"file_id", "filename", "type"}
+        """
+        result = {}
+        missing_ids = []
+        for file_id in set(file_ids):
+            if file_id in self._file_meta_cache:
+                result[file_id] = self._file_meta_cache[file_id]
+            else:
+                missing_ids.append(file_id)
+
+        if missing_ids:
+            with db_manager.get_session_context() as session:
+                rows = session.query(
+                    KnowledgeFile.file_id, KnowledgeFile.filename, KnowledgeFile.file_type
+                ).filter(KnowledgeFile.file_id.in_(missing_ids)).all()
+
+            for file_id, filename, file_type in rows:
+                file_meta = {"file_id": file_id, "filename": filename, "type": file_type}
+                self._file_meta_cache[file_id] = file_meta
+                result[file_id] = file_meta
+
+        return result
+
     def add_node(self, file_id, text, hash_value=None, start_char_idx=None, end_char_idx=None, metadata=None):
         """添加知识块 (原始文本节点)"""
         with db_manager.get_session_context() as session:
             node = KnowledgeNode(
                 file_id=file_id,
                 text=text,
-                hash=hash_value or hashstr(text, with_salt=True), # Ensure hash is present
+                hash=hash_value or hashstr(text), # Ensure hash is present
                 start_char_idx=start_char_idx,
                 end_char_idx=end_char_idx,
                 meta_info=metadata or {}
@@ -287,6 +366,27 @@ class KnowledgeBase:
             session.flush() # To get node.id
             return node.to_dict()
 
+    def add_nodes(self, file_id, nodes_data):
+        """在一个事务中批量添加知识块，返回按输入顺序排列的节点 ID 列表
+
+        nodes_data 为 parse_node_data 的输出列表
+        """
+        if not nodes_data:
+            return []
+
+        rows = [{
+            "file_id": file_id,
+            "text": node_data["text"],
+            "hash": node_data.get("hash") or hashstr(node_data["text"]),
+            "start_char_idx": node_data.get("start_char_idx"),
+            "end_char_idx": node_data.get("end_char_idx"),
+            "meta_info": node_data.get("metadata") or {},
+        } for node_data in nodes_data]
+
+        stmt = insert(KnowledgeNode).returning(KnowledgeNode.id, sort_by_parameter_order=True)
+        with db_manager.get_session_context() as session:
+            return list(session.scalars(stmt, rows).all())
+
     def get_nodes_by_file(self, file_id):
         """获取文件下的所有知识块"""
         with db_manager.get_session_context() as session:
@@ -299,7 +399,13 @@ class KnowledgeBase:
             query = session.query(KnowledgeNode)
             if file_id:
                 query = query.filter_by(file_id=file_id)
-            if search_text:
+            if search_text and db_manager.fts_enabled and len(search_text) >= 3:
+                # trigram 分词的 FTS5 索引可以直接做子串匹配，避免 LIKE 全表扫描
+                phrase = '"' + search_text.replace('"', '""') + '"'
+                query = query.filter(sql_text(
+                    "knowledge_nodes.id IN (SELECT rowid FROM knowledge_nodes_fts WHERE knowledge_nodes_fts MATCH :phrase)"
+                )).params(phrase=phrase)
+            elif search_text:
                 query = query.filter(KnowledgeNode.text.like(f"%{search_text}%"))
             nodes = query.limit(limit).all()
             return [node.to_dict() for node in nodes]
@@ -439,23 +545,9 @@ class KnowledgeBase:
             )
 
             try:
-                if file_type == "pdf":
-                    texts = await parse_pdf_async(file_path, params=params)
-                    raw_nodes = chunk_text(texts, params=params)
-                else:
-                    raw_nodes = chunk_with_parser(file_path, params=params)
-
-                parsed_nodes_data = [parse_node_data(node) for node in raw_nodes]
-
-                for node_data in parsed_nodes_data:
-                    self.add_node(
-                        file_id=file_id,
-                        text=node_data["text"],
-                        hash_value=node_data["hash"],
-                        start_char_idx=node_data.get("start_char_idx"),
-                        end_char_idx=node_data.get("end_char_idx"),
-                        metadata=node_data.get("metadata")
-                    )
+                # 边解析边分批写入知识块，不在内存中保留整个文档的全部知识块
+                async for parsed_nodes_data in self._aiter_file_node_batches(file_path, params):
+                    self.add_nodes(file_id, parsed_nodes_data)
 
                 self.update_file_status(file_id, "pending_indexing")
                 file_record['status'] = "pending_indexing" # Ensure status is up-to-date
@@ -465,12 +557,173 @@ class KnowledgeBase:
 
             except Exception as e:
                 logger.error(f"处理文件 {file_path} 失败，无法保存待索引块: {e}, {traceback.format_exc()}")
+                with db_manager.get_session_context() as session:
+                    session.query(KnowledgeNode).filter_by(file_id=file_id).delete(synchronize_session=False)
                 self.update_file_status(file_id, "failed") # Mark file as failed
                 file_record['status'] = "failed"
 
             processed_files_info.append(file_record)
         return processed_files_info
 
+    async def _aiter_file_node_batches(self, file_path, params=None, batch_size=None):
+        """在线程中解析文件并逐批输出知识块（parse_node_data 的输出列表），每批最多 batch_size 个"""
+        batch_size = batch_size or config.indexing_batch_size
+        chunks = iter_file_chunks(file_path, params=params, parse_cache=self._get_parse_cache())
+
+        def next_batch():
+            return [parse_node_data(node) for node in itertools.islice(chunks, batch_size)]
+
+        while batch := await asyncio.to_thread(next_batch):
+            yield batch
+
+    async def _parse_file_to_nodes(self, file_path, params=None):
+        """解析文件并切分为知识块，返回 parse_node_data 的输出列表"""
+        return [node async for batch in self._aiter_file_node_batches(file_path, params) for node in batch]
+
+    async def update_file(self, db_id, file_id, file_path, params=None):
+        """使用文件的新版本更新知识库中已有的文件
+
+        重新解析新版本后按内容哈希与已有的知识块比对：内容未变的块保留原有的节点 ID 与向量，
+        只删除被移除的块、新增变化的块，位置（start/end/chunk_idx）变化的块按新的切分结果更新。
+        已完成索引的文件立即更新向量库，更新失败时清理该文件的向量并重新加入索引队列；
+        其他状态的文件清理已写入的向量与检查点，等待重新完整索引。
+        """
+        params = params or {}
+        if file_id in self.processing_tasks:
+            raise ValueError(f"文件 {file_id} 正在索引队列中，请稍后再更新")
+
+        with db_manager.get_session_context() as session:
+            file_obj = session.query(KnowledgeFile).filter_by(file_id=file_id, database_id=db_id).first()
+            if file_obj is None:
+                raise ValueError(f"文件 {file_id} 不存在于知识库 {db_id}")
+            file_status = file_obj.status
+            if file_status in ("waiting", "processing"):
+                raise ValueError(f"文件 {file_id} 正在等待或正在索引，请稍后再更新")
+            old_nodes = session.query(
+                KnowledgeNode.id, KnowledgeNode.text, KnowledgeNode.start_char_idx,
+                KnowledgeNode.end_char_idx, KnowledgeNode.meta_info,
+            ).filter_by(file_id=file_id).order_by(KnowledgeNode.id).all()
+
+        new_nodes_data = await self._parse_file_to_nodes(file_path, params)
+
+        # 解析期间文件可能被加入索引队列或被另一个更新请求修改，比对之前重新确认状态并将文件标记为处理中
+        if file_id in self.processing_tasks or not self._claim_file_for_update(file_id, file_status):
+            raise ValueError(f"文件 {file_id} 在解析期间被其他任务修改，请稍后再更新")
+
+        return await self._apply_file_update(db_id, file_id, file_path, file_status, old_nodes, new_nodes_data)
+
+    def _claim_file_for_update(self, file_id, expected_status):
+        """文件状态仍为 expected_status 时将其标记为处理中，返回是否成功"""
+        with db_manager.get_session_context() as session:
+            updated = session.query(KnowledgeFile).filter_by(file_id=file_id, status=expected_status).update(
+                {"status": "processing"}, synchronize_session=False)
+            return updated > 0
+
+    async def _apply_file_update(self, db_id, file_id, file_path, file_status, old_nodes, new_nodes_data):
+        """将新版本的知识块与已有知识块比对并写入，调用前文件已被标记为处理中"""
+        # 按内容哈希比对（重新计算哈希，兼容旧版本加盐的哈希值），相同内容的块可能出现多次，按出现顺序一一对应
+        old_by_hash: dict[str, list] = {}
+        for row in old_nodes:
+            old_by_hash.setdefault(hashstr(row.text), []).append(row)
+
+        kept, moved, added_nodes = [], [], []
+        for node_data in new_nodes_data:
+            if rows := old_by_hash.get(hashstr(node_data["text"])):
+                row = rows.pop(0)
+                kept.append(row.id)
+                new_position = (node_data["start_char_idx"], node_data["end_char_idx"], node_data["metadata"] or {})
+                if (row.start_char_idx, row.end_char_idx, row.meta_info or {}) != new_position:
+                    moved.append((row.id, node_data))
+            else:
+                added_nodes.append(node_data)
+        removed_ids = [row.id for rows in old_by_hash.values() for row in rows]
+
+        nodes_written = False
+        try:
+            if file_status != "done":
+                # 失败或部分索引的文件：向量库中可能残留检查点之前写入的向量，在修改知识块之前全部清理，之后重新完整索引
+                await asyncio.to_thread(self.client.delete, collection_name=db_id, filter=f"file_id == '{file_id}'")
+
+            # 知识块与文件记录在一个事务中更新
+            with db_manager.get_session_context() as session:
+                if removed_ids:
+                    session.query(KnowledgeNode).filter(KnowledgeNode.id.in_(removed_ids)).delete(synchronize_session=False)
+                for node_id, node_data in moved:
+                    session.query(KnowledgeNode).filter_by(id=node_id).update({
+                        "start_char_idx": node_data["start_char_idx"],
+                        "end_char_idx": node_data["end_char_idx"],
+                        "meta_info": node_data["metadata"] or {},
+                    }, synchronize_session=False)
+                file_obj = session.query(KnowledgeFile).filter_by(file_id=file_id).first()
+                file_obj.path = str(file_path)
+                file_obj.filename = Path(file_path).name
+                file_obj.file_type = Path(file_path).suffix.lower().replace(".", "")
+            nodes_written = True
+            added_ids = self.add_nodes(file_id, added_nodes)
+        except Exception:
+            # 知识块未改动时恢复原状态；已删除或修改部分知识块时向量库与知识块不再一致，标记为失败需要重新索引
+            self.update_file_status(file_id, "failed" if nodes_written else file_status)
+            raise
+        self._file_meta_cache.pop(file_id, None)
+
+        if file_status == "done":
+            status = await self._update_file_vectors(db_id, file_id, removed_ids, moved, list(zip(added_ids, added_nodes)))
+        else:
+            self._reset_job_checkpoint(file_id)
+            status = "pending_indexing"
+            self.update_file_status(file_id, status)
+
+        # 写入完成后再递增版本号，避免写入过程中的查询以新版本号缓存旧结果
+        self._bump_db_version(db_id)
+
+        logger.info(f"文件 {file_id} 已更新: 保留 {len(kept)} 个块（{len(moved)} 个位置变化），"
+                    f"删除 {len(removed_ids)} 个块，新增 {len(added_nodes)} 个块，状态 {status}")
+        return {
+            "file_id": file_id,
+            "status": status,
+            "kept": len(kept),
+            "moved": len(moved),
+            "removed": len(removed_ids),
+            "added": len(added_nodes),
+        }
+
+    async def _update_file_vectors(self, db_id, file_id, removed_ids, moved, added):
+        """更新已完成索引的文件在向量库中的向量，返回文件的最终状态
+
+        moved 与 added 为 (节点ID, parse_node_data 输出) 列表，位置变化的块的向量通常可以从向量缓存中直接取得。
+        """
+        self.update_file_status(file_id, "processing")
+        try:
+            rewrite = moved + added
+            stale_ids = removed_ids + [node_id for node_id, _ in moved]
+            for i in range(0, len(stale_ids), 1000):
+                await asyncio.to_thread(self.client.delete, collection_name=db_id, filter=f"id in {stale_ids[i:i + 1000]}")
+
+            if rewrite:
+                vectors = await self._aembed_with_cache([node["text"] for _, node in rewrite])
+                await asyncio.to_thread(self.client.insert, collection_name=db_id, data=[
+                    self._build_vector_entry(file_id, {**node, "id": node_id, "meta_info": node["metadata"]}, vector)
+                    for (node_id, node), vector in zip(rewrite, vectors)
+                ])
+
+            self.update_file_status(file_id, "done")
+            return "done"
+
+        except Exception as e:
+            logger.error(f"更新文件 {file_id} 的向量失败，将重新索引整个文件: {e}, {traceback.format_exc()}")
+            try:
+                await asyncio.to_thread(self.client.delete, collection_name=db_id, filter=f"file_id == '{file_id}'")
+            except Exception as delete_error:
+                # 无法确认向量库中的残留，直接重新索引会产生重复的向量，标记为失败由用户处理
+                logger.error(f"清理文件 {file_id} 的向量失败: {delete_error}")
+                self.update_file_status(file_id, "failed")
+                return "failed"
+
+            self._reset_job_checkpoint(file_id)
+            self.update_file_status(file_id, "pending_indexing")
+            result = await self.trigger_file_indexing(db_id, file_id)
+            return result["status"]
+
     async def save_urls_for_pending_indexing(self, db_id, urls, params=None):
         try:
             from langchain_community.document_loaders import UnstructuredURLLoader
@@ -500,15 +753,7 @@ class KnowledgeBase:
                 raw_nodes = chunk_text(text_content, params=params)
                 parsed_nodes_data = [parse_node_data(node) for node in raw_nodes]
 
-                for node_data in parsed_nodes_data:
-                    self.add_node(
-                        file_id=file_id,
-                        text=node_data["text"],
-                        hash_value=node_data["hash"],
-                        start_char_idx=node_data.get("start_char_idx"),
-                        end_char_idx=node_data.get("end_char_idx"),
-                        metadata=node_data.get("metadata")
-                    )
+                self.add_nodes(file_id, parsed_nodes_data)
 
                 self.update_file_status(file_id, "pending_indexing")
                 file_record['status'] = "pending_indexing"
@@ -540,28 +785,22 @@ class KnowledgeBase:
             return {"status": "failed", "message": "向量模型不匹配"}
 
         try:
+            # 持久化任务后添加到队列
+            if not self._upsert_indexing_job(db_id, file_id):
+                logger.warning(f"文件 {file_id} 正在被其他工作协程索引，跳过重复添加")
+                return {"status": "queued", "message": "文件正在索引中"}
+
             # 设置状态为等待
             self.update_file_status(file_id, "waiting")
-
-            # 将任务添加到队列
-            task_data = {
-                "db_id": db_id,
-                "file_id": file_id,
-                "timestamp": time.time()
-            }
-
-            # 添加到处理任务跟踪
-            self.processing_tasks[file_id] = task_data
-
-            # 将任务放入队列
-            await self.indexing_queue.put(task_data)
+            task_data = self._make_indexing_task(db_id, file_id)
+            await self.indexing_pool.submit(task_data)
 
             # 确保队列处理器正在运行
-            if self.queue_processor_task is None or self.queue_processor_task.done():
-                self._start_queue_processor()
+            self._start_queue_processor()
 
-            logger.info(f"文件 {file_id} 已成功添加到索引队列，当前队列大小: {self.indexing_queue.qsize()}")
-            return {"status": "queued", "message": f"文件已添加到索引队列，队列位置: {self.indexing_queue.qsize()}"}
+            queue_size = self.indexing_pool.queue.qsize()
+            logger.info(f"文件 {file_id} 已成功添加到索引队列，当前队列大小: {queue_size}")
+            return {"status": "queued", "message": f"文件已添加到索引队列，队列位置: {queue_size}"}
 
         except Exception as e:
             logger.error(f"添加文件 {file_id} 到索引队列时发生错误: {e}")
@@ -572,6 +811,8 @@ class KnowledgeBase:
 
     def delete_file(self, db_id, file_id):
         logger.info(f"Deleting file {file_id} from database {db_id}")
+        # 删除前后各递增一次版本号：删除过程中执行的查询可能以新版本号缓存删除前的结果，删除完成后需要再次失效
+        self._bump_db_version(db_id)
         try:
             # From Milvus
             logger.info(f"Deleting vectors for file_id {file_id} from Milvus collection {db_id}")
@@ -586,10 +827,13 @@ class KnowledgeBase:
             logger.info(f"Successfully deleted file record {file_id} and its nodes from SQLite.")
         else:
             logger.warning(f"File record {file_id} not found in SQLite for deletion or already deleted.")
+        self._bump_db_version(db_id)
 
 
     def delete_database(self, db_id):
         logger.info(f"Deleting database {db_id}")
+        # 与 delete_file 相同，删除前后各递增一次版本号
+        self._bump_db_version(db_id)
         try:
             if self.client.has_collection(collection_name=db_id):
                 logger.info(f"Dropping Milvus collection {db_id}")
@@ -605,6 +849,7 @@ class KnowledgeBase:
             logger.info(f"Successfully deleted database record {db_id} and associated data from SQLite.")
         else:
             logger.warning(f"Database record {db_id} not found in SQLite for deletion.")
+        self._bump_db_version(db_id)
 
         db_folder = os.path.join(self.work_dir, db_id)
         if os.path.exists(db_folder):
@@ -617,51 +862,68 @@ class KnowledgeBase:
 
     def restart(self):
         self._load_models()
+        self.query_result_cache.clear()
+        self._invalidate_retrievers()
         # 重启时也重新启动队列处理器
         self._start_queue_processor()
 
+    def shutdown(self):
+        """服务关闭时释放重排序模型与检索线程池"""
+        from src.models.rerank_model import close_reranker
+        close_reranker(getattr(self, "reranker", None))
+        self.reranker = None
+        self._search_executor.shutdown(wait=False, cancel_futures=True)
+
     def get_queue_status(self):
-        """获取队列状态信息"""
-        return {
-            "queue_size": self.indexing_queue.qsize(),
-            "processing_count": len(self.processing_tasks),
-            "processor_running": self.queue_processor_task is not None and not self.queue_processor_task.done(),
-            "processing_files": list(self.processing_tasks.keys())
-        }
+        """获取队列状态信息，包括每个工作协程的状态与持久化任务的统计"""
+        status = self.indexing_pool.status()
+        with db_manager.get_session_context() as session:
+            rows = session.query(IndexingJob.status, func.count(IndexingJob.id)).group_by(IndexingJob.status).all()
+        status["jobs"] = {job_status: count for job_status, count in rows}
+        return status
 
     async def stop_queue_processor(self):
-        """停止队列处理器"""
-        if self.queue_processor_task and not self.queue_processor_task.done():
-            # 发送停止信号
-            await self.indexing_queue.put(None)
-            try:
-                await asyncio.wait_for(self.queue_processor_task, timeout=30.0)
-                logger.info("索引队列处理器已正常停止")
-            except TimeoutError:
-                logger.warning("索引队列处理器停止超时，强制取消")
-                self.queue_processor_task.cancel()
-                try:
-                    await self.queue_processor_task
-                except asyncio.CancelledError:
-                    pass
+        """停止队列处理器，等待正在处理的任务完成"""
+        if self._job_recovery_task and not self._job_recovery_task.done():
+            self._job_recovery_task.cancel()
+        await self.indexing_pool.stop(timeout=30.0)
 
     async def clear_queue(self):
-        """清空队列（谨慎使用）"""
-        cleared_count = 0
-        while not self.indexing_queue.empty():
-            try:
-                await asyncio.wait_for(self.indexing_queue.get(), timeout=0.1)
-                self.indexing_queue.task_done()
-                cleared_count += 1
-            except TimeoutError:
-                break
+        """清空队列（谨慎使用），正在处理的任务不受影响
 
-        # 清空处理任务跟踪
-        self.processing_tasks.clear()
-
-        logger.info(f"已清空索引队列，共清除 {cleared_count} 个任务")
+        排队中（包括等待重试）的持久化任务标记为 cancelled，对应的文件恢复为 pending_indexing，可以重新触发索引。
+        """
+        cleared_count = await self.indexing_pool.clear()
+        with db_manager.get_session_context() as session:
+            cancelled_file_ids = [file_id for (file_id,) in session.query(IndexingJob.file_id).filter_by(status="queued").all()]
+            if cancelled_file_ids:
+                session.query(IndexingJob).filter(
+                    IndexingJob.file_id.in_(cancelled_file_ids), IndexingJob.status == "queued"
+                ).update({"status": "cancelled"}, synchronize_session=False)
+                session.query(KnowledgeFile).filter(
+                    KnowledgeFile.file_id.in_(cancelled_file_ids), KnowledgeFile.status == "waiting"
+                ).update({"status": "pending_indexing"}, synchronize_session=False)
+        logger.info(f"已清空索引队列，共清除 {cleared_count} 个任务，取消 {len(cancelled_file_ids)} 个持久化任务")
         return cleared_count
 
+    def _make_indexing_task(self, db_id, file_id, file_path=None):
+        """构造索引任务，size 用于小文件优先调度"""
+        if file_path is None:
+            with db_manager.get_session_context() as session:
+                file_path = session.query(KnowledgeFile.path).filter_by(file_id=file_id).scalar()
+
+        try:
+            size = os.path.getsize(file_path) if file_path and os.path.isfile(file_path) else 0
+        except OSError:
+            size = 0
+
+        return {
+            "db_id": db_id,
+            "file_id": file_id,
+            "size": size,
+            "timestamp": time.time()
+        }
+
     async def restore_waiting_files_to_queue(self):
         """将状态为waiting的文件重新添加到队列中"""
         with db_manager.get_session_context() as session:
@@ -671,17 +933,9 @@ class KnowledgeBase:
             for file_obj in waiting_files:
                 # 检查文件是否已经在处理队列中
                 if file_obj.file_id not in self.processing_tasks:
-                    task_data = {
-                        "db_id": file_obj.database_id,
-                        "file_id": file_obj.file_id,
-                        "timestamp": time.time()
-                    }
-
-                    # 添加到处理任务跟踪
-                    self.processing_tasks[file_obj.file_id] = task_data
-
-                    # 将任务放入队列
-                    await self.indexing_queue.put(task_data)
+                    self._upsert_indexing_job(file_obj.database_id, file_obj.file_id)
+                    task_data = self._make_indexing_task(file_obj.database_id, file_obj.file_id, file_obj.path)
+                    await self.indexing_pool.submit(task_data)
                     restored_count += 1
 
                     logger.info(f"已将等待中的文件 {file_obj.file_id} 重新添加到索引队列")
@@ -697,18 +951,258 @@ class KnowledgeBase:
     #* Below is the code for retriever #
     ###################################
 
+    def _bump_db_version(self, db_id):
+        """递增知识库版本号，使该知识库的检索结果缓存全部失效"""
+        self._db_versions[db_id] = self._db_versions.get(db_id, 0) + 1
+
+    def get_cache_stats(self):
+        from src.models.embedding import query_embedding_cache
+        from src.models.rerank_model import rerank_score_cache
+        return {
+            "query_result_cache": self.query_result_cache.stats(),
+            "query_embedding_cache": query_embedding_cache.stats(),
+            "rerank_score_cache": rerank_score_cache.stats() if rerank_score_cache is not None else None,
+            "embedding_cache": self._embedding_cache.stats() if self._embedding_cache is not None else None,
+            "parse_cache": self._parse_cache.stats() if self._parse_cache is not None else None,
+            "file_meta_cache": {"items": len(self._file_meta_cache)},
+        }
+
+    def _get_parse_cache(self, force=False):
+        """返回文档解析缓存，未开启 enable_parse_cache 时返回 None（force 为 True 时仍然返回，用于清理）"""
+        if not (config.enable_parse_cache or force):
+            return None
+        if self._parse_cache is None:
+            self._parse_cache = ParseCache(os.path.join(self.work_dir, "parse_cache"),
+                                           max_bytes=int(config.parse_cache_max_size * 1024 ** 2))
+        return self._parse_cache
+
+    def _get_embedding_cache(self, force=False):
+        """返回文本块向量缓存，未开启 enable_embedding_cache 时返回 None（force 为 True 时仍然返回，用于清理）"""
+        if not (config.enable_embedding_cache or force):
+            return None
+        if self._embedding_cache is None:
+            self._embedding_cache = PersistentEmbeddingCache(
+                os.path.join(self.work_dir, "embedding_cache.db"),
+                max_items=config.embedding_cache_max_items or None,
+                max_age=config.embedding_cache_max_age * 86400 or None,
+            )
+        return self._embedding_cache
+
+    def purge_embedding_cache(self):
+        """清空文本块向量缓存，返回删除的条目数"""
+        if self._embedding_cache is None and not os.path.exists(os.path.join(self.work_dir, "embedding_cache.db")):
+            return {"items": 0}
+        return {"items": self._get_embedding_cache(force=True).clear()}
+
+    def purge_parse_cache(self):
+        """清空文档解析缓存，返回删除的条目数与字节数"""
+        if self._parse_cache is None and not os.path.exists(os.path.join(self.work_dir, "parse_cache")):
+            return {"items": 0, "bytes": 0}
+        return self._get_parse_cache(force=True).purge()
+
+    def clear_caches(self):
+        from src.models.embedding import query_embedding_cache
+        from src.models.rerank_model import rerank_score_cache
+        self.query_result_cache.clear()
+        query_embedding_cache.clear()
+        if rerank_score_cache is not None:
+            rerank_score_cache.clear()
+        self._file_meta_cache.clear()
+
     def query(self, query_text, db_id, **kwargs): # Renamed 'query' to 'query_text' to avoid clash
-        distance_threshold = kwargs.get("distance_threshold", self.default_distance_threshold)
-        rerank_threshold = kwargs.get("rerank_threshold", self.default_rerank_threshold)
-        max_query_count = kwargs.get("max_query_count", self.default_max_query_count)
+        if isinstance(db_id, list | tuple):
+            return self.query_federated(query_text, db_id, **kwargs)
+
+        options = self._query_options(kwargs)
+        cache_key, cached = self._get_cached_query(kwargs, (db_id, self._db_versions.get(db_id, 0)), query_text, options)
+        if cached is not None:
+            return cached
+
+        # 调用方已经计算过查询向量时（例如推测检索），可以通过 query_vector 传入以跳过向量化
+        if kwargs.get("query_vector") is not None:
+            all_db_result = self.search_by_vector(kwargs["query_vector"], db_id, limit=options["max_query_count"])
+        else:
+            all_db_result = self.search(query_text, db_id, limit=options["max_query_count"]) # Use query_text
+        all_db_result_dicts = self._format_search_results(all_db_result, db_id)
+
+        all_db_result_dicts, candidates, distance_threshold = self._prepare_candidates(query_text, all_db_result_dicts, [db_id], options)
+        db_result_filtered = self._filter_and_rerank(query_text, candidates, distance_threshold, options["rerank_threshold"], options["top_k"])
+
+        response = {
+            "results": db_result_filtered,
+            "all_results": all_db_result_dicts, # Return the full list before filtering for analysis
+        }
+        return self._cache_query_result(cache_key, response)
+
+    def query_federated(self, query_text, db_ids, **kwargs):
+        """在多个知识库中联合检索
+
+        查询只做一次向量化，随后并发检索各个知识库对应的集合，按相似度合并所有候选结果，
+        最后对合并后的结果统一进行一次重排序。
+        """
+        options = self._query_options(kwargs)
+        valid_db_ids = self._valid_federated_db_ids(db_ids)
+        cache_key, cached = self._get_cached_query(kwargs, self._federated_cache_scope(valid_db_ids), query_text, options)
+        if cached is not None:
+            return cached
+
+        results = []
+        if valid_db_ids:
+            query_vector = kwargs.get("query_vector")
+            if query_vector is None:
+                query_vector = self.embed_model.encode_query(query_text)
+            futures = [
+                self._search_executor.submit(self.search_by_vector, query_vector, db_id, options["max_query_count"])
+                for db_id in valid_db_ids
+            ]
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append(e)
+        all_db_result_dicts = self._merge_federated_results(valid_db_ids, results)
+
+        all_db_result_dicts, candidates, distance_threshold = self._prepare_candidates(query_text, all_db_result_dicts, valid_db_ids, options)
+        db_result_filtered = self._filter_and_rerank(query_text, candidates, distance_threshold, options["rerank_threshold"], options["top_k"])
+
+        response = {
+            "results": db_result_filtered,
+            "all_results": all_db_result_dicts,
+            "db_ids": valid_db_ids,
+        }
+        return self._cache_query_result(cache_key, response)
+
+    async def aquery(self, query_text, db_id, **kwargs):
+        """query 的异步版本，向量化、向量检索与重排序均不会阻塞事件循环"""
+        if isinstance(db_id, list | tuple):
+            return await self.aquery_federated(query_text, db_id, **kwargs)
+
+        options = self._query_options(kwargs)
+        cache_key, cached = self._get_cached_query(kwargs, (db_id, self._db_versions.get(db_id, 0)), query_text, options)
+        if cached is not None:
+            return cached
+
+        if kwargs.get("query_vector") is not None:
+            all_db_result = await self.asearch_by_vector(kwargs["query_vector"], db_id, limit=options["max_query_count"])
+        else:
+            all_db_result = await self.asearch(query_text, db_id, limit=options["max_query_count"])
+        all_db_result_dicts = self._format_search_results(all_db_result, db_id)
+
+        all_db_result_dicts, candidates, distance_threshold = await asyncio.to_thread(
+            self._prepare_candidates, query_text, all_db_result_dicts, [db_id], options)
+        db_result_filtered = await self._afilter_and_rerank(query_text, candidates, distance_threshold, options["rerank_threshold"], options["top_k"])
+
+        response = {
+            "results": db_result_filtered,
+            "all_results": all_db_result_dicts,
+        }
+        return self._cache_query_result(cache_key, response)
+
+    async def aquery_federated(self, query_text, db_ids, **kwargs):
+        """query_federated 的异步版本，各知识库的检索通过 asyncio.gather 并发执行"""
+        options = self._query_options(kwargs)
+        valid_db_ids = await asyncio.to_thread(self._valid_federated_db_ids, db_ids)
+        cache_key, cached = self._get_cached_query(kwargs, self._federated_cache_scope(valid_db_ids), query_text, options)
+        if cached is not None:
+            return cached
+
+        results = []
+        if valid_db_ids:
+            query_vector = kwargs.get("query_vector")
+            if query_vector is None:
+                query_vector = await self.embed_model.aencode_query(query_text)
+            results = await asyncio.gather(
+                *(self.asearch_by_vector(query_vector, db_id, options["max_query_count"]) for db_id in valid_db_ids),
+                return_exceptions=True,
+            )
+        all_db_result_dicts = self._merge_federated_results(valid_db_ids, results)
+
+        all_db_result_dicts, candidates, distance_threshold = await asyncio.to_thread(
+            self._prepare_candidates, query_text, all_db_result_dicts, valid_db_ids, options)
+        db_result_filtered = await self._afilter_and_rerank(query_text, candidates, distance_threshold, options["rerank_threshold"], options["top_k"])
+
+        response = {
+            "results": db_result_filtered,
+            "all_results": all_db_result_dicts,
+            "db_ids": valid_db_ids,
+        }
+        return self._cache_query_result(cache_key, response)
+
+    def _query_options(self, kwargs):
+        """解析检索参数，未传入的使用默认值；返回的字典同时作为检索结果缓存 key 的一部分"""
+        return {
+            "distance_threshold": kwargs.get("distance_threshold", self.default_distance_threshold),
+            "rerank_threshold": kwargs.get("rerank_threshold", self.default_rerank_threshold),
+            "max_query_count": kwargs.get("max_query_count", self.default_max_query_count),
+            "search_mode": kwargs.get("search_mode") or "vector",
+            "top_k": kwargs.get("top_k"),
+        }
 
-        all_db_result = self.search(query_text, db_id, limit=max_query_count) # Use query_text
+    def _get_cached_query(self, kwargs, scope, query_text, options):
+        """返回 (缓存 key, 命中的检索结果)，未开启缓存时 key 为 None，未命中时结果为 None
+
+        scope 中包含知识库的版本号，写入/删除操作后旧的缓存自然失效
+        """
+        if not kwargs.get("use_cache", config.enable_query_cache):
+            return None, None
+
+        cache_key = (scope, query_text, *options.values())
+        cached = self.query_result_cache.get(cache_key)
+        return cache_key, copy.deepcopy(cached) if cached is not None else None
+
+    def _cache_query_result(self, cache_key, response):
+        if cache_key is not None:
+            self.query_result_cache.set(cache_key, copy.deepcopy(response))
+        return response
+
+    def _federated_cache_scope(self, db_ids):
+        return tuple((db_id, self._db_versions.get(db_id, 0)) for db_id in db_ids)
+
+    def _valid_federated_db_ids(self, db_ids):
+        """去重并保持顺序，跳过不存在或向量模型与当前模型不一致的知识库"""
+        valid_db_ids = []
+        for db_id in dict.fromkeys(db_ids):
+            if self.get_database_by_id(db_id) and self.check_embed_model(db_id):
+                valid_db_ids.append(db_id)
+            else:
+                logger.warning(f"知识库 {db_id} 不存在或向量模型不匹配，跳过联合检索")
+        return valid_db_ids
+
+    def _merge_federated_results(self, db_ids, results):
+        """合并各知识库的检索结果并按相似度降序排列，检索失败（结果为异常）的知识库跳过"""
         all_db_result_dicts = []
-        for res_item in all_db_result: # res is a list of SearchResult objects
-            # 将 Milvus SearchResult 对象转换为字典
+        for db_id, result in zip(db_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"联合检索中知识库 {db_id} 检索失败: {result}")
+            else:
+                all_db_result_dicts.extend(self._format_search_results(result, db_id))
+
+        all_db_result_dicts.sort(key=lambda x: x["distance"], reverse=True)
+        return all_db_result_dicts
+
+    def _prepare_candidates(self, query_text, result_dicts, db_ids, options):
+        """补全文件信息，混合检索时与关键词检索的结果融合
+
+        Returns:
+            tuple: (全部结果, 待过滤与重排序的候选结果, 相似度阈值)；混合检索的候选结果已按阈值筛选过，阈值为 None
+        """
+        if options["search_mode"] == "hybrid" and db_ids:
+            result_dicts, candidates = self._hybrid_candidates(
+                query_text, result_dicts, db_ids, options["max_query_count"], options["distance_threshold"])
+            self._attach_file_info(result_dicts + candidates)
+            return result_dicts, candidates, None
+
+        self._attach_file_info(result_dicts)
+        return result_dicts, result_dicts, options["distance_threshold"]
+
+    def _format_search_results(self, search_results, db_id=None):
+        """将 Milvus SearchResult 对象转换为字典"""
+        result_dicts = []
+        for res_item in search_results: # res is a list of SearchResult objects
             item_dict = {
                 "id": res_item.id,
                 "distance": res_item.distance,
+                "db_id": db_id,
                 "entity": {}
             }
             # 安全地获取实体字段
@@ -724,40 +1218,122 @@ class KnowledgeBase:
                         except Exception:
                             continue
 
-            all_db_result_dicts.append(item_dict)
+            result_dicts.append(item_dict)
+        return result_dicts
+
+    def _attach_file_info(self, result_dicts):
+        """一次性批量查询所有命中文件的基本信息，避免逐条查询并加载全部节点"""
+        hit_file_ids = [r["entity"]["file_id"] for r in result_dicts if r.get("entity") and r["entity"].get("file_id")]
+        files_meta = self.get_files_meta_by_ids(hit_file_ids) if hit_file_ids else {}
 
-        for res_dict in all_db_result_dicts:
+        for res_dict in result_dicts:
             if res_dict.get("entity") and res_dict["entity"].get("file_id"):
-                file_info = self.get_file_by_id(res_dict["entity"]["file_id"]) # get_file_by_id returns a dict
+                file_info = files_meta.get(res_dict["entity"]["file_id"])
                 if file_info:
                     # Add selective file info to avoid circular references or overly large objects
-                    res_dict["file"] = {
-                        "file_id": file_info.get("file_id"),
-                        "filename": file_info.get("filename"),
-                        "type": file_info.get("file_type")
-                    }
+                    res_dict["file"] = file_info.copy()
             else:
                  logger.warning(f"Missing entity or file_id in Milvus result: {res_dict}")
 
-        db_result_filtered = [r for r in all_db_result_dicts if r["distance"] > distance_threshold]
+    def search_lexical(self, query_text, db_ids, limit=20):
+        """基于 FTS5 (BM25) 的关键词检索，只检索已经完成索引的文件"""
+        match_query = build_fts_match_query(query_text)
+        if not db_manager.fts_enabled or not match_query or not db_ids:
+            return []
+
+        db_params = {f"db_{i}": db_id for i, db_id in enumerate(db_ids)}
+        sql = sql_text(
+            "SELECT n.id, n.file_id, n.text, n.hash, n.start_char_idx, n.end_char_idx, f.database_id, "
+            "bm25(knowledge_nodes_fts) AS score "
+            "FROM knowledge_nodes_fts "
+            "JOIN knowledge_nodes n ON n.id = knowledge_nodes_fts.rowid "
+            "JOIN knowledge_files f ON f.file_id = n.file_id "
+            f"WHERE knowledge_nodes_fts MATCH :match AND f.status = 'done' AND f.database_id IN ({', '.join(':' + k for k in db_params)}) "
+            "ORDER BY score LIMIT :limit"
+        )
+        try:
+            with db_manager.get_session_context() as session:
+                rows = session.execute(sql, {"match": match_query, "limit": limit, **db_params}).all()
+        except Exception as e:
+            logger.warning(f"关键词检索失败: {e}, match: {match_query}")
+            return []
+
+        return [{
+            "id": row.id,
+            "distance": 0.0,
+            "db_id": row.database_id,
+            "bm25_score": -row.score,  # SQLite 的 bm25() 越小越相关，取反后越大越相关
+            "entity": {
+                "text": row.text,
+                "file_id": row.file_id,
+                "hash": row.hash,
+                "start_char_idx": row.start_char_idx,
+                "end_char_idx": row.end_char_idx,
+            },
+        } for row in rows]
+
+    def _hybrid_candidates(self, query_text, vector_dicts, db_ids, limit, distance_threshold, rrf_k=60):
+        """使用倒数排名融合 (RRF) 合并向量检索与关键词检索的结果
+
+        Returns:
+            tuple: (全部结果, 按 rrf_score 排序后的候选结果)
+        """
+        lexical_dicts = self.search_lexical(query_text, db_ids, limit=limit)
+        vector_candidates = [r for r in vector_dicts if r["distance"] > distance_threshold]
+
+        fused = {}
+        for ranked_list, source in ((vector_candidates, "vector"), (lexical_dicts, "lexical")):
+            for rank, item in enumerate(ranked_list, start=1):
+                if item["id"] not in fused:
+                    fused[item["id"]] = {**item, "rrf_score": 0.0, "sources": []}
+                elif source == "lexical":
+                    fused[item["id"]]["bm25_score"] = item["bm25_score"]
+                fused[item["id"]]["rrf_score"] += 1.0 / (rrf_k + rank)
+                fused[item["id"]]["sources"].append(source)
+
+        candidates = sorted(fused.values(), key=lambda x: x["rrf_score"], reverse=True)[:limit]
+
+        vector_ids = {r["id"] for r in vector_dicts}
+        all_results = vector_dicts + [r for r in lexical_dicts if r["id"] not in vector_ids]
+        return all_results, candidates
+
+    def _filter_and_rerank(self, query_text, result_dicts, distance_threshold, rerank_threshold, top_k=None):
+        """按相似度阈值过滤（distance_threshold 为 None 时不过滤），并在开启重排序时进行重排序"""
+        db_result_filtered, rerank_candidates = self._split_rerank_candidates(result_dicts, distance_threshold)
+        if rerank_candidates: # Ensure there are texts to rerank
+            texts_for_rerank = [r["entity"]["text"] for r in rerank_candidates]
+            rerank_scores = self.reranker.compute_score([query_text, texts_for_rerank], normalize=False) # Use query_text
+            db_result_filtered = self._apply_rerank_scores(db_result_filtered, rerank_candidates, rerank_scores, rerank_threshold)
+
+        return db_result_filtered[:top_k] if top_k else db_result_filtered
+
+    async def _afilter_and_rerank(self, query_text, result_dicts, distance_threshold, rerank_threshold, top_k=None):
+        """_filter_and_rerank 的异步版本"""
+        db_result_filtered, rerank_candidates = self._split_rerank_candidates(result_dicts, distance_threshold)
+        if rerank_candidates:
+            texts_for_rerank = [r["entity"]["text"] for r in rerank_candidates]
+            rerank_scores = await self.reranker.acompute_score([query_text, texts_for_rerank], normalize=False)
+            db_result_filtered = self._apply_rerank_scores(db_result_filtered, rerank_candidates, rerank_scores, rerank_threshold)
+
+        return db_result_filtered[:top_k] if top_k else db_result_filtered
+
+    def _split_rerank_candidates(self, result_dicts, distance_threshold):
+        """返回 (阈值过滤后的结果, 需要重排序的结果)，未开启重排序时后者为空"""
+        if distance_threshold is None:
+            db_result_filtered = list(result_dicts)
+        else:
+            db_result_filtered = [r for r in result_dicts if r["distance"] > distance_threshold]
 
-        if config.enable_reranker and len(db_result_filtered) > 0 and self.reranker:
-            texts_for_rerank = [r["entity"]["text"] for r in db_result_filtered if r.get("entity") and r["entity"].get("text")]
-            if texts_for_rerank: # Ensure there are texts to rerank
-                rerank_scores = self.reranker.compute_score([query_text, texts_for_rerank], normalize=False) # Use query_text
-                for i, r_filtered in enumerate(db_result_filtered):
-                    if i < len(rerank_scores): # Check bounds
-                         r_filtered["rerank_score"] = rerank_scores[i]
-                db_result_filtered.sort(key=lambda x: x.get("rerank_score", -1), reverse=True) # Handle missing rerank_score
-                db_result_filtered = [_res for _res in db_result_filtered if _res.get("rerank_score", -1) > rerank_threshold]
+        if not (config.enable_reranker and db_result_filtered and self.reranker):
+            return db_result_filtered, []
 
-        if kwargs.get("top_k", None):
-            db_result_filtered = db_result_filtered[:kwargs["top_k"]]
+        return db_result_filtered, [r for r in db_result_filtered if r.get("entity") and r["entity"].get("text")]
 
-        return {
-            "results": db_result_filtered,
-            "all_results": all_db_result_dicts, # Return the full list before filtering for analysis
-        }
+    def _apply_rerank_scores(self, db_result_filtered, rerank_candidates, rerank_scores, rerank_threshold):
+        for r_filtered, score in zip(rerank_candidates, rerank_scores):
+            r_filtered["rerank_score"] = score
+        db_result_filtered.sort(key=lambda x: x.get("rerank_score", -1), reverse=True) # Handle missing rerank_score
+        return [_res for _res in db_result_filtered if _res.get("rerank_score", -1) > rerank_threshold]
 
     def get_retriever_by_db_id(self, db_id):
         retriever_params = {
@@ -775,9 +1351,52 @@ class KnowledgeBase:
             response = self.query(query_text, db_id, **retriever_params) # Use query_text
             return response["results"]
 
+        async def aretriever(query_text):
+            """
+            query_text: 查询文本
+            """
+            response = await self.aquery(query_text, db_id, **retriever_params)
+            return response["results"]
+
+        retriever.coroutine = aretriever
+        return retriever
+
+    def get_federated_retriever(self):
+        retriever_params = {
+            "distance_threshold": self.default_distance_threshold,
+            "rerank_threshold": self.default_rerank_threshold,
+            "max_query_count": self.default_max_query_count,
+            "top_k": 10,
+        }
+
+        def retriever(query_text, db_ids):
+            """
+            query_text: 查询文本
+            db_ids: 需要联合检索的知识库 ID 列表
+            """
+            response = self.query_federated(query_text, db_ids, **retriever_params)
+            return response["results"]
+
+        async def aretriever(query_text, db_ids):
+            """
+            query_text: 查询文本
+            db_ids: 需要联合检索的知识库 ID 列表
+            """
+            response = await self.aquery_federated(query_text, db_ids, **retriever_params)
+            return response["results"]
+
+        retriever.coroutine = aretriever
         return retriever
 
+    def _invalidate_retrievers(self):
+        self.databases_version += 1
+        self._retrievers_cache = None
+
     def get_retrievers(self):
+        if self._retrievers_cache is not None:
+            return dict(self._retrievers_cache)
+
+        version = self.databases_version
         retrievers = {}
         all_dbs = self.get_all_databases() # Returns list of dicts
         for db_data in all_dbs:
@@ -794,16 +1413,27 @@ class KnowledgeBase:
                     f"当前向量模型: {self.embed_model.embed_model_fullname}，"
                     f"知识库向量模型: {db_data['embed_model']}。"
                 )
-        return retrievers
+        if version == self.databases_version:
+            self._retrievers_cache = retrievers
+        return dict(retrievers)
 
     ################################
     #* Below is the code for milvus #
     ################################
+    def connect_to_vector_store(self):
+        """根据配置连接向量数据库，local 为进程内的本地向量库，无需部署 Milvus"""
+        if config.vector_store == "local":
+            self.client = LocalVectorStore(os.path.join(self.work_dir, "vector_store"))
+            logger.info(f"Using local vector store at {self.client.work_dir}")
+            return True
+
+        return self.connect_to_milvus()
+
     def connect_to_milvus(self):
         connected = False
         try:
             uri = os.getenv('MILVUS_URI', config.get('milvus_uri', "http://milvus:19530"))
-            self.client = MilvusClient(uri=uri)
+            self.client = MilvusVectorStore(uri=uri)
             self.client.list_collections() # Test connection
             logger.info(f"Successfully connected to Milvus at {uri}")
             connected = True
@@ -864,8 +1494,8 @@ class KnowledgeBase:
 
 
     def search(self, query_text, collection_name, limit=3): # Renamed query to query_text
-        query_vectors = self.embed_model.batch_encode([query_text]) # Use query_text
-        return self.search_by_vector(query_vectors[0], collection_name, limit)
+        query_vector = self.embed_model.encode_query(query_text)
+        return self.search_by_vector(query_vector, collection_name, limit)
 
     def search_by_vector(self, vector, collection_name, limit=3):
 
@@ -878,6 +1508,19 @@ class KnowledgeBase:
         # res is a list of SearchResult lists. For a single query vector, it's res[0].
         return res[0] if res else []
 
+    async def asearch(self, query_text, collection_name, limit=3):
+        query_vector = await self.embed_model.aencode_query(query_text)
+        return await self.asearch_by_vector(query_vector, collection_name, limit)
+
+    async def asearch_by_vector(self, vector, collection_name, limit=3):
+        res = await self.client.asearch(
+            collection_name=collection_name,
+            data=[vector],
+            limit=limit,
+            output_fields=["text", "file_id"],
+        )
+        return res[0] if res else []
+
 
     def examples(self, collection_name, limit=20):
         res = self.client.query(
@@ -904,118 +1547,248 @@ class KnowledgeBase:
         updated_db = self.update_database_record(db_id, name, description)
         return updated_db
 
-    def _mark_waiting_files_as_failed(self):
-        """将所有 status 为 'processing' 的文件标记为 'failed'（因为上次可能异常退出）"""
+    ###################################
+    #* Below is the code for indexing jobs #
+    ###################################
+
+    def _recover_indexing_jobs(self):
+        """服务启动时恢复索引任务
+
+        - 持有者已经退出的 running 任务重新排队，之后从最近的检查点继续
+        - 没有任务记录的 waiting 文件补建任务
+        - 没有任务记录的 processing 文件无法恢复，标记为 failed
+        """
         with db_manager.get_session_context() as session:
-            # 只将processing状态的文件标记为failed，waiting状态的文件仍然保持等待
-            processing_files = session.query(KnowledgeFile).filter_by(status="processing").all()
-            if processing_files:
-                for file_obj in processing_files:
+            running_jobs = session.query(IndexingJob).filter_by(status="running").all()
+            recovered = 0
+            for job in running_jobs:
+                if job.lease_expires_at is None or job.lease_expires_at < time.time() or not self._lease_owner_alive(job.lease_owner):
+                    job.status, job.lease_owner, job.lease_expires_at = "queued", None, None
+                    recovered += 1
+            if recovered:
+                logger.info(f"已将 {recovered} 个异常中断的索引任务重新排队，将从检查点继续")
+
+            job_file_ids = {file_id for (file_id,) in session.query(IndexingJob.file_id).all()}
+            pending_files = session.query(KnowledgeFile).filter(KnowledgeFile.status.in_(["waiting", "processing"])).all()
+            failed = 0
+            for file_obj in pending_files:
+                if file_obj.file_id in job_file_ids:
+                    file_obj.status = "waiting"
+                elif file_obj.status == "waiting":
+                    session.add(IndexingJob(file_id=file_obj.file_id, database_id=file_obj.database_id, status="queued"))
+                else:
                     file_obj.status = "failed"
-                session.commit()
-                logger.info(f"已将 {len(processing_files)} 个异常中断的 processing 状态文件标记为 failed")
+                    failed += 1
+            if failed:
+                logger.info(f"已将 {failed} 个没有任务记录的 processing 状态文件标记为 failed")
 
-            # 对于waiting状态的文件，将它们重新添加到队列中
-            waiting_files = session.query(KnowledgeFile).filter_by(status="waiting").all()
-            if waiting_files:
-                logger.info(f"发现 {len(waiting_files)} 个 waiting 状态的文件，将重新添加到处理队列")
-                # 这里我们只是记录，实际的重新排队逻辑可以在后续调用trigger_file_indexing时处理
+    def _lease_owner_alive(self, lease_owner):
+        """租约持有者是否仍在运行，只能判断本机进程，其他主机的租约以过期时间为准"""
+        try:
+            host, pid = lease_owner.split(":")[:2]
+            pid = int(pid)
+        except (AttributeError, ValueError):
+            return False
 
-    def _start_queue_processor(self):
-        """启动队列处理器"""
-        if self.queue_processor_task is None or self.queue_processor_task.done():
-            try:
-                # 尝试获取当前事件循环
-                loop = asyncio.get_running_loop()
-                self.queue_processor_task = loop.create_task(self._process_indexing_queue())
-                logger.info("索引队列处理器已启动")
-            except RuntimeError:
-                # 如果没有运行中的事件循环，延迟启动
-                logger.info("无运行中的事件循环，队列处理器将在首次使用时启动")
-
-    async def _process_indexing_queue(self):
-        """处理索引队列中的任务"""
-        logger.info("开始处理索引队列")
-        while True:
-            try:
-                # 从队列中获取任务
-                task_data = await self.indexing_queue.get()
+        if host != socket.gethostname():
+            return True
+        if pid == os.getpid():
+            return False  # 当前进程刚刚启动，不可能持有租约
+        try:
+            os.kill(pid, 0)
+            return True
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
 
-                if task_data is None:  # 用于停止处理器的信号
-                    break
+    def _upsert_indexing_job(self, db_id, file_id):
+        """创建或重置文件的索引任务；已完成的任务重新索引时清空检查点
 
-                db_id = task_data["db_id"]
-                file_id = task_data["file_id"]
+        任务正在被租约有效的工作协程执行时不做修改并返回 False，避免同一文件被两个工作协程同时索引。
+        """
+        with db_manager.get_session_context() as session:
+            job = session.query(IndexingJob).filter_by(file_id=file_id).first()
+            if job is None:
+                session.add(IndexingJob(file_id=file_id, database_id=db_id, status="queued"))
+                return True
 
-                logger.info(f"开始处理队列中的索引任务: 文件 {file_id}, 数据库 {db_id}")
+            if job.status == "running" and job.lease_expires_at is not None and job.lease_expires_at >= time.time():
+                return False
+
+            if job.status == "done":
+                job.checkpoint_node_id, job.indexed_count = 0, 0
+            job.database_id = db_id
+            job.status = "queued"
+            job.attempts = 0
+            job.next_run_at = 0.0
+            job.last_error = None
+            job.lease_owner, job.lease_expires_at = None, None
+            return True
+
+    def _reset_job_checkpoint(self, file_id):
+        """文件的知识块被重写后清空检查点，之后的索引从头开始"""
+        with db_manager.get_session_context() as session:
+            session.query(IndexingJob).filter_by(file_id=file_id).update({
+                "checkpoint_node_id": 0,
+                "indexed_count": 0,
+            }, synchronize_session=False)
+
+    def _acquire_job_lease(self, file_id):
+        """领取任务的租约，任务不存在、已被其他工作协程持有或状态不可执行时返回 False"""
+        now = time.time()
+        with db_manager.get_session_context() as session:
+            updated = session.query(IndexingJob).filter(
+                IndexingJob.file_id == file_id,
+                or_(IndexingJob.status == "queued",
+                    and_(IndexingJob.status == "running", IndexingJob.lease_expires_at < now)),
+            ).update({
+                "status": "running",
+                "attempts": IndexingJob.attempts + 1,
+                "lease_owner": f"{self._lease_owner}:{file_id}",
+                "lease_expires_at": now + self.indexing_lease_timeout,
+            }, synchronize_session=False)
+            return updated > 0
+
+    def _get_job_checkpoint(self, file_id):
+        """返回 (检查点节点ID, 是否为重试)，没有任务记录时从头开始"""
+        with db_manager.get_session_context() as session:
+            job = session.query(IndexingJob).filter_by(file_id=file_id).first()
+            if job is None:
+                return 0, False
+            return job.checkpoint_node_id or 0, (job.attempts or 0) > 1 or (job.checkpoint_node_id or 0) > 0
 
-                try:
-                    # 调用实际的索引处理方法
-                    result = await self._do_file_indexing(db_id, file_id)
-                    logger.info(f"队列任务完成: 文件 {file_id}, 结果: {result['status']}")
-                except Exception as e:
-                    logger.error(f"处理队列任务时发生错误: 文件 {file_id}, 错误: {e}")
-                    self.update_file_status(file_id, "failed")
-                finally:
-                    # 从处理中的任务列表中移除
-                    self.processing_tasks.pop(file_id, None)
-                    # 标记任务完成
-                    self.indexing_queue.task_done()
+    def _save_job_checkpoint(self, file_id, node_id, count):
+        """一个批次写入向量库后保存检查点，并续期租约"""
+        with db_manager.get_session_context() as session:
+            session.query(IndexingJob).filter_by(file_id=file_id).update({
+                "checkpoint_node_id": node_id,
+                "indexed_count": IndexingJob.indexed_count + count,
+                "lease_expires_at": time.time() + self.indexing_lease_timeout,
+            }, synchronize_session=False)
+
+    def _finish_indexing_job(self, file_id, result):
+        """根据索引结果更新任务状态，可重试的失败按指数退避重新排队"""
+        retry_delay = None
+        with db_manager.get_session_context() as session:
+            job = session.query(IndexingJob).filter_by(file_id=file_id).first()
+            if job is None:
+                return
+
+            job.lease_owner, job.lease_expires_at = None, None
+            if result["status"] == "success":
+                job.status, job.last_error = "done", None
+            elif result.get("retryable", True) and job.attempts < self.indexing_max_attempts:
+                retry_delay = self.indexing_retry_backoff * 2 ** (job.attempts - 1)
+                job.status, job.next_run_at, job.last_error = "queued", time.time() + retry_delay, result.get("message")
+            else:
+                job.status, job.last_error = "failed", result.get("message")
 
+        if retry_delay is not None:
+            self.update_file_status(file_id, "waiting")
+            logger.warning(f"文件 {file_id} 索引失败，将在 {retry_delay}s 后重试: {result.get('message')}")
+
+    async def _enqueue_due_jobs(self):
+        """将到期的持久化任务加入内存队列，包括等待重试的任务与租约过期的任务"""
+        now = time.time()
+        with db_manager.get_session_context() as session:
+            due_jobs = session.query(IndexingJob).filter(or_(
+                and_(IndexingJob.status == "queued", IndexingJob.next_run_at <= now),
+                and_(IndexingJob.status == "running", IndexingJob.lease_expires_at < now),
+            )).all()
+            due_jobs = [(job.database_id, job.file_id) for job in due_jobs if job.file_id not in self.processing_tasks]
+
+        for db_id, file_id in due_jobs:
+            await self.indexing_pool.submit(self._make_indexing_task(db_id, file_id))
+
+        if due_jobs:
+            logger.info(f"已将 {len(due_jobs)} 个持久化的索引任务加入队列")
+        return len(due_jobs)
+
+    async def _job_recovery_loop(self, interval=10):
+        while True:
+            try:
+                await self._enqueue_due_jobs()
             except asyncio.CancelledError:
-                logger.info("索引队列处理器被取消")
-                break
+                raise
             except Exception as e:
-                logger.error(f"索引队列处理器发生未预期的错误: {e}")
-                await asyncio.sleep(1)  # 短暂等待后继续处理
+                logger.error(f"恢复索引任务时发生错误: {e}")
+            await asyncio.sleep(interval)
+
+    async def resume_indexing_jobs(self):
+        """启动索引队列并立即恢复持久化的索引任务，在服务启动时调用"""
+        self._start_queue_processor()
+
+    def _start_queue_processor(self):
+        """启动队列处理器（索引工作协程池）"""
+        if self.indexing_pool.is_running:
+            return
+
+        self.indexing_pool.configure(
+            concurrency=config.indexing_concurrency,
+            per_db_concurrency=config.indexing_concurrency_per_kb,
+            small_files_first=config.indexing_small_files_first,
+        )
+        try:
+            self.indexing_pool.start()
+            if self._job_recovery_task is None or self._job_recovery_task.done():
+                self._job_recovery_task = asyncio.get_running_loop().create_task(self._job_recovery_loop())
+        except RuntimeError:
+            # 如果没有运行中的事件循环，延迟启动
+            logger.info("无运行中的事件循环，队列处理器将在首次使用时启动")
+
+    async def _process_indexing_task(self, task_data):
+        """处理索引队列中的单个任务"""
+        db_id = task_data["db_id"]
+        file_id = task_data["file_id"]
+
+        if not self._acquire_job_lease(file_id):
+            logger.info(f"索引任务 {file_id} 已被其他工作协程领取或已取消，跳过")
+            return
+
+        logger.info(f"开始处理队列中的索引任务: 文件 {file_id}, 数据库 {db_id}")
+        try:
+            # 调用实际的索引处理方法
+            result = await self._do_file_indexing(db_id, file_id)
+            logger.info(f"队列任务完成: 文件 {file_id}, 结果: {result['status']}")
+        except Exception as e:
+            logger.error(f"处理队列任务时发生错误: 文件 {file_id}, 错误: {e}")
+            self.update_file_status(file_id, "failed")
+            result = {"status": "failed", "message": str(e)}
+
+        self._finish_indexing_job(file_id, result)
 
     async def _do_file_indexing(self, db_id, file_id):
-        """实际执行文件索引的方法（从原来的 trigger_file_indexing 分离出来）"""
+        """实际执行文件索引的方法（从原来的 trigger_file_indexing 分离出来）
+
+        知识块按 ID 顺序分批处理，读取、向量化、写入向量库三个阶段通过有界队列组成流水线，
+        第 N+1 批的向量化与第 N 批的写入同时进行，内存中最多只保留少量批次的数据。
+        每个批次写入完成后保存检查点，任务中断后重新执行时只处理检查点之后的知识块。
+        """
         logger.info(f"开始为文件 {file_id} (数据库: {db_id}) 创建索引")
         if not self.check_embed_model(db_id):
             logger.error(f"文件 {file_id} 索引失败：向量模型不匹配。")
             self.update_file_status(file_id, "failed")
-            return {"status": "failed", "message": "向量模型不匹配"}
+            return {"status": "failed", "message": "向量模型不匹配", "retryable": False}
 
         try:
             self.update_file_status(file_id, "processing")
 
-            nodes_to_index = self.get_nodes_by_file(file_id)
-            if not nodes_to_index:
+            checkpoint_node_id, resuming = self._get_job_checkpoint(file_id)
+            with db_manager.get_session_context() as session:
+                total = session.query(func.count(KnowledgeNode.id)).filter(
+                    KnowledgeNode.file_id == file_id, KnowledgeNode.id > checkpoint_node_id).scalar()
+            if not total:
                 logger.warning(f"文件 {file_id} 没有找到需要索引的块。")
                 self.update_file_status(file_id, "done")
                 return {"status": "success", "message": "没有需要索引的块"}
 
-            docs_text = [node["text"] for node in nodes_to_index]
-
-            logger.info(f"正在为文件 {file_id} 的 {len(docs_text)} 个块生成向量...")
-            vectors = await self.embed_model.abatch_encode(docs_text)
-            logger.info(f"文件 {file_id} 的向量生成完毕。")
-
-            data_to_insert = []
-            for i, node in enumerate(nodes_to_index):
-                milvus_entry = {
-                    "id": node["id"],  # Using KnowledgeNode.id as Milvus PK
-                    "vector": vectors[i],
-                    "text": node["text"],
-                    "file_id": file_id, # Explicitly ensure file_id is present
-                    "hash": node["hash"],
-                     # Spread other metadata stored in node["meta_info"]
-                    **(node.get("meta_info") if isinstance(node.get("meta_info"), dict) else {})
-                }
-                # Ensure start_char_idx and end_char_idx are included if they exist directly on node dict
-                if "start_char_idx" in node and node["start_char_idx"] is not None:
-                    milvus_entry["start_char_idx"] = node["start_char_idx"]
-                if "end_char_idx" in node and node["end_char_idx"] is not None:
-                    milvus_entry["end_char_idx"] = node["end_char_idx"]
-
-                data_to_insert.append(milvus_entry)
+            if checkpoint_node_id:
+                logger.info(f"文件 {file_id} 从检查点 {checkpoint_node_id} 继续索引，剩余 {total} 个块")
 
-            if data_to_insert:
-                logger.info(f"正在将文件 {file_id} 的 {len(data_to_insert)} 个向量插入 Milvus 集合 {db_id}...")
-                self.client.insert(collection_name=db_id, data=data_to_insert)
-                logger.info(f"文件 {file_id} 的向量成功插入 Milvus。")
+            indexed = await self._run_indexing_pipeline(db_id, file_id, checkpoint_node_id, resuming, total)
 
+            logger.info(f"文件 {file_id} 的 {indexed} 个向量成功插入向量库 {db_id}。")
             self.update_file_status(file_id, "done")
             logger.info(f"文件 {file_id} 索引成功完成。")
             return {"status": "success", "message": "文件索引成功"}
@@ -1025,6 +1798,98 @@ class KnowledgeBase:
             self.update_file_status(file_id, "failed")
             return {"status": "failed", "message": f"索引失败: {str(e)}"}
 
+    def _load_node_batch(self, file_id, after_id, limit):
+        """按 ID 游标分页读取文件的知识块（ID 大于 after_id 的前 limit 个）"""
+        with db_manager.get_session_context() as session:
+            nodes = (session.query(KnowledgeNode)
+                     .filter(KnowledgeNode.file_id == file_id, KnowledgeNode.id > after_id)
+                     .order_by(KnowledgeNode.id).limit(limit).all())
+            return [node.to_dict() for node in nodes]
+
+    async def _run_indexing_pipeline(self, db_id, file_id, checkpoint_node_id, resuming, total):
+        """读取 -> 向量化 -> 写入 三阶段流水线，返回写入的块数"""
+        batch_size = config.indexing_batch_size
+        embed_queue = asyncio.Queue(maxsize=config.indexing_pipeline_depth)
+        insert_queue = asyncio.Queue(maxsize=config.indexing_pipeline_depth)
+        indexed = 0
+
+        async def load_stage():
+            last_id = checkpoint_node_id
+            while batch := await asyncio.to_thread(self._load_node_batch, file_id, last_id, batch_size):
+                await embed_queue.put(batch)
+                last_id = batch[-1]["id"]
+            await embed_queue.put(None)
+
+        async def embed_stage():
+            while (batch := await embed_queue.get()) is not None:
+                vectors = await self._aembed_with_cache([node["text"] for node in batch])
+                await insert_queue.put((batch, vectors))
+            await insert_queue.put(None)
+
+        async def insert_stage():
+            nonlocal indexed
+            while (item := await insert_queue.get()) is not None:
+                batch, vectors = item
+                data_to_insert = [self._build_vector_entry(file_id, node, vector) for node, vector in zip(batch, vectors)]
+
+                # 重试时上次中断的批次可能已经部分写入，先按 ID 删除避免重复
+                if resuming:
+                    await asyncio.to_thread(self.client.delete, collection_name=db_id,
+                                            filter=f"id in {[node['id'] for node in batch]}")
+
+                await asyncio.to_thread(self.client.insert, collection_name=db_id, data=data_to_insert)
+                self._bump_db_version(db_id)
+                self._save_job_checkpoint(file_id, batch[-1]["id"], len(batch))
+                indexed += len(batch)
+                logger.info(f"文件 {file_id} 已写入 {indexed}/{total} 个块")
+
+        stages = [asyncio.create_task(stage()) for stage in (load_stage, embed_stage, insert_stage)]
+        try:
+            await asyncio.gather(*stages)
+        finally:
+            # 任一阶段失败时取消其余阶段，避免阻塞在已满的队列上
+            for task in stages:
+                task.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+        return indexed
+
+    async def _aembed_with_cache(self, texts):
+        """向量化文本块，命中持久化缓存的直接复用，只对未命中的文本调用向量模型"""
+        embedding_cache = self._get_embedding_cache()
+        if embedding_cache is None:
+            return await self.embed_model.abatch_encode(texts)
+
+        model_name = self.embed_model.embed_model_fullname
+        hashes = [hashstr(text) for text in texts]
+        vectors = await asyncio.to_thread(embedding_cache.get_many, model_name, hashes)
+
+        missing = {h: text for h, text in zip(hashes, texts) if h not in vectors}  # 同一批次中的重复文本只向量化一次
+        if missing:
+            new_vectors = await self.embed_model.abatch_encode(list(missing.values()))
+            new_items = list(zip(missing.keys(), new_vectors))
+            await asyncio.to_thread(embedding_cache.set_many, model_name, new_items)
+            vectors.update(new_items)
+
+        logger.info(f"向量缓存命中 {len(texts) - len(missing)}/{len(texts)} 个块")
+        return [vectors[h] for h in hashes]
+
+    def _build_vector_entry(self, file_id, node, vector):
+        milvus_entry = {
+            "id": node["id"],  # Using KnowledgeNode.id as Milvus PK
+            "vector": vector,
+            "text": node["text"],
+            "file_id": file_id, # Explicitly ensure file_id is present
+            "hash": node["hash"],
+             # Spread other metadata stored in node["meta_info"]
+            **(node.get("meta_info") if isinstance(node.get("meta_info"), dict) else {})
+        }
+        # Ensure start_char_idx and end_char_idx are included if they exist directly on node dict
+        if "start_char_idx" in node and node["start_char_idx"] is not None:
+            milvus_entry["start_char_idx"] = node["start_char_idx"]
+        if "end_char_idx" in node and node["end_char_idx"] is not None:
+            milvus_entry["end_char_idx"] = node["end_char_idx"]
+        return milvus_entry
+
 
 def parse_node_data(node):
     # Handles both LlamaIndex NodeWithScore and simple dicts/BaseModel instances
@@ -1063,7 +1928,7 @@ def parse_node_data(node):
 
     node_dict = {
         "text": cleaned_text,
-        "hash": hashstr(cleaned_text, with_salt=True),
+        "hash": hashstr(cleaned_text),  # 内容哈希，相同文本的块哈希相同，用于向量缓存与文件更新时的差异比对
         "start_char_idx": start_char_idx,
         "end_char_idx": end_char_idx,
         "metadata": metadata, # Keep all original metadata
@@ -1071,6 +1936,24 @@ def parse_node_data(node):
     return node_dict
 
 
+def build_fts_match_query(query_text, max_terms=32):
+    """将查询文本转换为 FTS5 (trigram) 的 MATCH 表达式
+
+    英文、数字、产品编号等连续片段整体作为一个短语；中文片段切分为重叠的三字组，
+    各个词项之间使用 OR 连接，由 bm25 对命中词项更多的文本给出更高的分数。
+    trigram 分词要求每个词项至少包含 3 个字符，更短的词项会被忽略。
+    """
+    terms = []
+    for segment in re.findall(r"[\u4e00-\u9fff]+|[^\W_]+(?:[-_.][^\W_]+)*", str(query_text)):
+        if re.match(r"[\u4e00-\u9fff]", segment):
+            terms.extend(segment[i:i + 3] for i in range(max(len(segment) - 2, 0)))
+        elif len(segment) >= 3:
+            terms.append(segment)
+
+    terms = list(dict.fromkeys(terms))[:max_terms]
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
 def gen_filename_from_url(url):
     from urllib.parse import urlparse, unquote
     parsed_url = urlparse(unquote(url))
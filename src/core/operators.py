@@ -46,3 +46,10 @@ class HyDEOperator(BaseOperator):
         prompt = cls.template.format(query=query, context_str=context_str)
         response = model_callable(prompt)
         return response
+
+    @classmethod
+    async def acall(cls, model_callable, query, context_str, **kwargs):
+        """call 的异步版本，model_callable 为异步模型调用函数"""
+        prompt = cls.template.format(query=query, context_str=context_str)
+        response = await model_callable(prompt)
+        return response
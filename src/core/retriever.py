@@ -1,38 +1,201 @@
+import time
+import asyncio
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
 
 from src import config, knowledge_base, graph_base
-from src.models.rerank_model import get_reranker
+from src.models.rerank_model import get_reranker, close_reranker
 from src.utils.logging_config import logger
 from src.models import select_model
 from src.core.operators import HyDEOperator
 
+
+def cosine_similarity(a, b):
+    a, b = np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)
+    denom = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(a @ b / denom) if denom else 0.0
+
+
 class Retriever:
 
+    # 推测检索时，重写查询与原始查询的向量余弦相似度不低于该值则复用推测结果
+    speculative_similarity_threshold = 0.9
+
     def __init__(self):
+        self.speculation_stats = {"total": 0, "reused": 0, "research": 0}
+        self._speculation_lock = threading.Lock()
+        # 同步检索与推测检索使用的线程池在首次使用时创建，只走异步链路的服务不会启动这些线程
+        self._speculation_executor = None
+        self._retrieval_executor = None
+        self._executor_lock = threading.Lock()
+        self.retrieval_stats = {"timeouts": 0, "cancelled": 0, "abandoned": 0, "abandoned_running": 0}
+        self._retrieval_stats_lock = threading.Lock()
         self._load_models()
 
+    def _get_retrieval_executor(self):
+        """检索使用独立的有界线程池：超时的检索无法中断，继续运行时只占用检索线程，不影响索引等其他任务"""
+        with self._executor_lock:
+            if self._retrieval_executor is None:
+                self._retrieval_executor = ThreadPoolExecutor(
+                    max_workers=config.retrieval_max_workers, thread_name_prefix="retrieval")
+            return self._retrieval_executor
+
+    def _get_speculation_executor(self):
+        """推测检索中的查询重写使用独立的线程池：推测检索本身运行在检索线程池中，
+        如果在同一个有界线程池中提交任务并等待其结果，并发较高时所有线程都会等待排队中的任务而死锁"""
+        with self._executor_lock:
+            if self._speculation_executor is None:
+                self._speculation_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="speculative-rewrite")
+            return self._speculation_executor
+
     def _load_models(self):
-        if config.enable_reranker:
-            self.reranker = get_reranker()
+        # 重新加载时关闭旧的重排序模型，释放其线程池与 HTTP 连接
+        close_reranker(getattr(self, "reranker", None))
+        self.reranker = get_reranker() if config.enable_reranker else None
 
         if config.enable_web_search:
             from src.utils.web_search import WebSearcher
             self.web_searcher = WebSearcher()
 
     def retrieval(self, query, history, meta):
+        """并发检索各个数据源
+
+        知识库检索、网络搜索与“实体识别 -> 图数据库检索”三条链路相互独立，同时执行；
+        超过 retrieval_timeout 后不再等待，未完成的数据源返回空结果与超时提示。
+        """
+        refs = {"query": query, "history": history, "meta": meta}
+        refs["model_name"] = config.model_name
+        refs["entities"] = []
+        timeout = self._get_retrieval_timeout(meta)
+        start = time.time()
+
+        # 超时后后台任务可能仍在运行，实体识别结果先写入独立的字典，避免修改已经返回的 refs
+        chain_refs = {**refs}
+
+        def entities_then_graph():
+            chain_refs["entities"] = self.reco_entities(query, history, chain_refs)
+            return self.query_graph(query, history, chain_refs)
+
+        executor = self._get_retrieval_executor()
+        futures = {
+            "knowledge_base": executor.submit(self.query_knowledgebase, query, history, refs),
+            "graph_base": executor.submit(entities_then_graph),
+            "web_search": executor.submit(self.query_web, query, history, refs),
+        }
+        wait(futures.values(), timeout=timeout)
+
+        for source, future in futures.items():
+            if not future.done():
+                self._abandon_future(source, future)
+                refs[source] = self._partial_result(source, query, f"检索超时（{timeout}s）")
+            elif future.exception() is not None:
+                logger.error(f"Retrieval error in {source}: {future.exception()}")
+                refs[source] = self._partial_result(source, query, f"检索出错: {future.exception()}")
+            else:
+                refs[source] = future.result()
+
+        refs["entities"] = list(chain_refs["entities"])
+        refs["retrieval_time"] = round(time.time() - start, 3)
+        return refs
+
+    async def aretrieval(self, query, history, meta):
+        """retrieval 的异步版本"""
         refs = {"query": query, "history": history, "meta": meta}
         refs["model_name"] = config.model_name
-        refs["entities"] = self.reco_entities(query, history, refs)
-        refs["knowledge_base"] = self.query_knowledgebase(query, history, refs)
-        refs["graph_base"] = self.query_graph(query, history, refs)
-        refs["web_search"] = self.query_web(query, history, refs)
+        refs["entities"] = []
+        timeout = self._get_retrieval_timeout(meta)
+        start = time.time()
+
+        chain_refs = {**refs}
+
+        async def entities_then_graph():
+            chain_refs["entities"] = await self.areco_entities(query, history, chain_refs)
+            return await self.aquery_graph(query, history, chain_refs)
 
+        tasks = {
+            "knowledge_base": asyncio.create_task(self.aquery_knowledgebase(query, history, refs)),
+            "graph_base": asyncio.create_task(entities_then_graph()),
+            "web_search": asyncio.create_task(self.aquery_web(query, history, refs)),
+        }
+        try:
+            await asyncio.wait(tasks.values(), timeout=timeout)
+        except asyncio.CancelledError:
+            # 调用方被取消（例如客户端断开连接）时一并取消各数据源的检索，不再占用连接与模型调用
+            for task in tasks.values():
+                task.cancel()
+            raise
+
+        for source, task in tasks.items():
+            if not task.done():
+                task.cancel()
+                with self._retrieval_stats_lock:
+                    self.retrieval_stats["timeouts"] += 1
+                    self.retrieval_stats["cancelled"] += 1
+                refs[source] = self._partial_result(source, query, f"检索超时（{timeout}s）")
+            elif task.exception() is not None:
+                logger.error(f"Retrieval error in {source}: {task.exception()}")
+                refs[source] = self._partial_result(source, query, f"检索出错: {task.exception()}")
+            else:
+                refs[source] = task.result()
+
+        refs["entities"] = list(chain_refs["entities"])
+        refs["retrieval_time"] = round(time.time() - start, 3)
         return refs
 
+    def _abandon_future(self, source, future):
+        """处理超时的检索任务：尚未开始的直接取消；已经在运行的线程无法中断，记录后等待其自行结束"""
+        cancelled = future.cancel()
+        with self._retrieval_stats_lock:
+            self.retrieval_stats["timeouts"] += 1
+            if cancelled:
+                self.retrieval_stats["cancelled"] += 1
+                return
+            self.retrieval_stats["abandoned"] += 1
+            self.retrieval_stats["abandoned_running"] += 1
+
+        logger.warning(f"Retrieval of {source} timed out and keeps running in the background, "
+                       f"{self.retrieval_stats['abandoned_running']} abandoned retrievals still running")
+
+        def on_done(_):
+            with self._retrieval_stats_lock:
+                self.retrieval_stats["abandoned_running"] -= 1
+
+        future.add_done_callback(on_done)
+
+    def get_retrieval_stats(self):
+        with self._retrieval_stats_lock:
+            return dict(self.retrieval_stats)
+
+    def _get_retrieval_timeout(self, meta):
+        timeout = meta.get("retrieval_timeout", config.retrieval_timeout)
+        return float(timeout) if timeout else None
+
+    def _partial_result(self, source, query, message):
+        """未能在截止时间内完成（或出错）的数据源对应的空结果"""
+        if source == "knowledge_base":
+            return {"results": [], "all_results": [], "rw_query": query, "message": message}
+        if source == "graph_base":
+            return {"results": {"nodes": [], "edges": []}, "message": message}
+        return {"results": [], "message": message}
+
     def restart(self):
         """所有需要重启的模型"""
         self._load_models()
 
+    def shutdown(self):
+        """服务关闭时释放重排序模型与检索线程池"""
+        close_reranker(self.reranker)
+        self.reranker = None
+        with self._executor_lock:
+            executors = [self._retrieval_executor, self._speculation_executor]
+            self._retrieval_executor = self._speculation_executor = None
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
     def construct_query(self, query, refs, meta):
         logger.debug(f"{refs=}")
         if not refs or len(refs) == 0:
@@ -86,6 +249,9 @@ class Retriever:
                     results.extend(result)
         return {"results": graph_base.format_query_result_to_graph(results)}
 
+    async def aquery_graph(self, query, history, refs):
+        """neo4j 驱动为同步接口，在线程中执行"""
+        return await asyncio.to_thread(self.query_graph, query, history, refs)
 
     def query_knowledgebase(self, query, history, refs):
         """查询知识库"""
@@ -99,27 +265,178 @@ class Retriever:
 
         meta = refs["meta"]
 
-        db_id = meta.get("db_id")
+        # db_ids 为列表时在多个知识库中联合检索
+        db_id = meta.get("db_ids") or meta.get("db_id")
         if not db_id or not config.enable_knowledge_base:
             response["message"] = "知识库未启用、或未指定知识库、或知识库不存在"
             return response
 
+        logger.debug(f"{meta=}")
+        if self._use_speculative_retrieval(refs):
+            return self._speculative_query_knowledgebase(query, history, refs, db_id, response)
+
+        start = time.time()
         rw_query = self.rewrite_query(query, history, refs)
+        rewrite_done = time.time()
+        query_result = knowledge_base.query(query_text=rw_query, db_id=db_id, **self._kb_query_params(meta))
+
+        response["results"] = query_result["results"]
+        response["all_results"] = query_result["all_results"]
+        response["rw_query"] = rw_query
+        response["timings"] = {
+            "rewrite": round(rewrite_done - start, 3),
+            "search": round(time.time() - rewrite_done, 3),
+        }
+
+        return response
+
+    async def aquery_knowledgebase(self, query, history, refs):
+        """query_knowledgebase 的异步版本"""
+
+        response = {
+            "results": [],
+            "all_results": [],
+            "rw_query": query,
+            "message": "",
+        }
+
+        meta = refs["meta"]
+
+        db_id = meta.get("db_ids") or meta.get("db_id")
+        if not db_id or not config.enable_knowledge_base:
+            response["message"] = "知识库未启用、或未指定知识库、或知识库不存在"
+            return response
 
         logger.debug(f"{meta=}")
-        query_result = knowledge_base.query(query_text=rw_query,
-                                            db_id=db_id,
-                                            distance_threshold=meta.get("distanceThreshold", 0.5),
-                                            rerank_threshold=meta.get("rerankThreshold", 0.1),
-                                            max_query_count=meta.get("maxQueryCount", 20),
-                                            top_k=meta.get("topK", 10))
+        if self._use_speculative_retrieval(refs):
+            return await self._aspeculative_query_knowledgebase(query, history, refs, db_id, response)
+
+        start = time.time()
+        rw_query = await self.arewrite_query(query, history, refs)
+        rewrite_done = time.time()
+        query_result = await knowledge_base.aquery(query_text=rw_query, db_id=db_id, **self._kb_query_params(meta))
 
         response["results"] = query_result["results"]
         response["all_results"] = query_result["all_results"]
         response["rw_query"] = rw_query
+        response["timings"] = {
+            "rewrite": round(rewrite_done - start, 3),
+            "search": round(time.time() - rewrite_done, 3),
+        }
 
         return response
 
+    def _kb_query_params(self, meta):
+        return {
+            "distance_threshold": meta.get("distanceThreshold", 0.5),
+            "rerank_threshold": meta.get("rerankThreshold", 0.1),
+            "max_query_count": meta.get("maxQueryCount", 20),
+            "top_k": meta.get("topK", 10),
+            "search_mode": meta.get("searchMode", config.kb_search_mode),
+        }
+
+    def _use_speculative_retrieval(self, refs):
+        """只有开启了查询重写时推测检索才有意义"""
+        speculative = refs["meta"].get("speculative_retrieval", config.speculative_retrieval)
+        return bool(speculative) and self._get_rewrite_span(refs) != "off"
+
+    def _speculative_query_knowledgebase(self, query, history, refs, db_id, response):
+        """推测检索：在重写查询的同时使用原始查询检索知识库
+
+        重写完成后，如果重写后的查询与原始查询的向量足够相似，直接复用推测检索的结果，
+        否则使用重写后的查询重新检索。
+        """
+        params = self._kb_query_params(refs["meta"])
+        start = time.time()
+        rewrite_future = self._get_speculation_executor().submit(self.rewrite_query, query, history, refs)
+
+        speculative_result = knowledge_base.query(query_text=query, db_id=db_id, **params)
+        speculative_done = time.time()
+        rw_query = rewrite_future.result()
+        rewrite_done = time.time()
+
+        reused, similarity, rw_vector = self._check_speculation(
+            query, rw_query,
+            lambda: (knowledge_base.embed_model.encode_query(query), knowledge_base.embed_model.encode_query(rw_query)))
+        if reused:
+            query_result = speculative_result
+        else:
+            query_result = knowledge_base.query(query_text=rw_query, db_id=db_id, query_vector=rw_vector, **params)
+
+        return self._speculative_response(response, query_result, rw_query, reused, similarity,
+                                          start, speculative_done, rewrite_done)
+
+    async def _aspeculative_query_knowledgebase(self, query, history, refs, db_id, response):
+        """_speculative_query_knowledgebase 的异步版本"""
+        params = self._kb_query_params(refs["meta"])
+        start = time.time()
+        rewrite_task = asyncio.create_task(self.arewrite_query(query, history, refs))
+
+        try:
+            speculative_result = await knowledge_base.aquery(query_text=query, db_id=db_id, **params)
+        except BaseException:
+            rewrite_task.cancel()
+            raise
+        speculative_done = time.time()
+        rw_query = await rewrite_task
+        rewrite_done = time.time()
+
+        async def embed_both():
+            return await asyncio.gather(knowledge_base.embed_model.aencode_query(query),
+                                        knowledge_base.embed_model.aencode_query(rw_query))
+
+        reused, similarity, rw_vector = await self._acheck_speculation(query, rw_query, embed_both)
+        if reused:
+            query_result = speculative_result
+        else:
+            query_result = await knowledge_base.aquery(query_text=rw_query, db_id=db_id, query_vector=rw_vector, **params)
+
+        return self._speculative_response(response, query_result, rw_query, reused, similarity,
+                                          start, speculative_done, rewrite_done)
+
+    def _check_speculation(self, query, rw_query, embed_both):
+        """返回 (是否复用推测结果, 相似度, 重写查询的向量)"""
+        if rw_query == query:
+            return self._record_speculation(True), 1.0, None
+
+        raw_vector, rw_vector = embed_both()
+        similarity = cosine_similarity(raw_vector, rw_vector)
+        return self._record_speculation(similarity >= self.speculative_similarity_threshold), similarity, rw_vector
+
+    async def _acheck_speculation(self, query, rw_query, embed_both):
+        if rw_query == query:
+            return self._record_speculation(True), 1.0, None
+
+        raw_vector, rw_vector = await embed_both()
+        similarity = cosine_similarity(raw_vector, rw_vector)
+        return self._record_speculation(similarity >= self.speculative_similarity_threshold), similarity, rw_vector
+
+    def _record_speculation(self, reused):
+        with self._speculation_lock:
+            self.speculation_stats["total"] += 1
+            self.speculation_stats["reused" if reused else "research"] += 1
+        return reused
+
+    def get_speculation_stats(self):
+        with self._speculation_lock:
+            stats = dict(self.speculation_stats)
+        stats["reuse_ratio"] = round(stats["reused"] / stats["total"], 4) if stats["total"] else 0.0
+        return stats
+
+    def _speculative_response(self, response, query_result, rw_query, reused, similarity,
+                              start, speculative_done, rewrite_done):
+        response["results"] = query_result["results"]
+        response["all_results"] = query_result["all_results"]
+        response["rw_query"] = rw_query
+        response["speculation"] = {"reused": reused, "similarity": round(float(similarity), 4)}
+        response["timings"] = {
+            "speculative_search": round(speculative_done - start, 3),
+            "rewrite": round(rewrite_done - start, 3),
+            "search": round(time.time() - rewrite_done, 3),
+            "total": round(time.time() - start, 3),
+        }
+        return response
+
     def query_web(self, query, history, refs):
         """查询网络"""
 
@@ -134,15 +451,21 @@ class Retriever:
 
         return {"results": search_results}
 
+    async def aquery_web(self, query, history, refs):
+        """tavily 客户端为同步接口，在线程中执行"""
+        return await asyncio.to_thread(self.query_web, query, history, refs)
+
+    def _get_rewrite_span(self, refs):
+        if refs["meta"].get("mode") == "search":  # 如果是搜索模式，就使用 meta 的配置，否则就使用全局的配置
+            return refs["meta"].get("use_rewrite_query", "off")
+        return config.use_rewrite_query
+
     def rewrite_query(self, query, history, refs):
         """重写查询"""
         model_provider = config.model_provider
         model_name = config.model_name
         model = select_model(model_provider=model_provider, model_name=model_name)
-        if refs["meta"].get("mode") == "search":  # 如果是搜索模式，就使用 meta 的配置，否则就使用全局的配置
-            rewrite_query_span = refs["meta"].get("use_rewrite_query", "off")
-        else:
-            rewrite_query_span = config.use_rewrite_query
+        rewrite_query_span = self._get_rewrite_span(refs)
 
         if rewrite_query_span == "off":
             return query
@@ -158,6 +481,27 @@ class Retriever:
 
         return rewritten_query
 
+    async def arewrite_query(self, query, history, refs):
+        """rewrite_query 的异步版本"""
+        model_provider = config.model_provider
+        model_name = config.model_name
+        model = select_model(model_provider=model_provider, model_name=model_name)
+        rewrite_query_span = self._get_rewrite_span(refs)
+
+        if rewrite_query_span == "off":
+            return query
+
+        from src.utils.prompts import rewritten_query_prompt_template2 as rw_template
+        history_query = [entry["content"] for entry in history if entry["role"] == "user"] if history else ""
+        rewritten_query_prompt = rw_template.format(history=history_query, query=query)
+        rewritten_query = (await model.apredict(rewritten_query_prompt)).content
+
+        if rewrite_query_span == "hyde":
+            res = await HyDEOperator.acall(model_callable=model.apredict, query=query, context_str=history_query)
+            rewritten_query = res.content
+
+        return rewritten_query
+
     def reco_entities(self, query, history, refs):
         """识别句子中的实体"""
         query = refs.get("rewritten_query", query)
@@ -176,7 +520,26 @@ class Retriever:
 
         return entities
 
+    async def areco_entities(self, query, history, refs):
+        """reco_entities 的异步版本"""
+        query = refs.get("rewritten_query", query)
+
+        entities = []
+        if refs["meta"].get("use_graph"):
+            from src.utils.prompts import entity_extraction_prompt_template as entity_template
+
+            model = select_model(model_provider=config.model_provider, model_name=config.model_name)
+            entity_extraction_prompt = entity_template.format(text=query)
+            entities = (await model.apredict(entity_extraction_prompt)).content.split("<->")
+
+        return entities
+
     def __call__(self, query, history, meta):
         refs = self.retrieval(query, history, meta)
         query = self.construct_query(query, refs, meta)
         return query, refs
+
+    async def acall(self, query, history, meta):
+        refs = await self.aretrieval(query, history, meta)
+        query = self.construct_query(query, refs, meta)
+        return query, refs
@@ -0,0 +1,522 @@
+"""
+向量数据库后端
+
+知识库通过 `self.client` 访问向量数据库，这里定义了它所需的接口（方法名与参数与 MilvusClient 保持一致），
+并提供两个实现：
+- MilvusVectorStore: 基于 Milvus 服务
+- LocalVectorStore: 进程内的本地向量库，向量以 float32 矩阵的形式存放在内存映射文件中，
+  默认使用 NumPy 暴力检索，集合规模超过阈值且安装了 hnswlib 时自动切换为 HNSW 索引
+"""
+
+import os
+import re
+import json
+import shutil
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from src.utils import logger
+
+
+class BaseVectorStore(ABC):
+    """向量数据库接口，距离统一为余弦相似度，越大越相似"""
+
+    @abstractmethod
+    def list_collections(self) -> list[str]:
+        ...
+
+    @abstractmethod
+    def has_collection(self, collection_name) -> bool:
+        ...
+
+    @abstractmethod
+    def create_collection(self, collection_name, dimension, **kwargs):
+        ...
+
+    @abstractmethod
+    def drop_collection(self, collection_name):
+        ...
+
+    @abstractmethod
+    def describe_collection(self, collection_name) -> dict:
+        ...
+
+    @abstractmethod
+    def get_collection_stats(self, collection_name) -> dict:
+        ...
+
+    @abstractmethod
+    def insert(self, collection_name, data):
+        """插入数据，data 为字典列表，每条数据需包含 id 和 vector 字段"""
+        ...
+
+    @abstractmethod
+    def delete(self, collection_name, filter):
+        """按过滤表达式删除数据，例如 `file_id == 'xxx'`"""
+        ...
+
+    @abstractmethod
+    def search(self, collection_name, data, limit=10, output_fields=None, **kwargs) -> list[list]:
+        """向量检索，返回每个查询向量对应的命中列表，命中项可通过 id / distance / entity 访问"""
+        ...
+
+    async def asearch(self, collection_name, data, limit=10, output_fields=None, **kwargs) -> list[list]:
+        """异步向量检索，默认在线程中执行 search"""
+        return await asyncio.to_thread(self.search, collection_name, data, limit, output_fields, **kwargs)
+
+    @abstractmethod
+    def query(self, collection_name, filter="", output_fields=None, limit=None, **kwargs) -> list[dict]:
+        ...
+
+    @abstractmethod
+    def get(self, collection_name, ids, output_fields=None, **kwargs) -> list[dict]:
+        ...
+
+
+class MilvusVectorStore(BaseVectorStore):
+    """Milvus 后端，直接转发给 MilvusClient"""
+
+    def __init__(self, uri):
+        from pymilvus import MilvusClient
+        self.uri = uri
+        self.client = MilvusClient(uri=uri)
+        self._async_client = None
+        self._async_client_loop = None
+
+    def _get_async_client(self):
+        """AsyncMilvusClient 与事件循环绑定，事件循环变化时重新创建"""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            from pymilvus import AsyncMilvusClient
+            self._async_client = AsyncMilvusClient(uri=self.uri)
+            self._async_client_loop = loop
+        return self._async_client
+
+    def list_collections(self):
+        return self.client.list_collections()
+
+    def has_collection(self, collection_name):
+        return self.client.has_collection(collection_name=collection_name)
+
+    def create_collection(self, collection_name, dimension, **kwargs):
+        return self.client.create_collection(collection_name=collection_name, dimension=dimension, **kwargs)
+
+    def drop_collection(self, collection_name):
+        return self.client.drop_collection(collection_name=collection_name)
+
+    def describe_collection(self, collection_name):
+        return self.client.describe_collection(collection_name)
+
+    def get_collection_stats(self, collection_name):
+        return self.client.get_collection_stats(collection_name)
+
+    def insert(self, collection_name, data):
+        return self.client.insert(collection_name=collection_name, data=data)
+
+    def delete(self, collection_name, filter):
+        return self.client.delete(collection_name=collection_name, filter=filter)
+
+    def search(self, collection_name, data, limit=10, output_fields=None, **kwargs):
+        return self.client.search(collection_name=collection_name, data=data, limit=limit, output_fields=output_fields, **kwargs)
+
+    async def asearch(self, collection_name, data, limit=10, output_fields=None, **kwargs):
+        try:
+            client = self._get_async_client()
+        except ImportError:
+            logger.warning("当前 pymilvus 版本不支持 AsyncMilvusClient，使用线程执行同步检索")
+            return await super().asearch(collection_name, data, limit, output_fields, **kwargs)
+        return await client.search(collection_name=collection_name, data=data, limit=limit, output_fields=output_fields, **kwargs)
+
+    def query(self, collection_name, filter="", output_fields=None, limit=None, **kwargs):
+        if limit is not None:
+            kwargs["limit"] = limit
+        return self.client.query(collection_name=collection_name, filter=filter, output_fields=output_fields, **kwargs)
+
+    def get(self, collection_name, ids, output_fields=None, **kwargs):
+        return self.client.get(collection_name, ids, output_fields=output_fields, **kwargs)
+
+
+class LocalHit(dict):
+    """与 Milvus 检索结果一致的命中项，支持 hit.id / hit.distance / hit.entity 访问"""
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError as e:
+            raise AttributeError(key) from e
+
+
+_FILTER_EQ = re.compile(r"^\s*(\w+)\s*==\s*(.+?)\s*$")
+_FILTER_IN = re.compile(r"^\s*(\w+)\s+in\s+\[(.*)\]\s*$", re.IGNORECASE)
+
+
+def parse_filter(expr):
+    """解析简单的 Milvus 过滤表达式，支持 `field == value` 与 `field in [v1, v2]`"""
+    if not expr or not expr.strip():
+        return lambda entity: True
+
+    if match := _FILTER_IN.match(expr):
+        field, values = match.group(1), match.group(2)
+        values = set(json.loads(f"[{values.replace(chr(39), chr(34))}]"))
+        return lambda entity: entity.get(field) in values
+
+    if match := _FILTER_EQ.match(expr):
+        field, value = match.group(1), json.loads(match.group(2).replace("'", '"'))
+        return lambda entity: entity.get(field) == value
+
+    raise ValueError(f"Unsupported filter expression for local vector store: {expr}")
+
+
+class _LocalCollection:
+    """单个本地集合
+
+    - vectors.<generation>.f32: 形状为 (capacity, dimension) 的 float32 内存映射矩阵，写入前已做 L2 归一化
+    - entities.<generation>.jsonl: 只追加的实体日志，每行一条插入记录 {"row", "entity"} 或删除记录 {"delete": [rows]}
+    - meta.json: 维度与当前的 generation
+
+    每次写入只追加日志，不重写已有数据。写入顺序固定为先写向量并 flush，再追加日志并 fsync，
+    某一行是否存在以日志为准，因此崩溃时最多留下未被引用的向量行；日志末尾不完整的记录在加载时截断。
+    压缩时写出新一代的矩阵与日志后原子替换 meta.json 切换 generation，再删除旧文件。
+    """
+
+    def __init__(self, path, dimension=None, hnsw_threshold=20000):
+        self.path = path
+        self.hnsw_threshold = hnsw_threshold
+        self.lock = threading.RLock()
+        self.hnsw_index = None
+
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dimension, self.generation = meta["dimension"], meta["generation"]
+            self.capacity = os.path.getsize(self.vectors_path) // (4 * self.dimension)
+            self.entities = self._replay_log()
+            self._remove_stale_files()
+        else:
+            assert dimension, "dimension is required when creating a collection"
+            os.makedirs(path, exist_ok=True)
+            self.dimension, self.generation, self.capacity = int(dimension), 0, 1024
+            self.entities = []
+            np.memmap(self.vectors_path, dtype=np.float32, mode="w+", shape=(self.capacity, self.dimension)).flush()
+            open(self.log_path, "a").close()
+            self._write_meta()
+
+        self.size = len(self.entities)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dimension))
+        self.id_to_row = {entity["id"]: row for row, entity in enumerate(self.entities) if entity is not None}
+
+    def _file_path(self, kind, generation=None):
+        generation = self.generation if generation is None else generation
+        return os.path.join(self.path, f"{kind}.{generation}.{'f32' if kind == 'vectors' else 'jsonl'}")
+
+    @property
+    def vectors_path(self):
+        return self._file_path("vectors")
+
+    @property
+    def log_path(self):
+        return self._file_path("entities")
+
+    @property
+    def row_count(self):
+        return len(self.id_to_row)
+
+    def _write_meta(self):
+        tmp_path = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dimension": self.dimension, "generation": self.generation}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.path, "meta.json"))
+
+    def _replay_log(self):
+        """重放实体日志，截断末尾写入不完整的记录"""
+        entities, valid_bytes = [], 0
+        with open(self.log_path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    break
+                if not line.endswith(b"\n"):
+                    break
+
+                if "delete" in record:
+                    for row in record["delete"]:
+                        entities[row] = None
+                else:
+                    row = record["row"]
+                    entities.extend([None] * (row + 1 - len(entities)))
+                    entities[row] = record["entity"]
+                valid_bytes += len(line)
+
+        if valid_bytes < os.path.getsize(self.log_path):
+            logger.warning(f"Local vector collection {self.path}: truncating incomplete log tail")
+            with open(self.log_path, "r+b") as f:
+                f.truncate(valid_bytes)
+        return entities
+
+    def _remove_stale_files(self):
+        """删除压缩过程中崩溃留下的其他 generation 的文件与临时文件"""
+        current = {os.path.basename(self.vectors_path), os.path.basename(self.log_path), "meta.json"}
+        for name in os.listdir(self.path):
+            if name not in current and (name.startswith(("vectors.", "entities.")) or name.endswith(".tmp")):
+                os.remove(os.path.join(self.path, name))
+
+    def _append_log(self, records):
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _resize(self, capacity):
+        """按新的容量重建内存映射文件，保留全部已使用行"""
+        tmp_path = self.vectors_path + ".tmp"
+        new_vectors = np.memmap(tmp_path, dtype=np.float32, mode="w+", shape=(capacity, self.dimension))
+        if self.size:
+            new_vectors[:self.size] = self.vectors[:self.size]
+        new_vectors.flush()
+        del new_vectors, self.vectors
+        os.replace(tmp_path, self.vectors_path)
+        self.capacity = capacity
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dimension))
+
+    def insert(self, data):
+        with self.lock:
+            # 与 upsert 语义一致：相同 id 的旧数据会被替换
+            replaced_rows = [self.id_to_row[item["id"]] for item in data if item["id"] in self.id_to_row]
+
+            if self.size + len(data) > self.capacity:
+                capacity = self.capacity
+                while self.size + len(data) > capacity:
+                    capacity *= 2
+                self._resize(capacity)
+
+            vectors = np.asarray([item["vector"] for item in data], dtype=np.float32).reshape(len(data), self.dimension)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms == 0, 1, norms)
+
+            start = self.size
+            self.vectors[start:start + len(data)] = vectors
+            self.vectors.flush()
+
+            entities = [{k: v for k, v in item.items() if k != "vector"} for item in data]
+            records = [{"delete": replaced_rows}] if replaced_rows else []
+            records += [{"row": start + offset, "entity": entity} for offset, entity in enumerate(entities)]
+            self._append_log(records)
+
+            self._delete_rows(replaced_rows)
+            for offset, entity in enumerate(entities):
+                self.entities.append(entity)
+                self.id_to_row[entity["id"]] = start + offset
+            self.size += len(data)
+
+            if self.hnsw_index is not None:
+                self._hnsw_add(np.arange(start, self.size))
+
+            return {"insert_count": len(data)}
+
+    def delete(self, predicate):
+        with self.lock:
+            rows = [row for row in self.id_to_row.values() if predicate(self.entities[row])]
+            if rows:
+                self._append_log([{"delete": rows}])
+                self._delete_rows(rows)
+                self._maybe_compact()
+            return rows
+
+    def _delete_rows(self, rows):
+        for row in rows:
+            entity = self.entities[row]
+            self.id_to_row.pop(entity["id"], None)
+            self.entities[row] = None
+            if self.hnsw_index is not None:
+                self.hnsw_index.mark_deleted(row)
+
+    def _maybe_compact(self):
+        """被删除的行超过 30% 时压缩矩阵与日志，回收空间"""
+        deleted = self.size - self.row_count
+        if deleted >= 1000 and deleted >= 0.3 * self.size:
+            self.compact()
+
+    def compact(self):
+        """写出只包含存活行的新一代矩阵与日志，替换 meta.json 后切换，再删除旧文件"""
+        with self.lock:
+            rows = np.array(sorted(self.id_to_row.values()), dtype=np.int64)
+            deleted = self.size - len(rows)
+            old_files = (self.vectors_path, self.log_path)
+            new_generation = self.generation + 1
+            capacity = max(1024, int(len(rows) * 1.5))
+
+            new_vectors = np.memmap(self._file_path("vectors", new_generation), dtype=np.float32, mode="w+",
+                                    shape=(capacity, self.dimension))
+            if len(rows):
+                new_vectors[:len(rows)] = self.vectors[rows]
+            new_vectors.flush()
+            del new_vectors
+
+            entities = [self.entities[row] for row in rows]
+            with open(self._file_path("entities", new_generation), "w", encoding="utf-8") as f:
+                f.write("".join(json.dumps({"row": row, "entity": entity}, ensure_ascii=False) + "\n"
+                                for row, entity in enumerate(entities)))
+                f.flush()
+                os.fsync(f.fileno())
+
+            # meta.json 替换完成即切换到新一代文件
+            self.generation = new_generation
+            self._write_meta()
+
+            del self.vectors
+            for old_file in old_files:
+                os.remove(old_file)
+
+            self.capacity = capacity
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dimension))
+            self.entities = entities
+            self.id_to_row = {entity["id"]: row for row, entity in enumerate(self.entities)}
+            self.size = len(rows)
+            self.hnsw_index = None  # 行号已变化，下次检索时重建
+            logger.info(f"Local vector collection {self.path} compacted, {deleted} deleted rows removed")
+
+    def _hnsw_add(self, rows):
+        self.hnsw_index.resize_index(max(self.hnsw_index.get_max_elements(), self.capacity))
+        self.hnsw_index.add_items(np.asarray(self.vectors[rows]), rows)
+
+    def _ensure_hnsw(self):
+        """集合规模超过阈值时构建 HNSW 索引，hnswlib 为可选依赖，未安装时保持暴力检索"""
+        if self.hnsw_index is not None or self.row_count < self.hnsw_threshold:
+            return self.hnsw_index
+
+        try:
+            import hnswlib
+        except ImportError:
+            return None
+
+        index = hnswlib.Index(space="ip", dim=self.dimension)
+        index.init_index(max_elements=self.capacity, ef_construction=200, M=16)
+        self.hnsw_index = index
+        self._hnsw_add(np.array(sorted(self.id_to_row.values()), dtype=np.int64))
+        logger.info(f"HNSW index built for {self.path} with {self.row_count} vectors")
+        return self.hnsw_index
+
+    def search(self, vector, limit, output_fields=None):
+        with self.lock:
+            if self.row_count == 0:
+                return []
+
+            query = np.asarray(vector, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1)
+            limit = min(limit, self.row_count)
+
+            if (index := self._ensure_hnsw()) is not None:
+                index.set_ef(max(limit * 2, 64))
+                labels, distances = index.knn_query(query, k=limit)
+                rows, scores = labels[0], 1 - distances[0]
+            else:
+                scores = self.vectors[:self.size] @ query
+                alive = np.zeros(self.size, dtype=bool)
+                alive[list(self.id_to_row.values())] = True
+                scores = np.where(alive, scores, -np.inf)
+                rows = np.argpartition(-scores, limit - 1)[:limit]
+                rows = rows[np.argsort(-scores[rows])]
+                scores = scores[rows]
+
+            return [LocalHit(
+                id=self.entities[row]["id"],
+                distance=float(score),
+                entity=_select_fields(self.entities[row], output_fields),
+            ) for row, score in zip(rows, scores)]
+
+
+def _select_fields(entity, output_fields):
+    if not output_fields:
+        return dict(entity)
+    return {k: entity.get(k) for k in output_fields}
+
+
+class LocalVectorStore(BaseVectorStore):
+    """进程内本地向量库，无需额外部署 Milvus，适用于小规模知识库与离线测试"""
+
+    def __init__(self, work_dir, hnsw_threshold=20000):
+        self.work_dir = work_dir
+        self.hnsw_threshold = hnsw_threshold
+        self.lock = threading.Lock()
+        self.collections: dict[str, _LocalCollection] = {}
+        os.makedirs(work_dir, exist_ok=True)
+
+    def _get(self, collection_name) -> _LocalCollection:
+        with self.lock:
+            if collection_name not in self.collections:
+                path = os.path.join(self.work_dir, collection_name)
+                if not os.path.exists(os.path.join(path, "meta.json")):
+                    raise ValueError(f"Collection {collection_name} not found")
+                self.collections[collection_name] = _LocalCollection(path, hnsw_threshold=self.hnsw_threshold)
+            return self.collections[collection_name]
+
+    def list_collections(self):
+        return sorted(name for name in os.listdir(self.work_dir) if os.path.exists(os.path.join(self.work_dir, name, "meta.json")))
+
+    def has_collection(self, collection_name):
+        return os.path.exists(os.path.join(self.work_dir, collection_name, "meta.json"))
+
+    def create_collection(self, collection_name, dimension, **kwargs):
+        with self.lock:
+            path = os.path.join(self.work_dir, collection_name)
+            self.collections[collection_name] = _LocalCollection(path, dimension=dimension, hnsw_threshold=self.hnsw_threshold)
+
+    def drop_collection(self, collection_name):
+        with self.lock:
+            self.collections.pop(collection_name, None)
+            shutil.rmtree(os.path.join(self.work_dir, collection_name), ignore_errors=True)
+
+    def describe_collection(self, collection_name):
+        collection = self._get(collection_name)
+        return {
+            "collection_name": collection_name,
+            "description": "",
+            "fields": [
+                {"name": "id", "type": "INT64", "is_primary": True},
+                {"name": "vector", "type": "FLOAT_VECTOR", "params": {"dim": collection.dimension}},
+            ],
+            "index": "hnsw" if collection.hnsw_index is not None else "flat",
+        }
+
+    def get_collection_stats(self, collection_name):
+        return {"row_count": self._get(collection_name).row_count}
+
+    def insert(self, collection_name, data):
+        return self._get(collection_name).insert(data)
+
+    def delete(self, collection_name, filter):
+        return self._get(collection_name).delete(parse_filter(filter))
+
+    def search(self, collection_name, data, limit=10, output_fields=None, **kwargs):
+        collection = self._get(collection_name)
+        return [collection.search(vector, limit, output_fields) for vector in data]
+
+    def query(self, collection_name, filter="", output_fields=None, limit=None, **kwargs):
+        collection = self._get(collection_name)
+        predicate = parse_filter(filter)
+        with collection.lock:
+            results = []
+            for row in sorted(collection.id_to_row.values()):
+                entity = collection.entities[row]
+                if predicate(entity):
+                    item = _select_fields(entity, output_fields)
+                    if not output_fields or "vector" in output_fields:
+                        item["vector"] = collection.vectors[row].tolist()
+                    results.append(item)
+                    if limit and len(results) >= limit:
+                        break
+            return results
+
+    def get(self, collection_name, ids, output_fields=None, **kwargs):
+        ids = ids if isinstance(ids, list) else [ids]
+        collection = self._get(collection_name)
+        with collection.lock:
+            return [_select_fields(collection.entities[collection.id_to_row[_id]], output_fields)
+                    for _id in ids if _id in collection.id_to_row]
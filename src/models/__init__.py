@@ -1,22 +1,63 @@
 import os
+import threading
 import traceback
 
 from src import config
 from src.utils.logging_config import logger
 from src.models.chat_model import OpenAIBase
 
+# 模型客户端缓存：key 为 (provider, model_name, base_url, api_key)
+# 复用 OpenAI / ChatOpenAI 客户端及其连接池，避免每次调用都重新建立连接
+_model_cache = {}
+_model_cache_lock = threading.Lock()
+
+
+def clear_model_cache():
+    """清空模型客户端缓存，修改模型配置或重启服务后调用"""
+    with _model_cache_lock:
+        _model_cache.clear()
+
+
+def _model_cache_key(model_provider, model_name):
+    """解析模型连接信息，与 _create_model 中各分支的取值保持一致"""
+    model_info = config.model_names.get(model_provider, {})
+    if model_provider == "qianfan":
+        return (model_provider, model_name, None, os.getenv("QIANFAN_ACCESS_KEY"))
+
+    if model_provider == "openai":
+        return (model_provider, model_name, os.getenv("OPENAI_API_BASE"), os.getenv("OPENAI_API_KEY"))
+
+    if model_provider == "custom":
+        custom_info = next((x for x in config.custom_models if x["custom_id"] == model_name), None) or {}
+        return (model_provider, model_name, custom_info.get("api_base"), custom_info.get("api_key"))
+
+    env = model_info.get("env") or [None]
+    return (model_provider, model_name, model_info.get("base_url"), os.getenv(env[0]) if env[0] else None)
+
+
 def select_model(model_provider=None, model_name=None):
-    """根据模型提供者选择模型"""
+    """根据模型提供者选择模型，相同连接信息的模型实例在进程内复用"""
     model_provider = model_provider or config.model_provider
     model_info = config.model_names.get(model_provider, {})
     model_name = model_name or config.model_name or model_info.get("default", "")
 
+    if model_provider is None:
+        raise ValueError("Model provider not specified, please modify `model_provider` in `src/config/base.yaml`")
 
-    logger.info(f"Selecting model from `{model_provider}` with `{model_name}`")
+    key = _model_cache_key(model_provider, model_name)
+    with _model_cache_lock:
+        if (model := _model_cache.get(key)) is not None:
+            return model
 
+        model = _create_model(model_provider, model_name)
+        _model_cache[key] = model
+        return model
 
-    if model_provider is None:
-        raise ValueError("Model provider not specified, please modify `model_provider` in `src/config/base.yaml`")
+
+def _create_model(model_provider, model_name):
+    model_info = config.model_names.get(model_provider, {})
+
+    logger.info(f"Selecting model from `{model_provider}` with `{model_name}`")
 
     if model_provider == "qianfan":
         from src.models.chat_model import Qianfan
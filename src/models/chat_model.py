@@ -1,6 +1,7 @@
 import os
+import asyncio
 import requests
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from src.utils import logger, get_docker_safe_url
 from langchain_openai import ChatOpenAI
 
@@ -9,6 +10,7 @@ class OpenAIBase:
         self.api_key = api_key
         self.base_url = base_url
         self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self.async_client = AsyncOpenAI(api_key=api_key, base_url=base_url)
         self.model_name = model_name
         self.info = kwargs
         self.chat_open_ai = chat_open_ai or ChatOpenAI(model=model_name,
@@ -50,6 +52,42 @@ class OpenAIBase:
         )
         return response.choices[0].message
 
+    async def apredict(self, message, stream=False):
+        """predict 的异步版本，stream=True 时返回异步生成器"""
+        if isinstance(message, str):
+            messages=[{"role": "user", "content": message}]
+        else:
+            messages = message
+
+        if stream:
+            return self._astream_response(messages)
+        else:
+            return await self._aget_response(messages)
+
+    async def _astream_response(self, messages):
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                stream=True,
+            )
+            async for chunk in response:
+                if len(chunk.choices) > 0:
+                    yield chunk.choices[0].delta
+
+        except Exception as e:
+            err = f"Error streaming response: {e}, URL: {self.base_url}, API Key: {self.api_key[:5]}***, Model: {self.model_name}"
+            logger.error(err)
+            raise Exception(err)
+
+    async def _aget_response(self, messages):
+        response = await self.async_client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            stream=False,
+        )
+        return response.choices[0].message
+
     def get_models(self):
         try:
             return self.client.models.list(
@@ -125,6 +163,19 @@ class Qianfan(OpenAIBase):
         )
         return GeneralResponse(response["body"]["result"])
 
+    async def apredict(self, message, stream=False):
+        """qianfan SDK 没有异步接口，在线程中执行同步调用"""
+        if stream:
+            return _iterate_in_thread(self.predict(message, stream=True))
+        return await asyncio.to_thread(self.predict, message)
+
+
+async def _iterate_in_thread(iterator):
+    """在线程中逐个取出同步迭代器的元素，避免阻塞事件循环"""
+    sentinel = object()
+    while (item := await asyncio.to_thread(next, iterator, sentinel)) is not sentinel:
+        yield item
+
 
 if __name__ == "__main__":
     pass
@@ -2,12 +2,28 @@ import os
 import json
 import requests
 import asyncio
+from array import array
 from abc import abstractmethod
 from zhipuai import ZhipuAI
 from langchain_huggingface import HuggingFaceEmbeddings
 
 from src import config
-from src.utils import hashstr, logger, get_docker_safe_url
+from src.utils import hashstr, logger, get_docker_safe_url, get_async_http_client
+from src.utils.cache import LRUCache
+
+
+# 查询向量缓存：key 为 (embed_model_fullname, 规范化后的查询文本)，value 为 float32 数组
+# 由知识库、图数据库与检索器共享，避免热点查询重复调用远程 embedding 接口
+query_embedding_cache = LRUCache(
+    max_bytes=int(config.query_embedding_cache_size * 1024 * 1024),
+    ttl=config.query_embedding_cache_ttl or None,
+    sizeof=lambda vec: vec.itemsize * len(vec),
+)
+
+
+def normalize_query(text):
+    """规范化查询文本：去除首尾空白并合并连续空白"""
+    return " ".join(str(text).split())
 
 
 class BaseEmbeddingModel:
@@ -26,6 +42,10 @@ class BaseEmbeddingModel:
 
         return config.embed_model_names[self.model].get("dimension", None)
 
+    async def apredict(self, message):
+        """异步版本的 predict，子类可以使用异步 HTTP 客户端覆盖该方法"""
+        return await asyncio.to_thread(self.predict, message)
+
     def encode(self, message):
         return self.predict(message)
 
@@ -33,17 +53,50 @@ class BaseEmbeddingModel:
         return self.predict(queries)
 
     async def aencode(self, message):
-        return await asyncio.to_thread(self.encode, message)
+        return await self.apredict(message)
 
     async def aencode_queries(self, queries):
         return await asyncio.to_thread(self.encode_queries, queries)
 
     async def abatch_encode(self, messages, batch_size=20):
-        return await asyncio.to_thread(self.batch_encode, messages, batch_size)
+        data = []
+        for group_msg in self._iter_batches(messages, batch_size):
+            data.extend(await self.aencode(group_msg))
+        return data
+
+    def _query_cache_key(self, query):
+        return (getattr(self, "embed_model_fullname", self.model), normalize_query(query))
+
+    def encode_query(self, query):
+        """编码单条查询文本，命中缓存时直接返回缓存的向量"""
+        key = self._query_cache_key(query)
+        if (cached := query_embedding_cache.get(key)) is not None:
+            return cached.tolist()
+
+        vector = self.batch_encode([key[1]])[0]
+        query_embedding_cache.set(key, array("f", vector))
+        return vector
+
+    async def aencode_query(self, query):
+        key = self._query_cache_key(query)
+        if (cached := query_embedding_cache.get(key)) is not None:
+            return cached.tolist()
+
+        vector = (await self.abatch_encode([key[1]]))[0]
+        query_embedding_cache.set(key, array("f", vector))
+        return vector
 
     def batch_encode(self, messages, batch_size=20):
-        logger.info(f"Batch encoding {len(messages)} messages")
         data = []
+        for group_msg in self._iter_batches(messages, batch_size):
+            response = self.encode(group_msg)
+            # logger.debug(f"Response: {len(response)=}, {len(group_msg)=}, {len(response[0])=}")
+            data.extend(response)
+        return data
+
+    def _iter_batches(self, messages, batch_size):
+        """按 batch_size 切分待编码的文本，batch_encode 与 abatch_encode 共用，同时记录日志与编码进度"""
+        logger.info(f"Batch encoding {len(messages)} messages")
 
         if len(messages) > batch_size:
             task_id = hashstr(messages)
@@ -54,18 +107,13 @@ class BaseEmbeddingModel:
             }
 
         for i in range(0, len(messages), batch_size):
-            group_msg = messages[i:i+batch_size]
             logger.info(f"Encoding {i} to {i+batch_size} with {len(messages)} messages")
-            response = self.encode(group_msg)
-            # logger.debug(f"Response: {len(response)=}, {len(group_msg)=}, {len(response[0])=}")
-            data.extend(response)
+            yield messages[i:i+batch_size]
 
         if len(messages) > batch_size:
             self.embed_state[task_id]['progress'] = len(messages)
             self.embed_state[task_id]['status'] = 'completed'
 
-        return data
-
 class LocalEmbeddingModel(BaseEmbeddingModel):
     def __init__(self, **kwargs):
         info = config.embed_model_names[config.embed_model]
@@ -151,6 +199,19 @@ class OllamaEmbedding(BaseEmbeddingModel):
         assert response.get("embeddings"), f"Ollama Embedding failed: {response}"
         return response["embeddings"]
 
+    async def apredict(self, message: list[str] | str):
+        if isinstance(message, str):
+            message = [message]
+
+        payload = {
+            "model": self.model,
+            "input": message,
+        }
+        response = await get_async_http_client().post(self.url, json=payload)
+        response = response.json()
+        assert response.get("embeddings"), f"Ollama Embedding failed: {response}"
+        return response["embeddings"]
+
 
 class OtherEmbedding(BaseEmbeddingModel):
 
@@ -175,6 +236,14 @@ class OtherEmbedding(BaseEmbeddingModel):
         data = [a["embedding"] for a in response["data"]]
         return data
 
+    async def apredict(self, message):
+        payload = self.build_payload(message)
+        response = await get_async_http_client().post(self.url, json=payload, headers=self.headers)
+        response = response.json()
+        assert response["data"], f"Other Embedding failed: {response}"
+        data = [a["embedding"] for a in response["data"]]
+        return data
+
     def build_payload(self, message):
         return {
             "model": self.model,
@@ -1,11 +1,24 @@
 import os
 import json
+import asyncio
 import requests
+import threading
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from FlagEmbedding import FlagReranker
 
 from src import config
-from src.utils import logger, get_docker_safe_url
+from src.utils import logger, hashstr, get_docker_safe_url, get_async_http_client
+from src.utils.cache import LRUCache
+
+
+# 重排序分数缓存：key 为 (模型名称, 查询文本, 文本片段哈希, max_length)，value 为原始分数
+# rerank_score_cache_size 设置为 0 时关闭缓存
+rerank_score_cache = LRUCache(
+    max_items=config.rerank_score_cache_size,
+    ttl=config.rerank_score_cache_ttl or None,
+) if config.rerank_score_cache_size > 0 else None
 
 
 class LocalReranker(FlagReranker):
@@ -18,15 +31,26 @@ class LocalReranker(FlagReranker):
         super().__init__(model_name_or_path, use_fp16=True, device=config.device, **kwargs)
         logger.info(f"Reranker model {config.reranker} loaded")
 
+    async def acompute_score(self, sentence_pairs, **kwargs):
+        return await asyncio.to_thread(self.compute_score, sentence_pairs, **kwargs)
+
 
 def sigmoid(x):
     return 1 / (1 + np.exp(-x))
 
 class OnlineRerank:
+    """在线重排序模型
+
+    候选文本按 batch_size 切分为多个子请求，最多 max_concurrency 个子请求同时进行，
+    结果按原始顺序拼接。batch_size 与 max_concurrency 可以在模型配置中指定。
+    """
+
     def __init__(self, **kwargs):
         model_info = config.reranker_names[config.reranker]
         self.url = get_docker_safe_url(model_info["url"])
         self.model = model_info["name"]
+        self.batch_size = model_info.get("batch_size", 32)
+        self.max_concurrency = model_info.get("max_concurrency", 4)
 
         api_key = os.getenv(model_info["api_key"], model_info["api_key"])
         assert api_key, f"{model_info['name']} api_key is required"
@@ -35,22 +59,123 @@ class OnlineRerank:
             "Content-Type": "application/json"
         }
 
-    def compute_score(self, sentence_pairs, batch_size = 256, max_length = 512, normalize = False):
-        # TODO 还没实现 batch_size
+        # 复用连接，避免每次请求重新建立 TCP/TLS 连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="rerank")
+        # 正在进行的 compute_score 调用数，close 后等这些调用结束再释放线程池与连接池
+        self._inflight = 0
+        self._closed = False
+        self._state_lock = threading.Lock()
+
+    def close(self):
+        """释放线程池与连接池，重新加载模型或服务关闭时调用；正在进行的请求结束后才真正释放"""
+        with self._state_lock:
+            if self._closed:
+                return
+            self._closed = True
+            idle = self._inflight == 0
+        if idle:
+            self._release()
+
+    def _release(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+    def _enter(self):
+        """登记一次同步调用，已关闭时返回 False"""
+        with self._state_lock:
+            if self._closed:
+                return False
+            self._inflight += 1
+            return True
+
+    def _exit(self):
+        with self._state_lock:
+            self._inflight -= 1
+            release = self._closed and self._inflight == 0
+        if release:
+            self._release()
+
+    def compute_score(self, sentence_pairs, batch_size = None, max_length = 512, normalize = False):
         query, sentences = sentence_pairs[0], sentence_pairs[1]
-        payload = self.build_payload(query, sentences, max_length)
-        response = requests.request("POST", self.url, json=payload, headers=self.headers)
-        response = json.loads(response.text)
-        # logger.debug(f"SiliconFlow Reranker response: {response}")
+        all_scores, batches = self._prepare_batches(query, sentences, batch_size, max_length)
 
-        results = sorted(response["results"], key=lambda x: x["index"])
-        all_scores = [result["relevance_score"] for result in results]
+        # 关闭后仍持有旧实例的调用方不再使用线程池与连接池，逐个批次发送独立的请求
+        active = self._enter()
+        session = self.session if active else requests
+        try:
+            if len(batches) == 1 or not active:
+                batch_scores = [self._request_scores(query, batch, sentences, max_length, session) for batch in batches]
+            else:
+                batch_scores = list(self._executor.map(
+                    lambda batch: self._request_scores(query, batch, sentences, max_length, session), batches))
+        finally:
+            if active:
+                self._exit()
+
+        return self._collect_scores(query, sentences, all_scores, batches, batch_scores, max_length, normalize)
+
+    async def acompute_score(self, sentence_pairs, batch_size = None, max_length = 512, normalize = False):
+        query, sentences = sentence_pairs[0], sentence_pairs[1]
+        all_scores, batches = self._prepare_batches(query, sentences, batch_size, max_length)
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def request(batch):
+            async with semaphore:
+                return await self._arequest_scores(query, batch, sentences, max_length)
+
+        batch_scores = await asyncio.gather(*(request(batch) for batch in batches))
+        return self._collect_scores(query, sentences, all_scores, batches, batch_scores, max_length, normalize)
+
+    def _score_cache_key(self, query, sentence, max_length):
+        return (self.model, query, hashstr(sentence), max_length)
+
+    def _prepare_batches(self, query, sentences, batch_size, max_length):
+        """从缓存中取出已有分数，并把未命中的文本下标按 batch_size 切分为多个批次"""
+        batch_size = batch_size or self.batch_size
+        all_scores = [None] * len(sentences)
+        missing = []
+        for idx, sentence in enumerate(sentences):
+            if rerank_score_cache is not None:
+                all_scores[idx] = rerank_score_cache.get(self._score_cache_key(query, sentence, max_length))
+            if all_scores[idx] is None:
+                missing.append(idx)
+
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+        return all_scores, batches
+
+    def _collect_scores(self, query, sentences, all_scores, batches, batch_scores, max_length, normalize):
+        """按原始顺序回填各批次的分数并写入缓存"""
+        for batch, scores in zip(batches, batch_scores):
+            for idx, score in zip(batch, scores):
+                all_scores[idx] = score
+                if rerank_score_cache is not None:
+                    rerank_score_cache.set(self._score_cache_key(query, sentences[idx], max_length), score)
 
         if normalize:
             all_scores = [sigmoid(score) for score in all_scores]
 
         return all_scores
 
+    def _request_scores(self, query, batch, sentences, max_length, session):
+        payload = self.build_payload(query, [sentences[idx] for idx in batch], max_length)
+        response = session.post(self.url, json=payload, headers=self.headers)
+        return self._parse_response(json.loads(response.text))
+
+    async def _arequest_scores(self, query, batch, sentences, max_length):
+        payload = self.build_payload(query, [sentences[idx] for idx in batch], max_length)
+        response = await get_async_http_client().post(self.url, json=payload, headers=self.headers)
+        return self._parse_response(response.json())
+
+    def _parse_response(self, response):
+        # logger.debug(f"SiliconFlow Reranker response: {response}")
+        results = sorted(response["results"], key=lambda x: x["index"])
+        return [result["relevance_score"] for result in results]
+
     def build_payload(self, query, sentences, max_length = 512):
         return {
             "model": self.model,
@@ -59,6 +184,12 @@ class OnlineRerank:
             "max_chunks_per_doc": max_length,
         }
 
+def close_reranker(reranker):
+    """关闭重排序模型持有的资源，本地模型没有需要释放的资源"""
+    if reranker is not None and hasattr(reranker, "close"):
+        reranker.close()
+
+
 def get_reranker():
     support_rerankers = config.reranker_names.keys()
     assert config.reranker in support_rerankers, f"Unsupported Reranker: {config.reranker}, only support {support_rerankers}"
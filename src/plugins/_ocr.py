@@ -1,5 +1,12 @@
 import os
-import uuid
+import time
+import queue
+import shutil
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from argparse import ArgumentParser
 
@@ -21,10 +28,20 @@ class OCRPlugin:
     def __init__(self, **kwargs):
         self.ocr = None
         self.det_box_thresh = kwargs.get('det_box_thresh', 0.3)
+        # PDF 逐页 OCR 的并发线程数，每个线程从会话池中取一个独立的 RapidOCR 实例
+        self.num_workers = int(kwargs.get('num_workers', os.getenv("OCR_WORKERS", min(4, os.cpu_count() or 1))))
+
+        self._sessions = queue.LifoQueue()
+        self._sessions_created = 0
+        self._sessions_lock = threading.Lock()
 
     def load_model(self):
         """加载 OCR 模型"""
         logger.info("加载 OCR 模型，仅在第一次调用时加载")
+        self.ocr = self._create_session()
+        logger.info(f"OCR Plugin for det_box_thresh = {self.det_box_thresh} loaded.")
+
+    def _create_session(self):
         model_dir = os.path.join(os.getenv("MODEL_DIR", ""), "SWHL/RapidOCR")
         det_model_dir = os.path.join(model_dir, "PP-OCRv4/ch_PP-OCRv4_det_infer.onnx")
         rec_model_dir = os.path.join(model_dir, "PP-OCRv4/ch_PP-OCRv4_rec_infer.onnx")
@@ -32,8 +49,24 @@ class OCRPlugin:
             f"模型文件不存在，请下载 SWHL/RapidOCR 到 {model_dir}，"
             "并确认是否在 docker-compose.dev.yml 中添加 MODEL_DIR 环境变量"
         )
-        self.ocr = RapidOCR(det_box_thresh=0.3, det_model_path=det_model_dir, rec_model_path=rec_model_dir)
-        logger.info(f"OCR Plugin for det_box_thresh = {self.det_box_thresh} loaded.")
+        return RapidOCR(det_box_thresh=self.det_box_thresh, det_model_path=det_model_dir, rec_model_path=rec_model_dir)
+
+    @contextmanager
+    def _session(self):
+        """从会话池中取出一个 RapidOCR 实例，池中没有空闲实例且未达到 num_workers 个时新建"""
+        try:
+            session = self._sessions.get_nowait()
+        except queue.Empty:
+            with self._sessions_lock:
+                create = self._sessions_created < self.num_workers
+                if create:
+                    self._sessions_created += 1
+            session = self._create_session() if create else self._sessions.get()
+
+        try:
+            yield session
+        finally:
+            self._sessions.put(session)
 
     def process_image(self, image):
         """
@@ -52,23 +85,16 @@ class OCRPlugin:
         if self.ocr is None:
             self.load_model()
 
-        # 处理不同类型的输入图像
+        return self._recognize(self.ocr, image)
+
+    def _recognize(self, ocr, image):
+        """使用指定的 RapidOCR 实例识别单张图像，图像在内存中直接传给 RapidOCR，不写临时文件"""
         try:
-            if isinstance(image, str):
-                # 图像路径直接传递给OCR处理
-                image_path = image
-                is_temp_file = False
-            else:
-                # 创建临时文件
-                is_temp_file = True
-                image_path = self._create_temp_image_file(image)
+            if not isinstance(image, str):
+                image = self._to_bgr_array(image)
 
             # 执行 OCR
-            result, _ = self.ocr(image_path)
-
-            # 清理临时文件
-            if is_temp_file and os.path.exists(image_path):
-                os.remove(image_path)
+            result, _ = ocr(image)
 
             # 提取文本
             if result:
@@ -82,35 +108,31 @@ class OCRPlugin:
             logger.error(f"OCR处理失败: {str(e)}")
             raise
 
-    def _create_temp_image_file(self, image):
+    @staticmethod
+    def _to_bgr_array(image):
         """
-        将图像数据保存为临时文件
+        将 PIL.Image 或 RGB 格式的 numpy 数组转换为 RapidOCR（OpenCV）使用的 BGR 数组
 
         Args:
             image: PIL.Image或numpy.ndarray格式的图像数据
 
         Returns:
-            str: 临时文件路径
+            numpy.ndarray: 内存连续的 BGR（或灰度）数组
         """
-        # 为临时文件创建目录（如果不存在）
-        tmp_dir = os.path.join(os.getcwd(), 'tmp')
-        os.makedirs(tmp_dir, exist_ok=True)
-
-        # 生成临时文件路径
-        temp_filename = f'ocr_temp_{uuid.uuid4().hex[:8]}.png'
-        image_path = os.path.join(tmp_dir, temp_filename)
-
-        # 根据图像类型保存文件
         if isinstance(image, Image.Image):
-            # 保存PIL图像对象到临时文件
-            image.save(image_path)
-        elif isinstance(image, np.ndarray):
-            # 将numpy数组转换为PIL图像并保存
-            Image.fromarray(image).save(image_path)
-        else:
+            image = np.asarray(image.convert("RGB") if image.mode not in ("RGB", "L") else image)
+        elif not isinstance(image, np.ndarray):
             raise ValueError("不支持的图像类型，必须是PIL.Image或numpy数组")
 
-        return image_path
+        if image.ndim == 3 and image.shape[2] == 3:
+            # RGB -> BGR，唯一的一次像素拷贝
+            return np.ascontiguousarray(image[..., ::-1])
+        return image
+
+    @staticmethod
+    def _pixmap_to_array(pix):
+        """把 fitz Pixmap 的像素缓冲区零拷贝地包装为 (height, width, n) 的 numpy 数组，调用方需保持 pix 存活"""
+        return np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
 
     def process_pdf(self, pdf_path):
         """
@@ -129,34 +151,135 @@ class OCRPlugin:
             #     logger.info("PDF file is text, use llama_index.readers.file to read")
             #     return pdfreader(pdf_path)
 
-            images = []
-
-            pdfDoc = fitz.open(pdf_path)
-            totalPage = pdfDoc.page_count
-            for pg in tqdm(range(totalPage), desc='to images', ncols=100):
-                page = pdfDoc[pg]
-                rotate, zoom_x, zoom_y = 0, 2, 2
-                mat = fitz.Matrix(zoom_x, zoom_y).prerotate(rotate)
-                pix = page.get_pixmap(matrix=mat, alpha=False)
-                img_pil = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                images.append(img_pil)
-
-            # 处理每个图像并合并文本
-            all_text = []
-            for img_path in tqdm(images, desc='to txt', ncols=100):
-                text = self.process_image(img_path)
-                all_text.append(text)
-
-            return '\n\n'.join(all_text)
+            return '\n\n'.join(self.iter_pdf_pages(pdf_path))
 
         except Exception as e:
             logger.error(f"PDF processing error: {str(e)}")
             return ""
 
-    def process_pdf_mineru(self, pdf_path):
+    def iter_pdf_pages(self, pdf_path, pages=None, window=None):
+        """
+        逐页渲染并 OCR PDF，按页码顺序输出每一页的文本
+
+        渲染与识别在 num_workers 个线程中并行执行，每个线程持有自己的 fitz 文档对象与 RapidOCR 实例；
+        同时在处理中的页数不超过 window（默认 2 * num_workers），内存占用与文档页数无关。
+
+        :param pdf_path: PDF文件路径
+        :param pages: 需要处理的页码列表（从 0 开始），默认为全部页
+        :param window: 同时在处理中的最大页数
+        """
+        if pages is None:
+            with fitz.open(pdf_path) as doc:
+                pages = range(doc.page_count)
+
+        window = window or 2 * self.num_workers
+        local = threading.local()
+        opened_docs, docs_lock = [], threading.Lock()
+        timings, timings_lock = {"render": 0.0, "ocr": 0.0}, threading.Lock()
+        start_time = time.perf_counter()
+
+        def ocr_page(pg):
+            if not hasattr(local, "doc"):
+                local.doc = fitz.open(pdf_path)
+                with docs_lock:
+                    opened_docs.append(local.doc)
+
+            t0 = time.perf_counter()
+            page = local.doc[pg]
+            rotate, zoom_x, zoom_y = 0, 2, 2
+            mat = fitz.Matrix(zoom_x, zoom_y).prerotate(rotate)
+            pix = page.get_pixmap(matrix=mat, alpha=False)
+            image = self._to_bgr_array(self._pixmap_to_array(pix))
+            del pix
+            t1 = time.perf_counter()
+
+            with self._session() as ocr:
+                text = self._recognize(ocr, image)
+            t2 = time.perf_counter()
+
+            with timings_lock:
+                timings["render"] += t1 - t0
+                timings["ocr"] += t2 - t1
+            logger.debug(f"OCR page {pg}: render {(t1 - t0) * 1000:.1f}ms, ocr {(t2 - t1) * 1000:.1f}ms")
+            return text
+
+        in_flight = deque()
+        progress = tqdm(total=len(pages), desc='ocr pages', ncols=100)
+        try:
+            with ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix="ocr") as executor:
+                try:
+                    for pg in pages:
+                        if len(in_flight) >= window:
+                            yield in_flight.popleft().result()
+                            progress.update(1)
+                        in_flight.append(executor.submit(ocr_page, pg))
+
+                    while in_flight:
+                        yield in_flight.popleft().result()
+                        progress.update(1)
+                finally:
+                    # 出错或提前结束迭代时取消尚未开始的页
+                    for future in in_flight:
+                        future.cancel()
+        finally:
+            progress.close()
+            for doc in opened_docs:
+                doc.close()
+            logger.info(f"OCR {pdf_path}: {len(pages)} pages in {time.perf_counter() - start_time:.2f}s "
+                        f"(render {timings['render']:.2f}s, ocr {timings['ocr']:.2f}s, summed over {self.num_workers} workers)")
+
+    def iter_pdf_pages_hybrid(self, pdf_path, backend="onnx_rapid_ocr", backend_options=None, **classify_kwargs):
+        """
+        混合解析 PDF：有文本层的页面直接提取文本，只对没有文本层（扫描件）的页面执行 OCR，按页码顺序输出每一页的文本
+
+        :param pdf_path: PDF文件路径
+        :param backend: OCR 后端，onnx_rapid_ocr / mineru_ocr / paddlex_ocr；
+                        mineru_ocr 与 paddlex_ocr 以连续的扫描页为单位拆分为子 PDF 提交，每段输出一次
+        :param backend_options: 传给 OCR 后端的额外参数，例如 mineru_ocr 的 dump_artifacts
+        :param classify_kwargs: 传给 classify_pdf_pages 的页面分类参数
+        """
+        needs_ocr = classify_pdf_pages(pdf_path, **classify_kwargs)
+        ocr_pages = [pg for pg, flag in enumerate(needs_ocr) if flag]
+        logger.info(f"Hybrid parse {pdf_path}: {len(ocr_pages)}/{len(needs_ocr)} pages need OCR, backend={backend}")
+
+        with fitz.open(pdf_path) as doc:
+            if backend == "onnx_rapid_ocr":
+                # 所有扫描页一起提交给 OCR 线程池，以获得最大的并行度
+                ocr_texts = self.iter_pdf_pages(pdf_path, pages=ocr_pages)
+                for pg, flag in enumerate(needs_ocr):
+                    yield next(ocr_texts) if flag else doc[pg].get_text()
+                return
+
+            if backend == "mineru_ocr":
+                process_fn = self.process_pdf_mineru
+            elif backend == "paddlex_ocr":
+                process_fn = self.process_pdf_paddlex
+            else:
+                raise ValueError(f"不支持的 OCR 后端: {backend}")
+
+            for flag, start, end in _group_page_runs(needs_ocr):
+                if not flag:
+                    for pg in range(start, end):
+                        yield doc[pg].get_text()
+                    continue
+
+                tmp_dir = os.path.join(os.getcwd(), "tmp", "hybrid_ocr")
+                os.makedirs(tmp_dir, exist_ok=True)
+                sub_path = os.path.join(tmp_dir, f"{Path(pdf_path).stem}_p{start}-{end - 1}_{os.getpid()}_{threading.get_ident()}.pdf")
+                try:
+                    with fitz.open() as sub_doc:
+                        sub_doc.insert_pdf(doc, from_page=start, to_page=end - 1)
+                        sub_doc.save(sub_path)
+                    yield process_fn(sub_path, **(backend_options or {}))
+                finally:
+                    if os.path.exists(sub_path):
+                        os.remove(sub_path)
+
+    def process_pdf_mineru(self, pdf_path, dump_artifacts=False):
         """
         使用Mineru OCR处理PDF文件
         :param pdf_path: PDF文件路径
+        :param dump_artifacts: 是否在 tmp/mineru_ocr 中保留调试文件（版面框 PDF、中间 JSON、模型输出等）
         :return: 提取的文本
         """
         import requests
@@ -171,10 +294,24 @@ class OCRPlugin:
 
         pdf_path_list = [pdf_path]
         output_dir = os.path.join(os.getcwd(), "tmp", "mineru_ocr")
+        if not dump_artifacts:
+            # 不保留调试文件时每次解析使用独立的临时目录，拿到 markdown 后整个删除，避免并发解析同名文件时互相覆盖
+            os.makedirs(output_dir, exist_ok=True)
+            output_dir = tempfile.mkdtemp(prefix="parse_", dir=output_dir)
 
-        pdf_text = parse_doc(pdf_path_list, output_dir,
-                         backend="vlm-sglang-client",
-                         server_url=mineru_ocr_uri)[0]
+        try:
+            pdf_text = parse_doc(pdf_path_list, output_dir,
+                             backend="vlm-sglang-client",
+                             server_url=mineru_ocr_uri,
+                             dump_artifacts=dump_artifacts)[0]
+            if not dump_artifacts:
+                # markdown 中的图片链接指向临时目录下的 images/，删除临时目录前将图片移到共享的图片目录并改写链接
+                image_dir = os.path.join(os.getcwd(), "tmp", "mineru_ocr", "images")
+                keep_mineru_images(output_dir, image_dir)
+                pdf_text = pdf_text.replace("](images/", f"]({image_dir}/")
+        finally:
+            if not dump_artifacts:
+                shutil.rmtree(output_dir, ignore_errors=True)
 
         logger.debug(f"Mineru OCR result: {pdf_text[:50]}(...) total {len(pdf_text)} characters.")
         return pdf_text
@@ -201,6 +338,58 @@ class OCRPlugin:
 
         return result["full_text"]
 
+def keep_mineru_images(output_dir, image_dir):
+    """将 MinerU 输出目录中各个 images/ 子目录下的图片移动到 image_dir
+
+    MinerU 以图片内容的哈希作为文件名，不同文档的图片可以放在同一个目录中，已存在的同名图片不再覆盖。
+    """
+    os.makedirs(image_dir, exist_ok=True)
+    for root, _, files in os.walk(output_dir):
+        if os.path.basename(root) != "images":
+            continue
+        for name in files:
+            target = os.path.join(image_dir, name)
+            if not os.path.exists(target):
+                shutil.move(os.path.join(root, name), target)
+
+
+def classify_pdf_pages(pdf_path, min_text_density=1.0, scan_text_density=10.0, image_coverage=0.8):
+    """
+    按文本层密度判断 PDF 的每一页是否需要 OCR，返回与页码一一对应的布尔值列表
+
+    文本密度为每 100x100pt 页面面积上的可提取字符数（A4 页面约 50 个单位）。
+    密度低于 min_text_density 的页面需要 OCR；图片覆盖了页面 image_coverage 以上、
+    且密度低于 scan_text_density 的页面视为带水印或页眉文字的扫描件，同样需要 OCR。
+    """
+    needs_ocr = []
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            area = max(page.rect.width * page.rect.height / 10000, 1e-6)
+            density = len("".join(page.get_text().split())) / area
+
+            if density < min_text_density:
+                needs_ocr.append(True)
+                continue
+
+            if density < scan_text_density:
+                page_rect = page.rect
+                covered = sum(abs(fitz.Rect(info["bbox"]) & page_rect) for info in page.get_image_info())
+                needs_ocr.append(covered / (area * 10000) >= image_coverage)
+                continue
+
+            needs_ocr.append(False)
+    return needs_ocr
+
+def _group_page_runs(flags):
+    """把页面标记列表分组为连续的 (flag, start, end) 区间，end 不包含在内"""
+    runs = []
+    for pg, flag in enumerate(flags):
+        if runs and runs[-1][0] == flag:
+            runs[-1][2] = pg + 1
+        else:
+            runs.append([flag, pg, pg + 1])
+    return [tuple(run) for run in runs]
+
 def get_state(task_id):
     return GOLBAL_STATE.get(task_id, {})
 
@@ -2,6 +2,7 @@
 import copy
 import json
 import os
+import time
 from pathlib import Path
 from tqdm import tqdm
 
@@ -28,17 +29,35 @@ def do_parse(
     p_formula_enable=True,  # Enable formula parsing
     p_table_enable=True,  # Enable table parsing
     server_url=None,  # Server URL for vlm-sglang-client backend
-    f_draw_layout_bbox=True,  # Whether to draw layout bounding boxes
-    f_draw_span_bbox=True,  # Whether to draw span bounding boxes
-    f_dump_md=True,  # Whether to dump markdown files
-    f_dump_middle_json=True,  # Whether to dump middle JSON files
-    f_dump_model_output=True,  # Whether to dump model output files
-    f_dump_orig_pdf=True,  # Whether to dump original PDF files
-    f_dump_content_list=True,  # Whether to dump content list files
+    dump_artifacts=False,  # 是否输出调试文件，默认只写入 markdown 引用的图片，markdown 只保留在内存中
+    f_draw_layout_bbox=None,  # Whether to draw layout bounding boxes, None follows dump_artifacts
+    f_draw_span_bbox=None,  # Whether to draw span bounding boxes, None follows dump_artifacts
+    f_dump_md=None,  # Whether to dump markdown files, None follows dump_artifacts
+    f_dump_middle_json=None,  # Whether to dump middle JSON files, None follows dump_artifacts
+    f_dump_model_output=None,  # Whether to dump model output files, None follows dump_artifacts
+    f_dump_orig_pdf=None,  # Whether to dump original PDF files, None follows dump_artifacts
+    f_dump_content_list=None,  # Whether to dump content list files, None follows dump_artifacts
     f_make_md_mode=MakeMode.MM_MD,  # The mode for making markdown content, default is MM_MD
     start_page_id=0,  # Start page ID for parsing, default is 0
     end_page_id=None,  # End page ID for parsing, default is None (parse all pages until the end of the document)
+    timings=None,  # 传入 dict 时记录各阶段耗时（秒），key 为 "文件名/阶段"
 ) -> list[str]:
+    f_draw_layout_bbox = dump_artifacts if f_draw_layout_bbox is None else f_draw_layout_bbox
+    f_draw_span_bbox = dump_artifacts if f_draw_span_bbox is None else f_draw_span_bbox
+    f_dump_md = dump_artifacts if f_dump_md is None else f_dump_md
+    f_dump_middle_json = dump_artifacts if f_dump_middle_json is None else f_dump_middle_json
+    f_dump_model_output = dump_artifacts if f_dump_model_output is None else f_dump_model_output
+    f_dump_orig_pdf = dump_artifacts if f_dump_orig_pdf is None else f_dump_orig_pdf
+    f_dump_content_list = dump_artifacts if f_dump_content_list is None else f_dump_content_list
+
+    timings = {} if timings is None else timings
+    stage_start = time.perf_counter()
+
+    def mark(name, stage):
+        nonlocal stage_start
+        now = time.perf_counter()
+        timings[f"{name}/{stage}"] = timings.get(f"{name}/{stage}", 0.0) + now - stage_start
+        stage_start = now
 
     if backend == "pipeline":
         for idx, pdf_bytes in enumerate(pdf_bytes_list):
@@ -46,13 +65,16 @@ def do_parse(
             pdf_bytes_list[idx] = new_pdf_bytes
 
 
+        mark("*", "convert")
+
         result = pipeline_doc_analyze(pdf_bytes_list, p_lang_list, parse_method=parse_method, formula_enable=p_formula_enable,table_enable=p_table_enable)
         infer_results, all_image_lists, all_pdf_docs, lang_list, ocr_enabled_list = result
+        mark("*", "analyze")
 
 
         md_results = []
         for idx, model_list in enumerate(infer_results):
-            model_json = copy.deepcopy(model_list)
+            model_json = copy.deepcopy(model_list) if f_dump_model_output else None
             pdf_file_name = pdf_file_names[idx]
             local_image_dir, local_md_dir = prepare_env(output_dir, pdf_file_name, parse_method)
             image_writer, md_writer = FileBasedDataWriter(local_image_dir), FileBasedDataWriter(local_md_dir)
@@ -62,6 +84,7 @@ def do_parse(
             _lang = lang_list[idx]
             _ocr_enable = ocr_enabled_list[idx]
             middle_json = pipeline_result_to_middle_json(model_list, images_list, pdf_doc, image_writer, _lang, _ocr_enable, p_formula_enable)
+            mark(pdf_file_name, "middle_json")
 
             pdf_info = middle_json["pdf_info"]
 
@@ -71,6 +94,7 @@ def do_parse(
 
             if f_draw_span_bbox:
                 draw_span_bbox(pdf_info, pdf_bytes, local_md_dir, f"{pdf_file_name}_span.pdf")
+            mark(pdf_file_name, "draw_bbox")
 
             if f_dump_orig_pdf:
                 md_writer.write(
@@ -78,14 +102,16 @@ def do_parse(
                     pdf_bytes,
                 )
 
+            image_dir = str(os.path.basename(local_image_dir))
+            md_content_str = pipeline_union_make(pdf_info, f_make_md_mode, image_dir)
+            md_results.append(md_content_str)
+            mark(pdf_file_name, "make_md")
+
             if f_dump_md:
-                image_dir = str(os.path.basename(local_image_dir))
-                md_content_str = pipeline_union_make(pdf_info, f_make_md_mode, image_dir)
                 md_writer.write_string(
                     f"{pdf_file_name}.md",
                     md_content_str,
                 )
-                md_results.append(md_content_str)
 
             if f_dump_content_list:
                 image_dir = str(os.path.basename(local_image_dir))
@@ -107,7 +133,9 @@ def do_parse(
                     json.dumps(model_json, ensure_ascii=False, indent=4),
                 )
 
-            logger.info(f"local output dir is {local_md_dir}")
+            mark(pdf_file_name, "dump_artifacts")
+            if dump_artifacts:
+                logger.info(f"local output dir is {local_md_dir}")
 
         return md_results
 
@@ -124,7 +152,9 @@ def do_parse(
             pdf_bytes = convert_pdf_bytes_to_bytes_by_pypdfium2(pdf_bytes, start_page_id, end_page_id)
             local_image_dir, local_md_dir = prepare_env(output_dir, pdf_file_name, parse_method)
             image_writer, md_writer = FileBasedDataWriter(local_image_dir), FileBasedDataWriter(local_md_dir)
+            mark(pdf_file_name, "convert")
             middle_json, infer_result = vlm_doc_analyze(pdf_bytes, image_writer=image_writer, backend=backend, server_url=server_url)
+            mark(pdf_file_name, "analyze")
 
             pdf_info = middle_json["pdf_info"]
 
@@ -133,6 +163,7 @@ def do_parse(
 
             if f_draw_span_bbox:
                 draw_span_bbox(pdf_info, pdf_bytes, local_md_dir, f"{pdf_file_name}_span.pdf")
+            mark(pdf_file_name, "draw_bbox")
 
             if f_dump_orig_pdf:
                 md_writer.write(
@@ -140,14 +171,16 @@ def do_parse(
                     pdf_bytes,
                 )
 
+            image_dir = str(os.path.basename(local_image_dir))
+            md_content_str = vlm_union_make(pdf_info, f_make_md_mode, image_dir)
+            md_results.append(md_content_str)
+            mark(pdf_file_name, "make_md")
+
             if f_dump_md:
-                image_dir = str(os.path.basename(local_image_dir))
-                md_content_str = vlm_union_make(pdf_info, f_make_md_mode, image_dir)
                 md_writer.write_string(
                     f"{pdf_file_name}.md",
                     md_content_str,
                 )
-                md_results.append(md_content_str)
 
             if f_dump_content_list:
                 image_dir = str(os.path.basename(local_image_dir))
@@ -170,7 +203,9 @@ def do_parse(
                     model_output,
                 )
 
-            logger.info(f"local output dir is {local_md_dir}")
+            mark(pdf_file_name, "dump_artifacts")
+            if dump_artifacts:
+                logger.info(f"local output dir is {local_md_dir}")
 
         return md_results
 
@@ -183,7 +218,8 @@ def parse_doc(
         method="auto",
         server_url=None,
         start_page_id=0,  # Start page ID for parsing, default is 0
-        end_page_id=None  # End page ID for parsing, default is None (parse all pages until the end of the document)
+        end_page_id=None,  # End page ID for parsing, default is None (parse all pages until the end of the document)
+        dump_artifacts=False,  # Whether to dump debug artifacts (bbox PDFs, middle JSON, model output, markdown)
 ) -> list[str]:
     """
         Parameter description:
@@ -205,7 +241,10 @@ def parse_doc(
             Without method specified, 'auto' will be used by default.
             Adapted only for the case where the backend is set to "pipeline".
         server_url: When the backend is `sglang-client`, you need to specify the server_url, for example:`http://127.0.0.1:30000`
+        dump_artifacts: 是否在 output_dir 中输出调试文件，默认只写入 markdown 引用的图片
     """
+    timings = {}
+    start_time = time.perf_counter()
     try:
         file_name_list = []
         pdf_bytes_list = []
@@ -216,6 +255,7 @@ def parse_doc(
             file_name_list.append(file_name)
             pdf_bytes_list.append(pdf_bytes)
             lang_list.append(lang)
+        timings["*/read"] = time.perf_counter() - start_time
 
         result = do_parse(
             output_dir=output_dir,
@@ -226,8 +266,12 @@ def parse_doc(
             parse_method=method,
             server_url=server_url,
             start_page_id=start_page_id,
-            end_page_id=end_page_id
+            end_page_id=end_page_id,
+            dump_artifacts=dump_artifacts,
+            timings=timings,
         )
+        logger.info(f"MinerU parsed {len(path_list)} documents in {time.perf_counter() - start_time:.2f}s, stages: "
+                    + ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in timings.items()))
         return result if result else [""]
 
     except Exception as e:
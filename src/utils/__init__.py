@@ -1,8 +1,12 @@
 import time
+import asyncio
 import hashlib
 import os
+import weakref
 from src.utils.logging_config import logger
 
+_ASYNC_HTTP_CLIENTS = weakref.WeakKeyDictionary()
+
 def is_text_pdf(pdf_path):
     import fitz
     doc = fitz.open(pdf_path)
@@ -53,3 +57,19 @@ def get_docker_safe_url(base_url):
         base_url = base_url.replace("http://127.0.0.1", "http://host.docker.internal")
         logger.info(f"Running in docker, using {base_url} as base url")
     return base_url
+
+
+def get_async_http_client(timeout=60):
+    """获取当前事件循环共享的 httpx.AsyncClient
+
+    httpx 的连接池与创建它的事件循环绑定，因此按 (事件循环, timeout) 缓存，同一事件循环内超时相同的请求复用 keep-alive 连接。
+    """
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    clients = _ASYNC_HTTP_CLIENTS.setdefault(loop, {})
+    client = clients.get(timeout)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(timeout=timeout)
+        clients[timeout] = client
+    return client
@@ -0,0 +1,358 @@
+import os
+import sys
+import gzip
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+
+
+class LRUCache:
+    """线程安全的 LRU 缓存，支持 TTL 过期、条目数量上限与字节数上限
+
+    Args:
+        max_items: 最大条目数，None 表示不限制
+        max_bytes: 最大占用字节数（按 sizeof 估算），None 表示不限制
+        ttl: 条目存活时间（秒），None 表示永不过期
+        sizeof: 估算单个 value 占用字节数的函数
+    """
+
+    def __init__(self, max_items=None, max_bytes=None, ttl=None, sizeof=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof or sys.getsizeof
+
+        self._data = OrderedDict()  # key -> (value, size, expire_at)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+
+            value, _, expire_at = item
+            if expire_at is not None and expire_at < time.time():
+                self._pop(key)
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        ttl = ttl if ttl is not None else self.ttl
+        expire_at = time.time() + ttl if ttl is not None else None
+
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+
+            self._data[key] = (value, size, expire_at)
+            self.current_bytes += size
+            self._evict()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._pop(key)
+            return item[0] if item is not None else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "items": len(self._data),
+            "bytes": self.current_bytes,
+            "max_items": self.max_items,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def _pop(self, key):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self.current_bytes -= item[1]
+        return item
+
+    def _evict(self):
+        while self._data and (
+            (self.max_items is not None and len(self._data) > self.max_items)
+            or (self.max_bytes is not None and self.current_bytes > self.max_bytes)
+        ):
+            _, (_, size, _) = self._data.popitem(last=False)
+            self.current_bytes -= size
+            self.evictions += 1
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
+class PersistentEmbeddingCache:
+    """基于 SQLite 的持久化向量缓存，key 为 (向量模型, 文本内容哈希)，向量以 float32 二进制存储
+
+    命中时刷新条目的最近使用时间，写入后条目数超过 max_items 时淘汰最久未使用的条目，
+    max_age 不为空时同时淘汰超过 max_age 秒未被使用的条目。
+
+    Args:
+        db_path: SQLite 数据库文件路径
+        max_items: 最大条目数，None 表示不限制
+        max_age: 条目未被使用的最长时间（秒），None 表示不限制
+    """
+
+    def __init__(self, db_path, max_items=None, max_age=None):
+        self.db_path = db_path
+        self.max_items = max_items
+        self.max_age = max_age
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL, "
+            "accessed_at REAL NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (model, hash)) WITHOUT ROWID"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(embeddings)")]
+        if "accessed_at" not in columns:  # 兼容旧版本创建的缓存文件
+            self._conn.execute("ALTER TABLE embeddings ADD COLUMN accessed_at REAL NOT NULL DEFAULT 0")
+            self._conn.execute("UPDATE embeddings SET accessed_at = created_at")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_accessed_at ON embeddings (accessed_at)")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, model, hashes, chunk_size=500):
+        """批量查询，返回 {hash: vector(list[float])}，未命中的 hash 不在结果中"""
+        result = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(unique_hashes), chunk_size):
+                chunk = unique_hashes[i:i + chunk_size]
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({', '.join('?' * len(chunk))})",
+                    (model, *chunk),
+                ).fetchall()
+                for hash_value, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    result[hash_value] = vector.tolist()
+
+            if result:
+                self._conn.executemany("UPDATE embeddings SET accessed_at = ? WHERE model = ? AND hash = ?",
+                                       [(now, model, hash_value) for hash_value in result])
+                self._conn.commit()
+            self.hits += len(result)
+            self.misses += len(unique_hashes) - len(result)
+        return result
+
+    def set_many(self, model, items):
+        """批量写入，items 为 (hash, vector) 的可迭代对象"""
+        now = time.time()
+        rows = [(model, hash_value, array("f", vector).tobytes(), now, now) for hash_value, vector in items]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+            self._prune()
+            self._conn.commit()
+
+    def prune(self):
+        """按 max_age 与 max_items 淘汰条目，返回淘汰的条目数"""
+        with self._lock:
+            evicted = self._prune()
+            self._conn.commit()
+            return evicted
+
+    def _prune(self):
+        evicted = 0
+        if self.max_age is not None:
+            evicted += self._conn.execute(
+                "DELETE FROM embeddings WHERE accessed_at < ?", (time.time() - self.max_age,)).rowcount
+        if self.max_items is not None:
+            overflow = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_items
+            if overflow > 0:
+                evicted += self._conn.execute(
+                    "DELETE FROM embeddings WHERE (model, hash) IN "
+                    "(SELECT model, hash FROM embeddings ORDER BY accessed_at LIMIT ?)", (overflow,)).rowcount
+        self.evictions += evicted
+        return evicted
+
+    def clear(self, model=None):
+        """清空缓存（指定 model 时只清空该模型的向量），返回删除的条目数"""
+        with self._lock:
+            if model is None:
+                deleted = self._conn.execute("DELETE FROM embeddings").rowcount
+            else:
+                deleted = self._conn.execute("DELETE FROM embeddings WHERE model = ?", (model,)).rowcount
+            self._conn.commit()
+            return deleted
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT model, COUNT(*) FROM embeddings GROUP BY model").fetchall()
+        total = self.hits + self.misses
+        return {
+            "path": self.db_path,
+            "items": {model: count for model, count in rows},
+            "max_items": self.max_items,
+            "max_age": self.max_age,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class ParseCache:
+    """基于文件的文档解析结果缓存，key 为 (文件内容的 sha256, 解析器名称, 解析参数)
+
+    解析结果是一组 {"text", "metadata"} 记录（例如 PDF 的每一页），以 gzip 压缩的 JSON Lines 存储，
+    总大小超过 max_bytes 时按最近使用时间（文件 mtime）淘汰。
+
+    Args:
+        cache_dir: 缓存目录
+        max_bytes: 缓存目录的最大占用字节数
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def file_digest(file_path, block_size=1024 * 1024):
+        sha256 = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            while block := f.read(block_size):
+                sha256.update(block)
+        return sha256.hexdigest()
+
+    def make_key(self, file_path, parser, options=None):
+        options_digest = hashlib.sha256(json.dumps([parser, options or {}], sort_keys=True).encode()).hexdigest()
+        return f"{self.file_digest(file_path)}-{options_digest[:16]}"
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.jsonl.gz")
+
+    def cached(self, key, producer):
+        """命中时从缓存中逐条读取记录，未命中时迭代 producer 并同时写入缓存，producer 完整迭代结束后缓存才生效"""
+        path = self._path(key)
+        try:
+            os.utime(path)  # 刷新最近使用时间
+            f = gzip.open(path, "rt", encoding="utf-8")
+        except FileNotFoundError:
+            f = None
+
+        with self._lock:
+            if f is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if f is not None:
+            with f:
+                for line in f:
+                    yield json.loads(line)
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        completed = False
+        try:
+            with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+                for record in producer:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                    yield record
+            os.replace(tmp_path, path)
+            completed = True
+        finally:
+            if not completed and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".jsonl.gz"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        """按最近使用时间淘汰缓存，直到总大小不超过 max_bytes，返回淘汰的条目数"""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            evicted = 0
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                evicted += 1
+            return evicted
+
+    def purge(self):
+        """清空缓存，返回删除的条目数与字节数"""
+        with self._lock:
+            entries = self._entries()
+            for _, _, path in entries:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            return {"items": len(entries), "bytes": sum(size for _, size, _ in entries)}
+
+    def stats(self):
+        entries = self._entries()
+        total = self.hits + self.misses
+        return {
+            "path": self.cache_dir,
+            "items": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
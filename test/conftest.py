@@ -0,0 +1,90 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src import config
+from src.utils.cache import LRUCache
+from server.db_manager import DBManager
+import src.core.knowledgebase as kb_module
+from src.core.knowledgebase import KnowledgeBase
+from src.core.indexing_queue import IndexingWorkerPool
+from src.core.vector_store import LocalVectorStore
+
+
+class FakeEmbedModel:
+    """按文本哈希生成固定向量的向量模型，记录调用次数与向量化过的文本"""
+
+    embed_model_fullname = "fake/embedding"
+    dimension = 8
+
+    def __init__(self):
+        self.query_calls = 0
+        self.encoded = []
+
+    def _vector(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [b / 255 for b in digest[:self.dimension]]
+
+    def encode_query(self, query_text):
+        self.query_calls += 1
+        return self._vector(query_text)
+
+    async def aencode_query(self, query_text):
+        return self.encode_query(query_text)
+
+    def batch_encode(self, texts):
+        self.encoded.extend(texts)
+        return [self._vector(text) for text in texts]
+
+    async def abatch_encode(self, texts):
+        return self.batch_encode(texts)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """使用临时目录中的 SQLite 数据库"""
+    monkeypatch.setitem(config, "save_dir", str(tmp_path))
+    db = DBManager()
+    monkeypatch.setattr(kb_module, "db_manager", db)
+    return db
+
+
+@pytest.fixture
+def kb(db, tmp_path, monkeypatch):
+    """不加载模型、不连接 Milvus 的知识库，向量存储在本地，向量模型为 FakeEmbedModel"""
+    monkeypatch.setitem(config, "enable_reranker", False)
+    monkeypatch.setitem(config, "enable_query_cache", True)
+    monkeypatch.setitem(config, "enable_embedding_cache", False)
+    monkeypatch.setitem(config, "enable_parse_cache", False)
+
+    async def noop(task_data):
+        pass
+
+    kb = KnowledgeBase.__new__(KnowledgeBase)
+    kb.work_dir = str(tmp_path / "data")
+    kb.client = LocalVectorStore(str(tmp_path / "vector_store"))
+    kb.embed_model = FakeEmbedModel()
+    kb.reranker = None
+
+    kb.indexing_pool = IndexingWorkerPool(noop)
+    kb.processing_tasks = kb.indexing_pool.tasks
+    kb.indexing_lease_timeout = 600
+    kb.indexing_max_attempts = 3
+    kb.indexing_retry_backoff = 30
+    kb._lease_owner = "test:1"
+    kb._job_recovery_task = None
+
+    kb.default_distance_threshold = 0.5
+    kb.default_rerank_threshold = 0.1
+    kb.default_max_query_count = 20
+    kb._file_meta_cache = {}
+    kb._search_executor = ThreadPoolExecutor(max_workers=4)
+    kb._db_versions = {}
+    kb.query_result_cache = LRUCache(max_items=16)
+    kb._parse_cache = None
+    kb._embedding_cache = None
+    kb.databases_version = 0
+    kb._retrievers_cache = None
+    yield kb
+    kb._search_executor.shutdown()
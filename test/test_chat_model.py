@@ -0,0 +1,81 @@
+import json
+import asyncio
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+from src.models.chat_model import OpenAIBase
+
+
+def sse_chunk(content=None, choices=True):
+    chunk = {"id": "chatcmpl-1", "object": "chat.completion.chunk", "created": 0, "model": "fake-model", "choices": []}
+    if choices:
+        chunk["choices"] = [{"index": 0, "delta": {"content": content}, "finish_reason": None}]
+    return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def make_model(handler):
+    model = OpenAIBase(api_key="sk-test", base_url="http://llm.test/v1", model_name="fake-model", chat_open_ai=object())
+    model.async_client = AsyncOpenAI(api_key="sk-test", base_url="http://llm.test/v1", max_retries=0,
+                                     http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return model
+
+
+def test_apredict_stream_yields_deltas_without_blocking():
+    requests = []
+
+    async def slow_stream():
+        for token in ("你好", "，", "世界"):
+            await asyncio.sleep(0.05)
+            yield sse_chunk(token)
+        yield sse_chunk(choices=False)  # 只包含 usage 的 chunk 没有 choices，应被跳过
+        yield b"data: [DONE]\n\n"
+
+    async def handler(request):
+        requests.append(json.loads(request.content))
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=slow_stream())
+
+    async def main():
+        model = make_model(handler)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker_task = asyncio.create_task(ticker())
+        deltas = [delta.content async for delta in await model.apredict("你好", stream=True)]
+        ticker_task.cancel()
+        return deltas, ticks
+
+    deltas, ticks = asyncio.run(main())
+    assert deltas == ["你好", "，", "世界"]
+    assert ticks >= 5  # 等待 token 期间事件循环可以处理其他任务
+    assert requests[0]["stream"] is True
+    assert requests[0]["messages"] == [{"role": "user", "content": "你好"}]
+
+
+def test_apredict_stream_wraps_errors():
+    async def handler(request):
+        return httpx.Response(500, json={"error": {"message": "upstream failure"}})
+
+    async def main():
+        model = make_model(handler)
+        return [delta async for delta in await model.apredict([{"role": "user", "content": "你好"}], stream=True)]
+
+    with pytest.raises(Exception, match="Error streaming response"):
+        asyncio.run(main())
+
+
+def test_apredict_without_stream_returns_message():
+    async def handler(request):
+        return httpx.Response(200, json={
+            "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "fake-model",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "完整回答"}, "finish_reason": "stop"}],
+        })
+
+    message = asyncio.run(make_model(handler).apredict("你好"))
+    assert message.content == "完整回答"
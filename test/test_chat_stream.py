@@ -0,0 +1,152 @@
+import json
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src import config
+import src.core.retriever as retriever_module
+from src.core.retriever import Retriever
+import server.routers.chat_router as chat_router
+
+
+class FakeChatModel:
+    """流式输出固定 token 的模型，记录收到的消息"""
+
+    model_name = "fake-model"
+
+    def __init__(self, tokens=("你好", "，", "世界"), delay=0, error=None):
+        self.tokens = tokens
+        self.delay = delay
+        self.error = error
+        self.messages = None
+
+    async def apredict(self, messages, stream=False):
+        self.messages = messages
+
+        async def stream_tokens():
+            for token in self.tokens:
+                await asyncio.sleep(self.delay)
+                yield SimpleNamespace(content=token)
+            if self.error:
+                raise self.error
+
+        return stream_tokens()
+
+
+class FakeKnowledgeBase:
+    def __init__(self):
+        self.queries = []
+
+    async def aquery(self, query_text, db_id, **kwargs):
+        self.queries.append((query_text, db_id))
+        db_ids = db_id if isinstance(db_id, list) else [db_id]
+        results = [{"id": f"{db}-1", "distance": 0.9, "db_id": db, "entity": {"text": f"{db} 的内容"}} for db in db_ids]
+        return {"results": results, "all_results": results}
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    for key, value in {
+        "enable_knowledge_base": True,
+        "enable_reranker": False,
+        "enable_web_search": False,
+        "speculative_retrieval": False,
+        "use_rewrite_query": "off",
+        "retrieval_timeout": 5,
+        "kb_search_mode": "vector",
+        "model_name": "fake-model",
+    }.items():
+        monkeypatch.setitem(config, key, value)
+
+    model = FakeChatModel()
+    knowledge_base = FakeKnowledgeBase()
+    retriever = Retriever()
+    monkeypatch.setattr(chat_router, "select_model", lambda *args, **kwargs: model)
+    monkeypatch.setattr(chat_router, "retriever", retriever)
+    monkeypatch.setattr(retriever_module, "select_model", lambda *args, **kwargs: model)
+    monkeypatch.setattr(retriever_module, "knowledge_base", knowledge_base)
+    monkeypatch.setattr(retriever_module, "graph_base", SimpleNamespace(format_query_result_to_graph=lambda results: {"nodes": [], "edges": []}))
+    yield SimpleNamespace(model=model, knowledge_base=knowledge_base, retriever=retriever)
+    retriever.shutdown()
+
+
+def run_chat_post(query, meta, history=None):
+    """调用 /chat/ 的处理函数并读取完整的流式响应，返回解析后的 chunk 列表"""
+    async def main():
+        response = await chat_router.chat_post(query=query, meta=meta, history=history, thread_id=None, current_user=None)
+        return [chunk async for chunk in response.body_iterator]
+
+    return [json.loads(line) for chunk in asyncio.run(main()) for line in chunk.decode("utf-8").splitlines()]
+
+
+def test_chat_post_federated_retrieval(chat):
+    chunks = run_chat_post("介绍一下产品", {"db_ids": ["kb_a", "kb_b"]})
+
+    assert chat.knowledge_base.queries == [("介绍一下产品", ["kb_a", "kb_b"])]
+    assert [c["status"] for c in chunks][:2] == ["searching", "generating"]
+    assert chunks[-1]["status"] == "finished"
+    results = chunks[-1]["refs"]["knowledge_base"]["results"]
+    assert [r["db_id"] for r in results] == ["kb_a", "kb_b"]
+    # 检索结果拼接进发送给模型的查询中
+    assert "kb_b 的内容" in chat.model.messages[-1]["content"]
+
+
+def test_chat_post_streams_tokens_in_order(chat):
+    chunks = run_chat_post("你好", {}, history=[{"role": "user", "content": "之前的问题"}, {"role": "assistant", "content": "之前的回答"}])
+
+    assert [c["status"] for c in chunks] == ["loading", "loading", "loading", "finished"]
+    assert [c["response"] for c in chunks[:3]] == ["你好", "，", "世界"]
+    assert all(c["meta"]["server_model_name"] == "fake-model" for c in chunks)  # json 协议每个 chunk 都带 meta
+    assert chunks[-1]["history"][-2:] == [{"role": "user", "content": "你好"}, {"role": "assistant", "content": "你好，世界"}]
+    assert chat.knowledge_base.queries == []  # 没有指定知识库时不检索
+    assert [m["content"] for m in chat.model.messages][-3:] == ["之前的问题", "之前的回答", "你好"]
+
+
+def test_chat_post_requests_do_not_block_each_other(chat):
+    chat.model.delay = 0.05  # 每个请求流式输出约 0.15s
+
+    async def main():
+        async def one():
+            response = await chat_router.chat_post(query="你好", meta={}, history=None, thread_id=None, current_user=None)
+            return [chunk async for chunk in response.body_iterator]
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        results = await asyncio.gather(*(one() for _ in range(10)))
+        return results, loop.time() - start
+
+    results, elapsed = asyncio.run(main())
+    assert all(len(chunks) == 4 for chunks in results)
+    assert elapsed < 1.0  # 串行执行需要 1.5s
+
+
+def test_chat_post_reports_retriever_error(chat, monkeypatch):
+    async def failing_acall(query, history, meta):
+        raise RuntimeError("milvus down")
+
+    monkeypatch.setattr(chat.retriever, "acall", failing_acall)
+    chunks = run_chat_post("你好", {"db_id": "kb_a"})
+
+    assert [c["status"] for c in chunks] == ["searching", "error"]
+    assert "milvus down" in chunks[-1]["message"]
+    assert chat.model.messages is None
+
+
+def test_chat_post_reports_model_error_after_partial_output(chat):
+    chat.model.error = RuntimeError("connection reset")
+    chunks = run_chat_post("你好", {})
+
+    assert [c["status"] for c in chunks] == ["loading", "loading", "loading", "error"]
+    assert "connection reset" in chunks[-1]["message"]
+
+
+def test_chat_post_compact_finished_frame_omits_history_and_meta(chat):
+    chunks = run_chat_post("你好", {"db_id": "kb_a", "stream_protocol": "ndjson-delta", "stream_batch_ms": 0},
+                           history=[{"role": "user", "content": "之前的问题"}])
+
+    assert "meta" in chunks[0] and all("meta" not in c for c in chunks[1:])  # meta 只随第一个 chunk 发送
+    finished = chunks[-1]
+    assert finished["status"] == "finished" and "history" not in finished
+    assert "history" not in finished["refs"] and "meta" not in finished["refs"]
+    assert finished["refs"]["knowledge_base"]["results"][0]["db_id"] == "kb_a"
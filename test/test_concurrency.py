@@ -1,8 +1,15 @@
+import os
+import sys
+import json
 import asyncio
 import aiohttp
 import time
 
 
+# /chat/ 需要登录，通过环境变量传入 token
+HEADERS = {"Authorization": f"Bearer {os.getenv('TEST_AUTH_TOKEN', '')}"}
+
+
 async def make_request(session: aiohttp.ClientSession, request_id: int) -> dict:
     """发送单个请求到API"""
     url = "http://localhost:5000/chat/call"
@@ -42,6 +49,78 @@ async def make_request(session: aiohttp.ClientSession, request_id: int) -> dict:
             "error": str(e)
         }
 
+async def make_stream_request(session: aiohttp.ClientSession, request_id: int) -> dict:
+    """发送单个流式聊天请求，记录首个 token 的到达时间（TTFT）"""
+    url = "http://localhost:5000/chat/"
+    payload = {
+        "query": "写一个冒泡排序",
+        "meta": {},
+        "history": [],
+    }
+
+    start_time = time.time()
+    first_token_time = None
+    chunks = 0
+    try:
+        async with session.post(url, json=payload, headers=HEADERS) as response:
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                chunks += 1
+                if first_token_time is None and chunk.get("status") == "loading":
+                    first_token_time = time.time()
+                if chunk.get("status") == "error":
+                    raise RuntimeError(chunk.get("message"))
+
+        end_time = time.time()
+        return {
+            "request_id": request_id,
+            "status": response.status,
+            "time": end_time - start_time,
+            "ttft": (first_token_time or end_time) - start_time,
+            "chunks": chunks,
+            "start_time": start_time,
+            "end_time": end_time,
+            "success": True
+        }
+    except Exception as e:
+        end_time = time.time()
+        return {
+            "request_id": request_id,
+            "status": None,
+            "time": end_time - start_time,
+            "start_time": start_time,
+            "end_time": end_time,
+            "success": False,
+            "error": str(e)
+        }
+
+async def run_stream_test(num_requests: int = 10) -> list[dict]:
+    """并发发起流式聊天请求"""
+    async with aiohttp.ClientSession() as session:
+        tasks = [make_stream_request(session, i) for i in range(num_requests)]
+        return await asyncio.gather(*tasks)
+
+def analyze_stream_results(results: list[dict]) -> None:
+    """统计流式请求的 TTFT 分布"""
+    ttfts = sorted(r["ttft"] for r in results if r["success"])
+    failed_requests = [r for r in results if not r["success"]]
+
+    print("\n=== 流式并发测试结果 ===")
+    print(f"总请求数: {len(results)}")
+    print(f"成功请求: {len(ttfts)}")
+    print(f"失败请求: {len(failed_requests)}")
+    if ttfts:
+        def percentile(p):
+            return ttfts[min(len(ttfts) - 1, int(len(ttfts) * p))]
+        print(f"TTFT 平均: {sum(ttfts) / len(ttfts):.2f} 秒")
+        print(f"TTFT P50: {percentile(0.5):.2f} 秒, P90: {percentile(0.9):.2f} 秒, P99: {percentile(0.99):.2f} 秒")
+        print(f"总耗时最长: {max(r['time'] for r in results if r['success']):.2f} 秒")
+
+    for result in failed_requests[:10]:
+        print(f"请求 ID {result['request_id']}: {result.get('error', '未知错误')}")
+
 async def run_concurrent_test(num_requests: int = 10) -> list[dict]:
     """运行并发测试"""
     async with aiohttp.ClientSession() as session:
@@ -119,6 +198,12 @@ def analyze_results(results: list[dict]) -> None:
 if __name__ == "__main__":
     NUM_REQUESTS = 100  # 设置并发请求数
 
-    print(f"开始运行 {NUM_REQUESTS} 个并发请求的测试...")
-    results = asyncio.run(run_concurrent_test(NUM_REQUESTS))
-    analyze_results(results)
+    # python test/test_concurrency.py stream 测试流式聊天接口的 TTFT
+    if len(sys.argv) > 1 and sys.argv[1] == "stream":
+        print(f"开始运行 {NUM_REQUESTS} 个并发流式请求的测试...")
+        results = asyncio.run(run_stream_test(NUM_REQUESTS))
+        analyze_stream_results(results)
+    else:
+        print(f"开始运行 {NUM_REQUESTS} 个并发请求的测试...")
+        results = asyncio.run(run_concurrent_test(NUM_REQUESTS))
+        analyze_results(results)
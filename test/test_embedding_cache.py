@@ -0,0 +1,84 @@
+import os
+import time
+import asyncio
+import sqlite3
+
+from src import config
+from src.utils.cache import PersistentEmbeddingCache
+
+
+def test_get_and_set(tmp_path):
+    cache = PersistentEmbeddingCache(str(tmp_path / "embedding_cache.db"))
+    cache.set_many("model_a", [("h1", [0.5, 1.0]), ("h2", [0.25, 0.0])])
+
+    assert cache.get_many("model_a", ["h1", "h2", "h3", "h1"]) == {"h1": [0.5, 1.0], "h2": [0.25, 0.0]}
+    assert cache.get_many("model_b", ["h1"]) == {}  # 不同向量模型的向量互不复用
+
+    stats = cache.stats()
+    assert stats["items"] == {"model_a": 2}
+    assert (stats["hits"], stats["misses"]) == (2, 2)
+
+
+def test_max_items_evicts_least_recently_used(tmp_path):
+    cache = PersistentEmbeddingCache(str(tmp_path / "embedding_cache.db"), max_items=2)
+    cache.set_many("m", [("h1", [1.0])])
+    time.sleep(0.01)
+    cache.set_many("m", [("h2", [2.0])])
+    time.sleep(0.01)
+    cache.get_many("m", ["h1"])  # h1 最近被使用过，h2 最久未使用
+    time.sleep(0.01)
+    cache.set_many("m", [("h3", [3.0])])
+
+    assert sorted(cache.get_many("m", ["h1", "h2", "h3"])) == ["h1", "h3"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_max_age_evicts_unused_items(tmp_path):
+    cache = PersistentEmbeddingCache(str(tmp_path / "embedding_cache.db"), max_age=60)
+    cache.set_many("m", [("old", [1.0]), ("new", [2.0])])
+    cache._conn.execute("UPDATE embeddings SET accessed_at = ? WHERE hash = 'old'", (time.time() - 120,))
+
+    assert cache.prune() == 1
+    assert list(cache.get_many("m", ["old", "new"])) == ["new"]
+
+
+def test_clear(tmp_path):
+    cache = PersistentEmbeddingCache(str(tmp_path / "embedding_cache.db"))
+    cache.set_many("model_a", [("h1", [1.0])])
+    cache.set_many("model_b", [("h1", [1.0]), ("h2", [1.0])])
+
+    assert cache.clear("model_b") == 2
+    assert cache.stats()["items"] == {"model_a": 1}
+    assert cache.clear() == 1
+
+
+def test_upgrades_cache_file_without_access_time(tmp_path):
+    path = str(tmp_path / "embedding_cache.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE embeddings (model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                 "created_at REAL NOT NULL, PRIMARY KEY (model, hash)) WITHOUT ROWID")
+    conn.execute("INSERT INTO embeddings VALUES ('m', 'h1', ?, ?)", (b"\x00\x00\x80\x3f", time.time()))
+    conn.commit()
+    conn.close()
+
+    cache = PersistentEmbeddingCache(path, max_items=10)
+    assert cache.get_many("m", ["h1"]) == {"h1": [1.0]}
+    cache.set_many("m", [("h2", [2.0])])
+    assert cache.stats()["items"] == {"m": 2}
+
+
+def test_knowledge_base_creates_cache_only_when_enabled(kb, monkeypatch):
+    asyncio.run(kb._aembed_with_cache(["alpha"]))
+    assert kb._embedding_cache is None
+    assert not os.path.exists(os.path.join(kb.work_dir, "embedding_cache.db"))
+    assert kb.get_cache_stats()["embedding_cache"] is None
+
+    monkeypatch.setitem(config, "enable_embedding_cache", True)
+    monkeypatch.setitem(config, "embedding_cache_max_items", 100)
+    monkeypatch.setitem(config, "embedding_cache_max_age", 0)
+    asyncio.run(kb._aembed_with_cache(["alpha", "beta"]))
+    asyncio.run(kb._aembed_with_cache(["alpha"]))
+
+    assert kb.embed_model.encoded == ["alpha", "alpha", "beta"]
+    assert kb.get_cache_stats()["embedding_cache"]["items"] == {"fake/embedding": 2}
+    assert kb.purge_embedding_cache() == {"items": 2}
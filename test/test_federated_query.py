@@ -0,0 +1,60 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+
+VECTOR_RESULTS = {
+    "kb_a": [("a1", 0.9), ("a2", 0.6), ("a3", 0.2)],
+    "kb_b": [("b1", 0.8), ("b2", 0.7)],
+}
+
+
+@pytest.fixture
+def federated_kb(kb):
+    """向量检索返回固定结果，kb_broken 检索出错，kb_missing 不存在"""
+    kb.searched = []
+
+    def search_by_vector(vector, db_id, limit=3):
+        kb.searched.append(db_id)
+        if db_id == "kb_broken":
+            raise ConnectionError("collection not loaded")
+        return [SimpleNamespace(id=node_id, distance=distance, entity={"text": node_id, "file_id": f"{db_id}_file"})
+                for node_id, distance in VECTOR_RESULTS[db_id][:limit]]
+
+    async def asearch_by_vector(vector, db_id, limit=3):
+        return search_by_vector(vector, db_id, limit)
+
+    kb.search_by_vector = search_by_vector
+    kb.asearch_by_vector = asearch_by_vector
+    kb.get_database_by_id = lambda db_id: {"db_id": db_id} if db_id != "kb_missing" else None
+    kb.check_embed_model = lambda db_id: True
+    return kb
+
+
+def ids(results):
+    return [r["id"] for r in results]
+
+
+def test_federated_query_merges_and_skips_failures(federated_kb):
+    kb = federated_kb
+    response = kb.query("query", ["kb_a", "kb_b", "kb_a", "kb_missing", "kb_broken"])
+
+    assert response["db_ids"] == ["kb_a", "kb_b", "kb_broken"]
+    assert ids(response["all_results"]) == ["a1", "b1", "b2", "a2", "a3"]
+    assert ids(response["results"]) == ["a1", "b1", "b2", "a2"]
+    assert [r["db_id"] for r in response["results"]] == ["kb_a", "kb_b", "kb_b", "kb_a"]
+    assert kb.embed_model.query_calls == 1  # 查询只向量化一次
+
+
+def test_federated_query_without_valid_databases(federated_kb):
+    response = federated_kb.query("query", ["kb_missing"])
+    assert response == {"results": [], "all_results": [], "db_ids": []}
+    assert federated_kb.embed_model.query_calls == 0
+
+
+def test_async_federated_query_matches_sync(federated_kb):
+    kb = federated_kb
+    sync_response = kb.query("query", ["kb_a", "kb_b", "kb_broken"], use_cache=False)
+    async_response = asyncio.run(kb.aquery("query", ["kb_a", "kb_b", "kb_broken"], use_cache=False))
+    assert async_response == sync_response
@@ -0,0 +1,78 @@
+import pytest
+
+from server.models.kb_models import KnowledgeDatabase, KnowledgeFile, KnowledgeNode
+from src.core.knowledgebase import build_fts_match_query
+
+
+def add_file(db, db_id, file_id, texts, status="done"):
+    with db.get_session_context() as session:
+        if not session.query(KnowledgeDatabase).filter_by(db_id=db_id).first():
+            session.add(KnowledgeDatabase(db_id=db_id, name=db_id, description=""))
+        session.add(KnowledgeFile(file_id=file_id, database_id=db_id, filename=f"{file_id}.txt",
+                                  path=f"/tmp/{file_id}.txt", file_type="txt", status=status))
+        session.add_all([KnowledgeNode(file_id=file_id, text=text, hash=str(i)) for i, text in enumerate(texts)])
+
+
+def ids(results):
+    return [r["id"] for r in results]
+
+
+def test_fts_match_query_terms():
+    # 中文切分为重叠的三字组，英文与编号整体作为短语，短于 3 个字符的词项被忽略
+    assert build_fts_match_query("向量数据库") == '"向量数" OR "量数据" OR "数据库"'
+    assert build_fts_match_query("GPT-4o 的 API 文档") == '"GPT-4o" OR "API"'
+    assert build_fts_match_query("a b 中文") == ""
+    assert build_fts_match_query("数据库数据库") == '"数据库" OR "据库数" OR "库数据"'
+    assert len(build_fts_match_query("一二三四五六七八九十" * 5, max_terms=4).split(" OR ")) == 4
+
+
+def test_search_lexical_ranks_by_bm25(kb, db):
+    if not db.fts_enabled:
+        pytest.skip("SQLite 不支持 FTS5 trigram 分词")
+
+    add_file(db, "kb_a", "f1", ["向量数据库 Milvus 的索引类型", "今天天气不错", "Milvus 向量数据库 向量数据库 的部署"])
+    add_file(db, "kb_a", "f2", ["向量数据库 Milvus 尚未完成索引"], status="processing")
+    add_file(db, "kb_b", "f3", ["向量数据库 Milvus"])
+
+    results = kb.search_lexical("向量数据库", ["kb_a"])
+    assert {r["entity"]["text"] for r in results} == {"向量数据库 Milvus 的索引类型", "Milvus 向量数据库 向量数据库 的部署"}
+    assert results[0]["entity"]["text"] == "Milvus 向量数据库 向量数据库 的部署"
+    assert all(r["db_id"] == "kb_a" and r["bm25_score"] > 0 for r in results)
+
+    assert len(kb.search_lexical("Milvus", ["kb_a", "kb_b"])) == 3
+    assert kb.search_lexical("ab", ["kb_a"]) == []
+
+
+def test_hybrid_candidates_rrf(kb, monkeypatch):
+    vector_dicts = [
+        {"id": 1, "distance": 0.9, "entity": {"text": "v1"}},
+        {"id": 2, "distance": 0.8, "entity": {"text": "v2"}},
+        {"id": 3, "distance": 0.1, "entity": {"text": "v3"}},  # 低于相似度阈值，不参与融合
+    ]
+    lexical_dicts = [
+        {"id": 2, "distance": 0.0, "bm25_score": 5.0, "entity": {"text": "v2"}},
+        {"id": 4, "distance": 0.0, "bm25_score": 3.0, "entity": {"text": "l4"}},
+    ]
+    monkeypatch.setattr(kb, "search_lexical", lambda query_text, db_ids, limit=20: lexical_dicts)
+
+    all_results, candidates = kb._hybrid_candidates("query", vector_dicts, ["kb_a"], limit=10, distance_threshold=0.5, rrf_k=60)
+
+    assert ids(all_results) == [1, 2, 3, 4]
+    assert ids(candidates) == [2, 1, 4]  # 两路都命中的结果排在最前
+    assert candidates[0]["rrf_score"] == pytest.approx(1 / 62 + 1 / 61)
+    assert candidates[0]["sources"] == ["vector", "lexical"] and candidates[0]["bm25_score"] == 5.0
+    assert candidates[1]["sources"] == ["vector"] and candidates[2]["sources"] == ["lexical"]
+    assert "rrf_score" not in vector_dicts[1]  # 候选结果是副本，不修改原始结果
+
+
+def test_hybrid_query_returns_fused_results(kb, db, monkeypatch):
+    if not db.fts_enabled:
+        pytest.skip("SQLite 不支持 FTS5 trigram 分词")
+
+    add_file(db, "kb_a", "f1", ["产品编号 XK-2031 的保修政策", "退货流程说明"])
+    monkeypatch.setattr(kb, "search", lambda query_text, db_id, limit=3: [])  # 向量检索没有命中
+
+    response = kb.query("XK-2031", "kb_a", search_mode="hybrid")
+    assert [r["entity"]["text"] for r in response["results"]] == ["产品编号 XK-2031 的保修政策"]
+    assert response["results"][0]["sources"] == ["lexical"]
+    assert response["results"][0]["file"]["filename"] == "f1.txt"
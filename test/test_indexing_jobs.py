@@ -0,0 +1,126 @@
+import time
+import asyncio
+
+import pytest
+
+from server.models.kb_models import KnowledgeDatabase, KnowledgeFile, IndexingJob
+
+
+@pytest.fixture(autouse=True)
+def files(db, tmp_path):
+    with db.get_session_context() as session:
+        session.add(KnowledgeDatabase(db_id="kb_1", name="kb_1", description=""))
+        for i in range(3):
+            session.add(KnowledgeFile(file_id=f"file_{i}", database_id="kb_1", filename=f"{i}.txt",
+                                      path=str(tmp_path / f"{i}.txt"), file_type="txt", status="waiting"))
+
+
+def get_job(db, file_id):
+    with db.get_session_context() as session:
+        return session.query(IndexingJob).filter_by(file_id=file_id).first().to_dict()
+
+
+def get_file_status(db, file_id):
+    with db.get_session_context() as session:
+        return session.query(KnowledgeFile.status).filter_by(file_id=file_id).scalar()
+
+
+def test_lease_is_acquired_once(kb, db):
+    assert kb._upsert_indexing_job("kb_1", "file_0")
+    assert kb._acquire_job_lease("file_0")
+    assert not kb._acquire_job_lease("file_0")
+
+    job = get_job(db, "file_0")
+    assert job["status"] == "running" and job["attempts"] == 1
+
+
+def test_expired_lease_can_be_taken_over(kb, db):
+    kb._upsert_indexing_job("kb_1", "file_0")
+    kb.indexing_lease_timeout = -1  # 领取后租约立即过期，模拟工作进程崩溃
+    assert kb._acquire_job_lease("file_0")
+
+    kb.indexing_lease_timeout = 600
+    assert kb._acquire_job_lease("file_0")
+    assert get_job(db, "file_0")["attempts"] == 2
+
+
+def test_upsert_keeps_job_under_live_lease(kb, db):
+    kb._upsert_indexing_job("kb_1", "file_0")
+    kb._acquire_job_lease("file_0")
+    kb._save_job_checkpoint("file_0", 42, 10)
+
+    assert not kb._upsert_indexing_job("kb_1", "file_0")
+    job = get_job(db, "file_0")
+    assert job["status"] == "running" and job["attempts"] == 1
+    assert job["checkpoint_node_id"] == 42
+
+
+def test_checkpoint_survives_retry(kb, db):
+    kb._upsert_indexing_job("kb_1", "file_0")
+    assert kb._get_job_checkpoint("file_0") == (0, False)
+
+    kb._acquire_job_lease("file_0")
+    kb._save_job_checkpoint("file_0", 42, 10)
+    kb._save_job_checkpoint("file_0", 57, 5)
+    assert get_job(db, "file_0")["indexed_count"] == 15
+
+    kb._finish_indexing_job("file_0", {"status": "failed", "message": "timeout"})
+    job = get_job(db, "file_0")
+    assert job["status"] == "queued" and job["last_error"] == "timeout"
+    assert job["next_run_at"] >= time.time() + kb.indexing_retry_backoff - 5
+    assert get_file_status(db, "file_0") == "waiting"
+
+    assert kb._acquire_job_lease("file_0")
+    assert kb._get_job_checkpoint("file_0") == (57, True)
+
+
+def test_retry_backoff_and_max_attempts(kb, db):
+    kb._upsert_indexing_job("kb_1", "file_0")
+    delays = []
+    for _ in range(kb.indexing_max_attempts):
+        assert kb._acquire_job_lease("file_0")
+        before = time.time()
+        kb._finish_indexing_job("file_0", {"status": "failed", "message": "error"})
+        job = get_job(db, "file_0")
+        if job["status"] == "queued":
+            delays.append(round(job["next_run_at"] - before))
+
+    assert delays == [30, 60]
+    assert get_job(db, "file_0")["status"] == "failed"
+
+
+def test_non_retryable_failure(kb, db):
+    kb._upsert_indexing_job("kb_1", "file_0")
+    kb._acquire_job_lease("file_0")
+    kb._finish_indexing_job("file_0", {"status": "failed", "message": "bad file", "retryable": False})
+    assert get_job(db, "file_0")["status"] == "failed"
+
+
+def test_reindex_done_job_resets_checkpoint(kb, db):
+    kb._upsert_indexing_job("kb_1", "file_0")
+    kb._acquire_job_lease("file_0")
+    kb._save_job_checkpoint("file_0", 42, 10)
+    kb._finish_indexing_job("file_0", {"status": "success"})
+
+    assert kb._upsert_indexing_job("kb_1", "file_0")
+    job = get_job(db, "file_0")
+    assert (job["status"], job["attempts"], job["checkpoint_node_id"]) == ("queued", 0, 0)
+
+
+def test_clear_queue_releases_waiting_files(kb, db):
+    async def main():
+        for i in range(3):
+            kb._upsert_indexing_job("kb_1", f"file_{i}")
+            await kb.indexing_pool.submit(kb._make_indexing_task("kb_1", f"file_{i}"))
+        kb._acquire_job_lease("file_2")  # 正在处理的任务不受影响
+        with db.get_session_context() as session:
+            session.query(KnowledgeFile).filter_by(file_id="file_2").update({"status": "processing"})
+        return await kb.clear_queue()
+
+    assert asyncio.run(main()) == 3
+    assert kb.processing_tasks == {}
+    for i in range(2):
+        assert get_job(db, f"file_{i}")["status"] == "cancelled"
+        assert get_file_status(db, f"file_{i}") == "pending_indexing"
+    assert get_job(db, "file_2")["status"] == "running"
+    assert get_file_status(db, "file_2") == "processing"
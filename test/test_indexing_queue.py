@@ -0,0 +1,111 @@
+import asyncio
+
+from src.core.indexing_queue import FairTaskQueue, IndexingWorkerPool
+
+
+def task(db_id, file_id, size=0):
+    return {"db_id": db_id, "file_id": file_id, "size": size}
+
+
+def test_round_robin_between_databases():
+    async def main():
+        queue = FairTaskQueue(per_db_concurrency=10)
+        for i in range(3):
+            await queue.put(task("kb_a", f"a{i}"))
+        await queue.put(task("kb_b", "b0"))
+        await queue.put(task("kb_c", "c0"))
+        return [(await queue.get())["file_id"] for _ in range(5)]
+
+    # kb_a 中排在前面的大批量文件不会阻塞其他知识库
+    assert asyncio.run(main()) == ["a0", "b0", "c0", "a1", "a2"]
+
+
+def test_per_db_concurrency_limit():
+    async def main():
+        queue = FairTaskQueue(per_db_concurrency=1)
+        await queue.put(task("kb_a", "a0"))
+        await queue.put(task("kb_a", "a1"))
+
+        first = await queue.get()
+        waiting = asyncio.create_task(queue.get())
+        await asyncio.sleep(0.01)
+        blocked = not waiting.done()
+
+        await queue.task_done(first)
+        second = await asyncio.wait_for(waiting, 1)
+        return first["file_id"], blocked, second["file_id"]
+
+    assert asyncio.run(main()) == ("a0", True, "a1")
+
+
+def test_small_files_first():
+    async def main():
+        queue = FairTaskQueue(per_db_concurrency=10, small_files_first=True)
+        for file_id, size in (("big", 100), ("small", 1), ("medium", 10)):
+            await queue.put(task("kb_a", file_id, size))
+        return [(await queue.get())["file_id"] for _ in range(3)]
+
+    assert asyncio.run(main()) == ["small", "medium", "big"]
+
+
+def test_clear_keeps_pending_stop_signals():
+    async def main():
+        queue = FairTaskQueue()
+        await queue.put(task("kb_a", "a0"))
+        await queue.stop(1)
+        cleared = await queue.clear()
+        return [t["file_id"] for t in cleared], await asyncio.wait_for(queue.get(), 1)
+
+    assert asyncio.run(main()) == (["a0"], None)
+
+
+def test_pool_processes_all_tasks():
+    async def main():
+        processed = []
+
+        async def handler(task_data):
+            await asyncio.sleep(0.001)
+            processed.append(task_data["file_id"])
+
+        pool = IndexingWorkerPool(handler, concurrency=3, per_db_concurrency=2)
+        pool.start()
+        for i in range(10):
+            await pool.submit(task(f"kb_{i % 3}", f"f{i}"))
+        while pool.tasks:
+            await asyncio.sleep(0.01)
+        await pool.stop(timeout=1)
+        return sorted(processed), pool.is_running
+
+    processed, running = asyncio.run(main())
+    assert processed == sorted(f"f{i}" for i in range(10))
+    assert not running
+
+
+def test_restart_after_forced_stop():
+    async def main():
+        processed = []
+        release = asyncio.Event()
+
+        async def handler(task_data):
+            if task_data["file_id"] == "slow":
+                await release.wait()
+            processed.append(task_data["file_id"])
+
+        pool = IndexingWorkerPool(handler, concurrency=2)
+        pool.start()
+        await pool.submit(task("kb_a", "slow"))
+        await asyncio.sleep(0.01)
+        # 处理中的工作协程在超时后被取消，它的停止信号没有被取走
+        await pool.stop(timeout=0.05)
+
+        pool.start()
+        await pool.submit(task("kb_a", "fast"))
+        for _ in range(100):
+            if processed:
+                break
+            await asyncio.sleep(0.01)
+        alive = sum(not worker.done() for worker in pool.workers)
+        await pool.stop(timeout=1)
+        return processed, alive
+
+    assert asyncio.run(main()) == (["fast"], 2)
@@ -0,0 +1,124 @@
+import os
+
+import pytest
+
+from src.utils.cache import ParseCache
+
+
+def producer(records, calls):
+    for record in records:
+        calls.append(record)
+        yield record
+
+
+@pytest.fixture
+def source_file(tmp_path):
+    path = tmp_path / "doc.txt"
+    path.write_text("hello world", encoding="utf-8")
+    return path
+
+
+def test_miss_then_hit(tmp_path, source_file):
+    cache = ParseCache(str(tmp_path / "cache"))
+    key = cache.make_key(source_file, "pdf", {"enable_ocr": "disable"})
+    records = [{"text": "第一页"}, {"text": "第二页", "metadata": {"page": 2}}]
+
+    calls = []
+    assert list(cache.cached(key, producer(records, calls))) == records
+    assert len(calls) == 2
+
+    calls = []
+    assert list(cache.cached(key, producer(records, calls))) == records
+    assert calls == []  # 命中时不再调用解析器
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["items"]) == (1, 1, 1)
+
+
+def test_key_depends_on_content_and_options(tmp_path, source_file):
+    cache = ParseCache(str(tmp_path / "cache"))
+    key = cache.make_key(source_file, "pdf", {"enable_ocr": "disable"})
+
+    assert cache.make_key(source_file, "pdf", {"enable_ocr": "onnx_rapid_ocr"}) != key
+    assert cache.make_key(source_file, "loader.txt") != key
+
+    copy = source_file.with_name("copy.txt")
+    copy.write_bytes(source_file.read_bytes())
+    assert cache.make_key(copy, "pdf", {"enable_ocr": "disable"}) == key  # 只与文件内容有关
+
+    source_file.write_text("changed", encoding="utf-8")
+    assert cache.make_key(source_file, "pdf", {"enable_ocr": "disable"}) != key
+
+
+def test_aborted_producer_is_not_cached(tmp_path, source_file):
+    cache = ParseCache(str(tmp_path / "cache"))
+    key = cache.make_key(source_file, "pdf")
+
+    def failing():
+        yield {"text": "page 1"}
+        raise RuntimeError("parser crashed")
+
+    with pytest.raises(RuntimeError):
+        list(cache.cached(key, failing()))
+
+    # 消费方提前结束迭代同样不写入缓存
+    iterator = cache.cached(key, producer([{"text": "a"}, {"text": "b"}], []))
+    next(iterator)
+    iterator.close()
+
+    assert cache.stats()["items"] == 0
+    leftovers = [name for _, _, files in os.walk(tmp_path / "cache") for name in files]
+    assert leftovers == []
+
+    calls = []
+    list(cache.cached(key, producer([{"text": "a"}], calls)))
+    assert calls == [{"text": "a"}]
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    cache = ParseCache(str(tmp_path / "cache"), max_bytes=10 ** 9)
+    keys = []
+    for i in range(3):
+        path = tmp_path / f"doc{i}.txt"
+        path.write_text(f"document {i}", encoding="utf-8")
+        key = cache.make_key(path, "loader.txt")
+        list(cache.cached(key, iter([{"text": os.urandom(2000).hex()}])))
+        os.utime(cache._path(key), (1000 + i, 1000 + i))
+        keys.append(key)
+
+    # 读取最早写入的条目会刷新它的使用时间
+    list(cache.cached(keys[0], iter([])))
+
+    entry_size = os.path.getsize(cache._path(keys[1]))
+    cache.max_bytes = 2 * entry_size + entry_size // 2
+    assert cache.evict() == 1
+
+    assert os.path.exists(cache._path(keys[0]))
+    assert not os.path.exists(cache._path(keys[1]))
+    assert os.path.exists(cache._path(keys[2]))
+
+
+def test_purge(tmp_path, source_file):
+    cache = ParseCache(str(tmp_path / "cache"))
+    list(cache.cached(cache.make_key(source_file, "pdf"), iter([{"text": "x"}])))
+
+    result = cache.purge()
+    assert result["items"] == 1 and result["bytes"] > 0
+    assert cache.stats()["items"] == 0
+
+
+def test_cached_loader_metadata_uses_current_path(tmp_path, source_file):
+    pytest.importorskip("langchain_community")
+    from src.core.indexing import iter_file_chunks
+
+    cache = ParseCache(str(tmp_path / "cache"))
+    other = tmp_path / "other_kb" / "doc.txt"
+    other.parent.mkdir()
+    other.write_bytes(source_file.read_bytes())
+
+    first = list(iter_file_chunks(source_file, parse_cache=cache))
+    second = list(iter_file_chunks(other, parse_cache=cache))
+
+    assert cache.stats()["hits"] == 1
+    assert [node.page_content for node in first] == [node.page_content for node in second]
+    assert all(node.metadata["source"] == str(other) for node in second)
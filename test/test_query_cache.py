@@ -0,0 +1,71 @@
+import pytest
+
+
+TEXTS = ["alpha", "beta", "gamma"]
+
+
+@pytest.fixture
+def indexed_kb(kb):
+    kb.client.create_collection("kb_a", dimension=kb.embed_model.dimension)
+    kb.client.insert("kb_a", [
+        {"id": i, "vector": kb.embed_model._vector(text), "text": text, "file_id": f"file_{text}"}
+        for i, text in enumerate(TEXTS)
+    ])
+
+    kb.searches = 0
+    search = kb.client.search
+
+    def counting_search(*args, **kwargs):
+        kb.searches += 1
+        return search(*args, **kwargs)
+
+    kb.client.search = counting_search
+    return kb
+
+
+def texts(response):
+    return [r["entity"]["text"] for r in response["results"]]
+
+
+def test_repeated_query_is_served_from_cache(indexed_kb):
+    kb = indexed_kb
+    first = kb.query("alpha", "kb_a", distance_threshold=0.99)
+    assert texts(first) == ["alpha"]
+
+    first["results"].clear()  # 返回的是副本，修改不影响缓存
+    assert texts(kb.query("alpha", "kb_a", distance_threshold=0.99)) == ["alpha"]
+    assert kb.searches == 1
+
+    # 参数不同的查询不共用缓存
+    kb.query("alpha", "kb_a", distance_threshold=0.99, top_k=1)
+    kb.query("alpha", "kb_a", use_cache=False, distance_threshold=0.99)
+    assert kb.searches == 3
+
+
+def test_write_bumps_version(indexed_kb):
+    kb = indexed_kb
+    kb.query("alpha", "kb_a")
+    kb._bump_db_version("kb_b")  # 其他知识库的写入不影响
+    kb.query("alpha", "kb_a")
+    assert kb.searches == 1
+
+    kb._bump_db_version("kb_a")
+    kb.query("alpha", "kb_a")
+    assert kb.searches == 2
+
+
+def test_query_during_delete_is_not_cached_after_delete(indexed_kb):
+    kb = indexed_kb
+    assert texts(kb.query("alpha", "kb_a", distance_threshold=0.99)) == ["alpha"]
+
+    delete = kb.client.delete
+
+    def delete_with_concurrent_query(*args, **kwargs):
+        # 删除进行中到达的查询会以删除开始时的版本号缓存删除前的结果
+        assert texts(kb.query("alpha", "kb_a", distance_threshold=0.99)) == ["alpha"]
+        return delete(*args, **kwargs)
+
+    kb.client.delete = delete_with_concurrent_query
+    kb.delete_file("kb_a", "file_alpha")
+
+    assert texts(kb.query("alpha", "kb_a", distance_threshold=0.99)) == []
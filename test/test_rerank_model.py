@@ -0,0 +1,68 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from src import config
+import src.models.rerank_model as rerank_module
+from src.models.rerank_model import OnlineRerank
+
+
+def fake_response(payload):
+    results = [{"index": i, "relevance_score": float(len(doc))} for i, doc in enumerate(payload["documents"])]
+    return SimpleNamespace(text=rerank_module.json.dumps({"results": results}))
+
+
+@pytest.fixture
+def reranker(monkeypatch):
+    monkeypatch.setitem(config, "reranker", "test/reranker")
+    monkeypatch.setitem(config, "reranker_names", {"test/reranker": {
+        "name": "reranker", "url": "http://rerank.test/v1/rerank", "api_key": "sk-test",
+        "batch_size": 1, "max_concurrency": 2,
+    }})
+    monkeypatch.setattr(rerank_module, "rerank_score_cache", None)
+    reranker = OnlineRerank()
+    yield reranker
+    reranker.close()
+
+
+def test_compute_score_keeps_order_across_batches(reranker, monkeypatch):
+    monkeypatch.setattr(reranker.session, "post", lambda url, json, headers: fake_response(json))
+    assert reranker.compute_score(["q", ["a", "bbb", "cc"]]) == [1.0, 3.0, 2.0]
+
+
+def test_close_waits_for_in_flight_calls(reranker, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_post(url, json, headers):
+        started.set()
+        release.wait(5)
+        return fake_response(json)
+
+    monkeypatch.setattr(reranker.session, "post", slow_post)
+    result = {}
+    worker = threading.Thread(target=lambda: result.update(scores=reranker.compute_score(["q", ["a", "bb", "ccc"]])))
+    worker.start()
+    assert started.wait(5)
+
+    reranker.close()  # 模型重新加载时旧实例仍在处理请求
+    assert not reranker._executor._shutdown
+    release.set()
+    worker.join(5)
+
+    assert result["scores"] == [1.0, 2.0, 3.0]  # 剩余的批次仍能提交到线程池
+    assert reranker._executor._shutdown
+
+
+def test_compute_score_after_close_sends_serial_requests(reranker, monkeypatch):
+    posted = []
+
+    def post(url, json, headers):
+        posted.append(json["documents"])
+        return fake_response(json)
+
+    monkeypatch.setattr(rerank_module.requests, "post", post)
+    reranker.close()
+
+    assert reranker.compute_score(["q", ["a", "bb"]]) == [1.0, 2.0]
+    assert posted == [["a"], ["bb"]]
@@ -0,0 +1,113 @@
+import time
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src import config
+import src.core.retriever as retriever_module
+from src.core.retriever import Retriever
+
+
+class SlowKnowledgeBase:
+    """aquery 等待 delay 秒后返回，记录是否在完成前被取消"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.cancelled = False
+
+    async def aquery(self, query_text, db_id, **kwargs):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return {"results": [{"id": 1, "entity": {"text": "命中"}}], "all_results": []}
+
+
+@pytest.fixture
+def retriever(monkeypatch):
+    for key, value in {
+        "enable_knowledge_base": True,
+        "enable_reranker": False,
+        "enable_web_search": False,
+        "speculative_retrieval": False,
+        "use_rewrite_query": "off",
+        "retrieval_timeout": 30,
+    }.items():
+        monkeypatch.setitem(config, key, value)
+
+    monkeypatch.setattr(retriever_module, "select_model", lambda *args, **kwargs: None)
+    monkeypatch.setattr(retriever_module, "graph_base", SimpleNamespace(format_query_result_to_graph=lambda results: {"nodes": [], "edges": []}))
+    retriever = Retriever()
+    yield retriever
+    retriever.shutdown()
+
+
+def test_aretrieval_returns_results_before_deadline(retriever, monkeypatch):
+    monkeypatch.setattr(retriever_module, "knowledge_base", SlowKnowledgeBase(delay=0))
+    refs = asyncio.run(retriever.aretrieval("问题", [], {"db_id": "kb_a"}))
+
+    assert refs["knowledge_base"]["results"] == [{"id": 1, "entity": {"text": "命中"}}]
+    assert refs["graph_base"]["results"] == {"nodes": [], "edges": []}
+    assert retriever.get_retrieval_stats()["timeouts"] == 0
+
+
+def test_aretrieval_deadline_cancels_slow_source(retriever, monkeypatch):
+    knowledge_base = SlowKnowledgeBase(delay=10)
+    monkeypatch.setattr(retriever_module, "knowledge_base", knowledge_base)
+
+    start = time.time()
+    refs = asyncio.run(retriever.aretrieval("问题", [], {"db_id": "kb_a", "retrieval_timeout": 0.1}))
+
+    assert time.time() - start < 2
+    assert knowledge_base.cancelled
+    assert refs["knowledge_base"]["results"] == []
+    assert "检索超时" in refs["knowledge_base"]["message"]
+    # 其他数据源不受影响
+    assert refs["graph_base"]["results"] == {"nodes": [], "edges": []}
+    stats = retriever.get_retrieval_stats()
+    assert stats["timeouts"] == 1 and stats["cancelled"] == 1
+
+
+def test_aretrieval_isolates_source_errors(retriever, monkeypatch):
+    async def failing_aquery(query_text, db_id, **kwargs):
+        raise ConnectionError("milvus down")
+
+    monkeypatch.setattr(retriever_module, "knowledge_base", SimpleNamespace(aquery=failing_aquery))
+    refs = asyncio.run(retriever.aretrieval("问题", [], {"db_id": "kb_a"}))
+
+    assert refs["knowledge_base"]["results"] == []
+    assert "milvus down" in refs["knowledge_base"]["message"]
+    assert refs["web_search"]["results"] == []
+
+
+def test_aretrieval_cancels_sources_when_caller_is_cancelled(retriever, monkeypatch):
+    knowledge_base = SlowKnowledgeBase(delay=10)
+    monkeypatch.setattr(retriever_module, "knowledge_base", knowledge_base)
+
+    async def main():
+        task = asyncio.create_task(retriever.aretrieval("问题", [], {"db_id": "kb_a"}))
+        await asyncio.sleep(0.05)
+        task.cancel()  # 客户端断开连接
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+        return knowledge_base.cancelled  # asyncio.run 退出时会取消所有剩余任务，需要在事件循环结束前检查
+
+    assert asyncio.run(main())
+    assert retriever.get_retrieval_stats()["timeouts"] == 0
+
+
+def test_thread_pools_are_created_on_first_use(retriever, monkeypatch):
+    monkeypatch.setattr(retriever_module, "knowledge_base", SlowKnowledgeBase(delay=0))
+    asyncio.run(retriever.aretrieval("问题", [], {"db_id": "kb_a"}))
+    assert retriever._retrieval_executor is None and retriever._speculation_executor is None
+
+    monkeypatch.setattr(retriever, "query_knowledgebase", lambda query, history, refs: {"results": []})
+    refs = retriever.retrieval("问题", [], {})
+    assert refs["knowledge_base"] == {"results": []}
+    assert retriever._retrieval_executor is not None
+
+    retriever.shutdown()
+    assert retriever._retrieval_executor is None
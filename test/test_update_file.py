@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+from server.models.kb_models import KnowledgeDatabase, KnowledgeFile, KnowledgeNode
+from src.core.knowledgebase import parse_node_data
+
+
+def make_chunks(texts):
+    chunks, start = [], 0
+    for text in texts:
+        chunks.append(parse_node_data({"text": text, "start_char_idx": start, "end_char_idx": start + len(text), "metadata": {}}))
+        start += len(text) + 1
+    return chunks
+
+
+@pytest.fixture
+def indexed_file(kb, db, tmp_path, monkeypatch):
+    """已完成索引的文件 file_1，包含 alpha/beta/gamma 三个知识块；update_file 解析出的知识块由 kb.new_texts 指定"""
+    with db.get_session_context() as session:
+        session.add(KnowledgeDatabase(db_id="kb_a", name="kb_a", description=""))
+        session.add(KnowledgeFile(file_id="file_1", database_id="kb_a", filename="doc.txt",
+                                  path=str(tmp_path / "doc.txt"), file_type="txt", status="done"))
+
+    nodes = make_chunks(["alpha", "beta", "gamma"])
+    node_ids = kb.add_nodes("file_1", nodes)
+    kb.client.create_collection("kb_a", dimension=kb.embed_model.dimension)
+    kb.client.insert("kb_a", [
+        kb._build_vector_entry("file_1", {**node, "id": node_id, "meta_info": {}}, kb.embed_model._vector(node["text"]))
+        for node_id, node in zip(node_ids, nodes)
+    ])
+
+    async def parse_file_to_nodes(file_path, params=None):
+        return make_chunks(kb.new_texts)
+
+    kb.new_texts = ["alpha", "beta", "gamma"]
+    monkeypatch.setattr(kb, "_parse_file_to_nodes", parse_file_to_nodes)
+    return kb
+
+
+def update(kb, file_path="doc.txt"):
+    return asyncio.run(kb.update_file("kb_a", "file_1", file_path))
+
+
+def stored_nodes(db):
+    with db.get_session_context() as session:
+        return [(node.id, node.text, node.start_char_idx)
+                for node in session.query(KnowledgeNode).filter_by(file_id="file_1").order_by(KnowledgeNode.start_char_idx)]
+
+
+def stored_vectors(kb):
+    return sorted((row["id"], row["text"], row["start_char_idx"])
+                  for row in kb.client.query("kb_a", filter="file_id == 'file_1'", output_fields=["id", "text", "start_char_idx"]))
+
+
+def get_file(db):
+    with db.get_session_context() as session:
+        return session.query(KnowledgeFile).filter_by(file_id="file_1").first().to_dict()
+
+
+def test_unchanged_file_keeps_nodes_and_vectors(indexed_file, db):
+    kb = indexed_file
+    nodes_before, vectors_before = stored_nodes(db), stored_vectors(kb)
+
+    result = update(kb)
+
+    assert result == {"file_id": "file_1", "status": "done", "kept": 3, "moved": 0, "removed": 0, "added": 0}
+    assert stored_nodes(db) == nodes_before
+    assert stored_vectors(kb) == vectors_before
+    assert kb.embed_model.encoded == []
+
+
+def test_edited_file_only_embeds_changed_chunks(indexed_file, db):
+    kb = indexed_file
+    kb.new_texts = ["alpha", "BETA", "gamma"]
+    alpha_id = stored_nodes(db)[0][0]
+
+    result = update(kb, "doc.md")
+
+    assert (result["kept"], result["removed"], result["added"], result["status"]) == (2, 1, 1, "done")
+    assert [text for _, text, _ in stored_nodes(db)] == ["alpha", "BETA", "gamma"]
+    assert stored_nodes(db)[0][0] == alpha_id
+    assert [text for _, text, _ in stored_vectors(kb)] == ["alpha", "gamma", "BETA"]
+    assert kb.embed_model.encoded == ["BETA"]
+
+    file = get_file(db)
+    assert (file["filename"], file["type"]) == ("doc.md", "md")
+
+
+def test_reordered_file_keeps_node_ids(indexed_file, db):
+    kb = indexed_file
+    ids_by_text = {text: node_id for node_id, text, _ in stored_nodes(db)}
+    kb.new_texts = ["gamma", "alpha", "beta"]
+
+    result = update(kb)
+
+    assert (result["kept"], result["moved"], result["removed"], result["added"]) == (3, 3, 0, 0)
+    assert stored_nodes(db) == [(ids_by_text["gamma"], "gamma", 0), (ids_by_text["alpha"], "alpha", 6), (ids_by_text["beta"], "beta", 12)]
+    # 向量库中的位置信息同步更新
+    assert stored_vectors(kb) == sorted(stored_nodes(db))
+
+
+def test_vector_update_failure_falls_back_to_reindex(indexed_file, db, monkeypatch):
+    kb = indexed_file
+    kb.new_texts = ["alpha", "BETA", "gamma"]
+    triggered = []
+
+    def failing_insert(*args, **kwargs):
+        raise ConnectionError("milvus down")
+
+    async def trigger_file_indexing(db_id, file_id):
+        triggered.append(file_id)
+        return {"status": "queued"}
+
+    monkeypatch.setattr(kb.client, "insert", failing_insert)
+    monkeypatch.setattr(kb, "trigger_file_indexing", trigger_file_indexing)
+
+    result = update(kb)
+
+    assert result["status"] == "queued"
+    assert triggered == ["file_1"]
+    assert stored_vectors(kb) == []  # 清理该文件的全部向量后重新索引
+    assert get_file(db)["status"] == "pending_indexing"
+
+
+def test_update_is_rejected_when_status_changes_during_parse(indexed_file, db, monkeypatch):
+    kb = indexed_file
+    nodes_before = stored_nodes(db)
+
+    async def parse_while_indexing_starts(file_path, params=None):
+        kb.update_file_status("file_1", "waiting")  # 解析期间文件被加入索引队列
+        return make_chunks(["alpha", "BETA", "gamma"])
+
+    monkeypatch.setattr(kb, "_parse_file_to_nodes", parse_while_indexing_starts)
+
+    with pytest.raises(ValueError, match="解析期间"):
+        update(kb)
+    assert stored_nodes(db) == nodes_before
+    assert get_file(db)["status"] == "waiting"
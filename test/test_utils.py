@@ -0,0 +1,18 @@
+import asyncio
+
+from src.utils import get_async_http_client
+
+
+def test_async_http_client_is_shared_per_loop_and_timeout():
+    async def main():
+        default, same = get_async_http_client(), get_async_http_client()
+        short = get_async_http_client(timeout=5)
+        assert default is same
+        assert short is not default
+        assert short.timeout.read == 5 and default.timeout.read == 60
+        await short.aclose()
+        assert get_async_http_client(timeout=5) is not short  # 已关闭的客户端会重新创建
+        return default
+
+    first_loop_client = asyncio.run(main())
+    assert asyncio.run(main()) is not first_loop_client  # 不同事件循环不共用连接池
@@ -0,0 +1,111 @@
+import os
+import json
+
+import numpy as np
+import pytest
+
+from src.core.vector_store import LocalVectorStore, parse_filter
+
+
+DIM = 8
+
+
+def make_items(ids, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{"id": i, "vector": rng.normal(size=DIM).tolist(), "text": f"text {i}", "file_id": f"file_{i % 2}"} for i in ids]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalVectorStore(str(tmp_path))
+    store.create_collection("kb", dimension=DIM)
+    return store
+
+
+def test_insert_and_search(store):
+    items = make_items(range(10))
+    store.insert("kb", items)
+
+    query = np.asarray(items[3]["vector"], dtype=np.float32)
+    hits = store.search("kb", [query], limit=3, output_fields=["text"])[0]
+
+    assert hits[0]["id"] == 3
+    assert hits[0]["entity"]["text"] == "text 3"
+    assert hits[0]["distance"] == pytest.approx(1.0, abs=1e-5)
+    assert [hit["distance"] for hit in hits] == sorted((hit["distance"] for hit in hits), reverse=True)
+    # 检索不应修改调用方传入的向量
+    assert np.allclose(query, items[3]["vector"])
+
+
+def test_insert_same_id_replaces(store):
+    store.insert("kb", make_items([1, 2]))
+    store.insert("kb", [{"id": 1, "vector": [1.0] + [0.0] * (DIM - 1), "text": "new", "file_id": "file_1"}])
+
+    assert store.get_collection_stats("kb")["row_count"] == 2
+    assert store.get("kb", [1], output_fields=["text"]) == [{"text": "new"}]
+
+
+def test_delete_by_filter(store):
+    store.insert("kb", make_items(range(6)))
+
+    store.delete("kb", filter="file_id == 'file_0'")
+    assert store.get_collection_stats("kb")["row_count"] == 3
+
+    store.delete("kb", filter="id in [1, 3]")
+    remaining = store.query("kb", output_fields=["id"])
+    assert remaining == [{"id": 5}]
+
+    hits = store.search("kb", [make_items([0])[0]["vector"]], limit=10)[0]
+    assert [hit["id"] for hit in hits] == [5]
+
+
+def test_reopen_keeps_data(tmp_path, store):
+    items = make_items(range(20))
+    store.insert("kb", items[:10])
+    store.insert("kb", items[10:])
+    store.delete("kb", filter="id in [0, 1, 2]")
+
+    reopened = LocalVectorStore(str(tmp_path))
+    assert reopened.list_collections() == ["kb"]
+    assert reopened.get_collection_stats("kb")["row_count"] == 17
+
+    hits = reopened.search("kb", [items[15]["vector"]], limit=1, output_fields=["text"])[0]
+    assert hits[0]["id"] == 15 and hits[0]["entity"]["text"] == "text 15"
+    assert reopened.get("kb", [1]) == []
+
+
+def test_reopen_truncates_incomplete_log_tail(tmp_path, store):
+    store.insert("kb", make_items(range(3)))
+    collection = store._get("kb")
+    with open(collection.log_path, "a", encoding="utf-8") as f:
+        f.write('{"row": 3, "entity": {"id": 3')  # 模拟写入日志时崩溃
+
+    reopened = LocalVectorStore(str(tmp_path))
+    assert reopened.get_collection_stats("kb")["row_count"] == 3
+
+    reopened.insert("kb", make_items([3]))
+    assert LocalVectorStore(str(tmp_path)).get_collection_stats("kb")["row_count"] == 4
+
+
+def test_compaction_switches_generation(tmp_path, store):
+    store.insert("kb", make_items(range(2000)))
+    store.delete("kb", filter=f"id in {list(range(1500))}")
+
+    collection = store._get("kb")
+    assert collection.generation == 1
+    assert collection.size == 500
+    with open(os.path.join(collection.path, "meta.json")) as f:
+        assert json.load(f)["generation"] == 1
+    assert sorted(os.listdir(collection.path)) == ["entities.1.jsonl", "meta.json", "vectors.1.f32"]
+
+    reopened = LocalVectorStore(str(tmp_path))
+    assert reopened.get_collection_stats("kb")["row_count"] == 500
+    assert reopened.search("kb", [make_items([1700])[0]["vector"]], limit=1)[0][0]["id"] in range(1500, 2000)
+
+
+def test_parse_filter():
+    assert parse_filter("file_id == 'a'")({"file_id": "a"})
+    assert not parse_filter('file_id == "a"')({"file_id": "b"})
+    assert parse_filter("id in [1, 2]")({"id": 2})
+    with pytest.raises(ValueError):
+        parse_filter("id > 3")